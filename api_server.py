@@ -6,15 +6,35 @@ BSC 分红 API 服务器
 import json
 import time
 import random
-import requests
 import re
 import logging
+import sys
+import argparse
+import atexit
+import signal
 from pathlib import Path
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
 import threading
+from collections import deque
+from file_watch import FileWatcher
+import chain_events
+import records_store
+from block_headers import BlockHeaderCache
+import leader_lease
+import retry_queue
+import shared_state
+import snapshot
+import buyback_engine
+from round_prep import PreparedRound
+from gas_estimator import GasEstimator
+from static_assets import StaticAssets
+import tracing
+from tracing import Tracer
+import rpc_metrics
+from rpc_metrics import RpcAccounting, endpoint_label
+import rate_limit
+from rate_limit import backoff_delay
 
 # 配置日志
 logging.basicConfig(
@@ -28,10 +48,34 @@ app = Flask(__name__, static_folder='.')
 CORS(app)
 
 BASE_DIR = Path(__file__).parent
+
+tracer = Tracer()  # 每轮阶段计时，见 /api/rounds/timings
+rpc_accounting = RpcAccounting()  # RPC 调用统计，见 /api/rpc/stats
 CONFIG_FILE = BASE_DIR / 'config.json'
 STATE_FILE = BASE_DIR / 'state.json'
 HOLDERS_FILE = BASE_DIR / 'holders.json'
 RECORDS_FILE = BASE_DIR / 'records.json'
+RECORDS_DB = BASE_DIR / 'records.db'
+SCHEDULER_FILE = BASE_DIR / 'scheduler.json'  # 调度器持久状态（配置哈希、上次执行时间）
+RUNTIME_DB = BASE_DIR / 'runtime.db'  # 调度进程发布给 Web 进程的运行状态
+HOLDER_INDEX_FILE = BASE_DIR / 'holder_index.json'  # fetch_records.py 由代币转账维护的持仓候选索引
+HOLDER_INDEX_CANDIDATES = 100
+
+# 进程角色：all（调度 + Web，默认）、scheduler（只执行分红）、web（只读 API，从 runtime.db 读取调度状态）
+SERVER_ROLE = 'all'
+# 多实例部署时的主节点租约（--lease），为 None 表示单实例，本进程总是主节点
+leader = None
+HANDOVER_NONCE_WAIT_SECONDS = 120  # 接管后最多等待上一任主节点的交易上链多久
+
+def is_leader():
+    return leader is None or leader.held
+
+def reads_shared_state():
+    """本进程不执行分红（web 角色或备用节点）时，状态从 runtime.db 读取"""
+    return SERVER_ROLE == 'web' or not is_leader()
+
+class NotLeaderError(Exception):
+    """失去主节点身份后拒绝广播交易"""
 
 # 多 RPC 节点，自动故障转移
 RPC_URLS = [
@@ -47,7 +91,7 @@ RPC_URLS = [
 # 线程锁，保护全局状态
 _rpc_lock = threading.Lock()
 _lottery_lock = threading.Lock()
-_holders_lock = threading.Lock()
+_state_lock = threading.Lock()  # 本轮执行与重试队列核对互斥（都会写 state.json）
 
 current_rpc_index = 0
 
@@ -71,26 +115,87 @@ ERC20_ABI = json.loads('''[
 
 # Flap Portal ABI for swapExactInput
 FLAP_PORTAL_ABI = json.loads('''[
-    {"inputs":[{"components":[{"name":"inputToken","type":"address"},{"name":"outputToken","type":"address"},{"name":"inputAmount","type":"uint256"},{"name":"minOutputAmount","type":"uint256"},{"name":"permitData","type":"bytes"}],"name":"params","type":"tuple"}],"name":"swapExactInput","outputs":[{"name":"outputAmount","type":"uint256"}],"stateMutability":"payable","type":"function"}
+    {"inputs":[{"components":[{"name":"inputToken","type":"address"},{"name":"outputToken","type":"address"},{"name":"inputAmount","type":"uint256"},{"name":"minOutputAmount","type":"uint256"},{"name":"permitData","type":"bytes"}],"name":"params","type":"tuple"}],"name":"swapExactInput","outputs":[{"name":"outputAmount","type":"uint256"}],"stateMutability":"payable","type":"function"},
+    {"inputs":[{"components":[{"name":"inputToken","type":"address"},{"name":"outputToken","type":"address"},{"name":"inputAmount","type":"uint256"}],"name":"params","type":"tuple"}],"name":"quoteExactInput","outputs":[{"name":"outputAmount","type":"uint256"}],"stateMutability":"nonpayable","type":"function"}
 ]''')
 
 FLAP_PORTAL_ADDRESS = '0xe2cE6ab80874Fa9Fa2aAE65D277Dd6B8e65C9De0'
 
 # 初始化 Web3 连接
 def create_web3(rpc_url):
-    """创建 Web3 连接"""
-    w3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={'timeout': 30}))
+    """创建 Web3 连接（sim:// 开头的地址使用进程内模拟链，见 sim_chain.py）
+
+    web3 导入需要 1 秒以上，放到第一次建立连接时（后台线程）再导入，不拖慢 HTTP 服务启动。
+    """
+    from web3 import Web3
+    from web3.middleware import ExtraDataToPOAMiddleware
+    if rpc_url.startswith('sim://'):
+        import sim_chain
+        provider = sim_chain.get_chain().provider()
+    else:
+        provider = Web3.HTTPProvider(rpc_url, request_kwargs={'timeout': 30})
+    endpoint = endpoint_label(rpc_url)
+    # 模拟链不需要限流，给一个足够高的速率
+    limiter = rate_limit.get_limiter(endpoint, rate=1000 if rpc_url.startswith('sim://') else rate_limit.DEFAULT_RATE)
+    instrument_provider(provider, endpoint, limiter)
+    w3 = Web3(provider)
     w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
     return w3
 
+RPC_THROTTLE_RETRIES = 4  # 被节点限流时的自动重试次数
+
+def instrument_provider(provider, endpoint, limiter):
+    """包装 provider.make_request：
+    - 所有 RPC（包括 is_connected 健康检查）都计入本轮统计
+    - 请求前经过节点令牌桶限流；被限流（429 / -32005）时暂停节点并自动重试
+    - 不是主节点时拒绝 eth_sendRawTransaction
+    """
+    make_request = provider.make_request
+    def counted_request(method, params):
+        # 交易广播的最后一道关：租约已过期时不再发送，避免与新主节点重复支付
+        if method == 'eth_sendRawTransaction' and not is_leader():
+            raise NotLeaderError('本实例不是主节点，拒绝广播交易')
+        for attempt in range(RPC_THROTTLE_RETRIES + 1):
+            limiter.acquire()
+            tracer.record_rpc(method)
+            if method == 'eth_sendRawTransaction':
+                tracer.record_send()
+            rpc_accounting.record(method, endpoint)
+            if rpc_accounting.over_budget_once():
+                logger.warning(f"[rpc] 本轮 RPC 调用已超出预算 ({rpc_accounting.scope_calls} 次)")
+            try:
+                response = make_request(method, params)
+            except Exception as e:
+                if attempt < RPC_THROTTLE_RETRIES and rate_limit.is_throttle_error(e):
+                    limiter.throttled(rate_limit.retry_after_seconds(e) or backoff_delay(attempt, base=1.0))
+                    tracer.record_retry()
+                    logger.warning(f"[rpc] {endpoint} 限流 ({method})，速率降至 {limiter.rate:.1f}/秒")
+                    continue
+                raise
+            error = response.get('error') if isinstance(response, dict) else None
+            if error and attempt < RPC_THROTTLE_RETRIES and rate_limit.is_throttle_error(error):
+                limiter.throttled(backoff_delay(attempt, base=1.0))
+                tracer.record_retry()
+                logger.warning(f"[rpc] {endpoint} 限流 ({method})，速率降至 {limiter.rate:.1f}/秒")
+                continue
+            limiter.succeeded()
+            return response
+    provider.make_request = counted_request
+
 def get_web3():
     """获取可用的 Web3 连接，自动故障转移（线程安全）"""
     global current_rpc_index, w3
     
+    # 首次使用时才建立连接
+    if w3 is None:
+        with _rpc_lock:
+            if w3 is None:
+                w3 = create_web3(RPC_URLS[current_rpc_index])
+    
     # 先测试当前连接（不加锁，快速路径）
     try:
         if w3.is_connected():
-            w3.eth.block_number  # 测试实际请求
+            read_cache.observe_block(w3.eth.block_number)  # 测试实际请求，顺便记录区块高度
             return w3
     except:
         pass
@@ -100,7 +205,7 @@ def get_web3():
         # 双重检查，可能其他线程已经切换成功
         try:
             if w3.is_connected():
-                w3.eth.block_number
+                read_cache.observe_block(w3.eth.block_number)
                 return w3
         except:
             pass
@@ -111,7 +216,7 @@ def get_web3():
             try:
                 new_w3 = create_web3(rpc_url)
                 if new_w3.is_connected():
-                    new_w3.eth.block_number  # 测试实际请求
+                    read_cache.observe_block(new_w3.eth.block_number)  # 测试实际请求
                     if idx != current_rpc_index:
                         logger.info(f"[RPC] 切换到: {rpc_url}")
                         current_rpc_index = idx
@@ -123,14 +228,96 @@ def get_web3():
         logger.error("[RPC] 警告: 所有节点都不可用!")
         return w3
 
-# 初始化默认连接
-w3 = create_web3(RPC_URLS[0])
+BLOCK_TIME_SECONDS = 0.75  # BSC 出块间隔
+
+class BlockReadCache:
+    """按区块缓存链上只读结果（eth_getBalance / balanceOf / eth_call）
+
+    读取固定在当前区块高度上执行，同一区块内的重复读取直接返回内存结果。
+    观察到新区块时全部失效；本地发出交易后清除该账户的条目，并在下次读取时刷新区块高度。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._block = 0
+        self._block_seen_at = 0
+        self._entries = {}  # key -> (block, account, value)
+        self.hits = 0
+        self.misses = 0
+
+    def observe_block(self, number):
+        """记录观察到的区块高度，出现新区块时清空缓存"""
+        with self._lock:
+            self._block_seen_at = time.time()
+            if number > self._block:
+                self._block = number
+                self._entries.clear()
+
+    def current_block(self, web3):
+        """当前区块高度，一个出块间隔内复用，不额外请求"""
+        with self._lock:
+            if time.time() - self._block_seen_at < BLOCK_TIME_SECONDS:
+                return self._block
+        self.observe_block(web3.eth.block_number)
+        with self._lock:
+            return self._block
+
+    def read(self, web3, key, account, loader):
+        """读穿缓存
+
+        Args:
+            key: 缓存键（调用 + 参数）
+            account: 受影响的账户，发交易后据此失效
+            loader: loader(block_identifier) 执行实际读取
+        """
+        block = self.current_block(web3)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == block:
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        try:
+            value = loader(block)
+        except Exception:
+            # 负载均衡后的节点可能还没有该区块，退回 latest，不缓存
+            return loader('latest')
+        with self._lock:
+            if block == self._block:
+                self._entries[key] = (block, account.lower(), value)
+        return value
+
+    @property
+    def latest_block(self):
+        """已观察到的最高区块（不发请求，未观察过时为 0）"""
+        with self._lock:
+            return self._block
+
+    def invalidate(self, account):
+        """账户发出交易后清除它的缓存条目"""
+        account = account.lower()
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if v[1] != account}
+            self._block_seen_at = 0
+
+read_cache = BlockReadCache()
+
+# 交易 gas limit：按调用形态缓存 eth_estimateGas 结果（见 gas_estimator.py）
+gas_estimator = GasEstimator()
+NATIVE_GAS_TTL_SECONDS = 24 * 60 * 60  # 转账给同一合约地址的 gas 几乎不变（失败时会重新估算）
+GAS_LIMIT_SWAP = 300000      # 估算失败时的默认值
+GAS_LIMIT_TRANSFER = 100000
+GAS_LIMIT_NATIVE = 21000
+
+# 默认连接，首次调用 get_web3() 时创建
+w3 = None
 
 # 全局状态
 lottery_running = False
 last_execution_time = 0
 INTERVAL_SECONDS = 5 * 60  # 每轮间隔 5 分钟
-INIT_SECONDS = 5 * 60      # 初始化等待 5 分钟
+DEFAULT_INIT_SECONDS = 5 * 60  # 初始化等待 5 分钟（config.json 中 init_seconds 可覆盖）
+INIT_SECONDS = DEFAULT_INIT_SECONDS
 
 # 初始化状态
 init_mode = True           # 是否在初始化模式
@@ -138,73 +325,185 @@ init_start_time = 0        # 初始化开始时间
 config_hash = ''           # 配置哈希，用于检测配置变更
 
 # 实时进度状态
-current_progress = {
-    'running': False,
-    'phase': 'idle',  # idle, dividend, buyback, done
-    'step': '',
-    'current': 0,
-    'total': 0,
-    'dividend_logs': [],  # 分红日志
-    'buyback_logs': [],   # 回购日志
-    'started_at': 0,
-    'updated_at': 0
-}
-_progress_lock = threading.Lock()
-
-def update_progress(phase=None, step=None, current=None, total=None, log=None, running=None, log_type=None):
+PROGRESS_LOG_LIMIT = 20       # 每类日志保留条数
+PROGRESS_MAX_WAIT_SECONDS = 25  # 长轮询最长等待时间
+
+class ProgressBoard:
+    """实时进度（线程安全，带版本号）
+
+    每次变更版本号加一，字段记录最后变更时的版本号，日志存放在固定长度的环形缓冲区中。
+    客户端带上已知版本号即可只取增量（delta），或用 wait() 长轮询等待下一次变更。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # 版本号从启动时间（毫秒）开始，服务重启后旧客户端的版本号一定小于它，会拿到完整进度
+        self.version = int(time.time() * 1000)
+        self._fields = {
+            'running': False,
+            'phase': 'idle',  # idle, init, prepare, dividend, buyback, done
+            'step': '',
+            'current': 0,
+            'total': 0,
+            'buyback_running': False,  # 回购与分红并发执行，单独标记
+            'started_at': 0,
+            'updated_at': 0
+        }
+        self._field_versions = dict.fromkeys(self._fields, self.version)
+        self._logs = {
+            'dividend': deque(maxlen=PROGRESS_LOG_LIMIT),  # 分红日志
+            'buyback': deque(maxlen=PROGRESS_LOG_LIMIT),   # 回购日志
+        }
+        self._reset_version = self.version  # 最近一次清空日志时的版本号
+        self._dropped_version = {'dividend': 0, 'buyback': 0}  # 被挤出环形缓冲区的最新日志版本号
+        self._listeners = []
+        self._publish_lock = threading.Lock()  # 保证监听者按版本顺序收到状态
+
+    def _set(self, name, value):
+        if self._fields[name] != value:
+            self._fields[name] = value
+            self._field_versions[name] = self.version
+
+    def update(self, fields, log=None, log_type=None, clear_logs=False):
+        """更新字段、追加日志
+
+        Args:
+            log_type: 日志类型 'dividend' 或 'buyback'，不指定则根据当前 phase 判断
+            clear_logs: 先清空两类日志（新一轮开始）
+        """
+        with self._publish_lock:
+            with self._cond:
+                self._update_locked(fields, log, log_type, clear_logs)
+                state = self._export_locked() if self._listeners else None
+            for callback in self._listeners:
+                try:
+                    callback(state)
+                except Exception as e:
+                    logger.warning(f"进度监听回调失败: {e}")
+
+    def _update_locked(self, fields, log, log_type, clear_logs):
+        self.version += 1
+        if clear_logs:
+            for logs in self._logs.values():
+                logs.clear()
+            self._reset_version = self.version
+        for name, value in fields.items():
+            self._set(name, value)
+        if log is not None:
+            target_type = log_type if log_type else self._fields['phase']
+            key = 'buyback' if target_type == 'buyback' else 'dividend'
+            logs = self._logs[key]
+            if len(logs) == logs.maxlen:
+                self._dropped_version[key] = logs[0]['version']
+            logs.append({'time': int(time.time()), 'msg': log, 'version': self.version})
+        self._set('updated_at', int(time.time()))
+        self._cond.notify_all()
+
+    def snapshot(self):
+        """完整进度"""
+        with self._cond:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self):
+        data = dict(self._fields)
+        data['dividend_logs'] = list(self._logs['dividend'])
+        data['buyback_logs'] = list(self._logs['buyback'])
+        data['version'] = self.version
+        data['full'] = True
+        return data
+
+    def delta(self, since):
+        """版本 since 之后的变更；客户端版本无法增量更新时返回完整进度"""
+        with self._cond:
+            if (since > self.version or since < self._reset_version
+                    or any(since < v for v in self._dropped_version.values())):
+                return self._snapshot_locked()
+            data = {name: value for name, value in self._fields.items() if self._field_versions[name] > since}
+            for key, logs in self._logs.items():
+                new_logs = [entry for entry in logs if entry['version'] > since]
+                if new_logs:
+                    data[key + '_logs'] = new_logs
+            data['version'] = self.version
+            data['full'] = False
+            return data
+
+    def wait(self, since, timeout):
+        """阻塞直到版本号超过 since 或超时"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > since, timeout=timeout)
+
+    def subscribe(self, callback):
+        """每次变更后调用 callback(state)，state 可交给另一进程的 load_state()"""
+        self._listeners.append(callback)
+
+    def export_state(self):
+        with self._cond:
+            return self._export_locked()
+
+    def _export_locked(self):
+        return {
+            'version': self.version,
+            'fields': dict(self._fields),
+            'field_versions': dict(self._field_versions),
+            'logs': {key: list(logs) for key, logs in self._logs.items()},
+            'reset_version': self._reset_version,
+            'dropped_version': dict(self._dropped_version),
+        }
+
+    def load_state(self, state):
+        """用调度进程发布的状态替换本地进度（Web 进程使用）"""
+        with self._cond:
+            self.version = state['version']
+            self._fields = state['fields']
+            self._field_versions = state['field_versions']
+            for key, logs in self._logs.items():
+                logs.clear()
+                logs.extend(state['logs'].get(key, []))
+            self._reset_version = state['reset_version']
+            self._dropped_version = state['dropped_version']
+            self._cond.notify_all()
+
+progress = ProgressBoard()
+
+def update_progress(phase=None, step=None, current=None, total=None, log=None, running=None, log_type=None,
+                    buyback_running=None):
     """更新实时进度（线程安全）
     
     Args:
         log_type: 指定日志类型 'dividend' 或 'buyback'，如果不指定则根据 phase 判断
     """
-    with _progress_lock:
-        if running is not None:
-            current_progress['running'] = running
-        if phase is not None:
-            current_progress['phase'] = phase
-        if step is not None:
-            current_progress['step'] = step
-        if current is not None:
-            current_progress['current'] = current
-        if total is not None:
-            current_progress['total'] = total
-        if log is not None:
-            log_entry = {
-                'time': int(time.time()),
-                'msg': log
-            }
-            # 使用显式指定的类型或根据当前阶段判断（在锁内读取 phase）
-            target_type = log_type if log_type else current_progress['phase']
-            if target_type == 'buyback':
-                current_progress['buyback_logs'].append(log_entry)
-                current_progress['buyback_logs'] = current_progress['buyback_logs'][-20:]
-            else:
-                current_progress['dividend_logs'].append(log_entry)
-                current_progress['dividend_logs'] = current_progress['dividend_logs'][-20:]
-        current_progress['updated_at'] = int(time.time())
+    fields = {
+        'running': running,
+        'buyback_running': buyback_running,
+        'phase': phase,
+        'step': step,
+        'current': current,
+        'total': total,
+    }
+    progress.update({k: v for k, v in fields.items() if v is not None}, log=log, log_type=log_type)
 
 def reset_progress():
     """重置进度状态"""
-    with _progress_lock:
-        current_progress['running'] = False
-        current_progress['phase'] = 'idle'
-        current_progress['step'] = ''
-        current_progress['current'] = 0
-        current_progress['total'] = 0
-        current_progress['dividend_logs'] = []
-        current_progress['buyback_logs'] = []
-        current_progress['started_at'] = 0
-        current_progress['updated_at'] = int(time.time())
+    progress.update({
+        'running': False,
+        'buyback_running': False,
+        'phase': 'idle',
+        'step': '',
+        'current': 0,
+        'total': 0,
+        'started_at': 0
+    }, clear_logs=True)
 
 def load_config():
     if CONFIG_FILE.exists():
         with open(CONFIG_FILE) as f:
             config = json.load(f)
             # 自动转换地址为 checksum 格式
+            from eth_utils import to_checksum_address
             if 'wallet_address' in config:
-                config['wallet_address'] = Web3.to_checksum_address(config['wallet_address'])
+                config['wallet_address'] = to_checksum_address(config['wallet_address'])
             if 'contract_address' in config:
-                config['contract_address'] = Web3.to_checksum_address(config['contract_address'])
+                config['contract_address'] = to_checksum_address(config['contract_address'])
             return config
     return None
 
@@ -216,6 +515,32 @@ def get_config_hash(config):
     import hashlib
     return hashlib.md5(key_fields.encode()).hexdigest()
 
+def apply_init_seconds(config):
+    """从配置读取初始化等待时间"""
+    global INIT_SECONDS
+    INIT_SECONDS = max(0, int(config.get('init_seconds', DEFAULT_INIT_SECONDS)))
+
+def load_scheduler_state():
+    try:
+        if SCHEDULER_FILE.exists():
+            with open(SCHEDULER_FILE) as f:
+                return json.load(f)
+    except Exception as e:
+        logger.warning(f"读取调度器状态失败: {e}")
+    return {}
+
+def save_scheduler_state():
+    """记录已完成初始化的配置哈希和上次执行时间，重启时据此跳过初始化期、延续倒计时"""
+    if not is_leader():
+        return  # scheduler.json 由主节点维护
+    try:
+        snapshot.write_atomic(SCHEDULER_FILE, {
+            'config_hash': '' if init_mode else config_hash,
+            'last_execution': last_execution_time,
+        })
+    except Exception as e:
+        logger.warning(f"保存调度器状态失败: {e}")
+
 def check_config_change():
     """检查配置是否变更，如果变更则进入初始化模式"""
     global init_mode, init_start_time, config_hash
@@ -224,23 +549,108 @@ def check_config_change():
     if not config:
         return False
     
+    apply_init_seconds(config)
     new_hash = get_config_hash(config)
     if new_hash != config_hash:
         logger.info(f"检测到配置变更，进入初始化模式 ({INIT_SECONDS}秒)")
         config_hash = new_hash
         init_mode = True
         init_start_time = int(time.time())
+        save_scheduler_state()
         return True
     return False
 
-def get_init_countdown():
+def get_init_countdown(status):
     """获取初始化倒计时"""
-    if not init_mode:
+    if not status['init_mode']:
         return 0
-    elapsed = int(time.time()) - init_start_time
-    remaining = INIT_SECONDS - elapsed
+    elapsed = int(time.time()) - status['init_start_time']
+    remaining = status['init_total'] - elapsed
     return max(0, remaining)
 
+# ========== 调度进程 -> Web 进程的状态共享 ==========
+
+PROGRESS_POLL_SECONDS = 0.5  # Web 进程长轮询时检查 runtime.db 的间隔
+
+_shared_states = {}
+_shared_publishing = False
+_progress_sync_lock = threading.Lock()
+_progress_row_version = 0  # Web 进程已加载的进度行版本
+
+def get_shared_state():
+    state = _shared_states.get(RUNTIME_DB)
+    if state is None:
+        state = _shared_states[RUNTIME_DB] = shared_state.SharedState(RUNTIME_DB)
+    return state
+
+def publish_shared(key, value):
+    """调度进程把运行状态写入 runtime.db（未启用时不做任何事，失败不影响执行）"""
+    if not _shared_publishing or not is_leader():
+        return
+    try:
+        get_shared_state().put(key, value)
+    except Exception as e:
+        logger.warning(f"发布共享状态 {key} 失败: {e}")
+
+def scheduler_status():
+    """本进程的调度状态"""
+    return {
+        'init_mode': init_mode,
+        'init_start_time': init_start_time,
+        'init_total': INIT_SECONDS,
+        'interval': INTERVAL_SECONDS,
+        'running': lottery_running,
+        'last_execution': last_execution_time,
+    }
+
+def publish_status():
+    publish_shared('status', scheduler_status())
+
+def publish_round_stats():
+    """每轮结束后发布耗时和 RPC 统计（Web 进程的 /api/rounds/timings、/api/rpc/stats）"""
+    if not _shared_publishing:
+        return
+    publish_shared('timings', tracer.history())
+    stats = rpc_accounting.stats(rpc_metrics.SCOPE_HISTORY_LIMIT)
+    stats['limiters'] = rate_limit.limiter_stats()
+    stats['gas'] = gas_estimator.stats()
+    publish_shared('rpc', stats)
+
+def enable_shared_publishing():
+    """调度进程启动时调用：之后的状态、进度和每轮统计都写入 runtime.db"""
+    global _shared_publishing
+    _shared_publishing = True
+    progress.subscribe(lambda state: publish_shared('progress', state))
+    publish_shared('progress', progress.export_state())
+    publish_status()
+
+def read_scheduler_status():
+    """调度状态：web 角色从 runtime.db 读取，调度进程未启动过时视为空闲"""
+    if not reads_shared_state():
+        return scheduler_status()
+    return get_shared_state().get('status') or dict(scheduler_status(), init_mode=False)
+
+def sync_progress():
+    """web 角色：runtime.db 中的进度有更新时加载到本地 ProgressBoard"""
+    global _progress_row_version
+    if not reads_shared_state():
+        return
+    with _progress_sync_lock:
+        newer = get_shared_state().get_if_newer('progress', _progress_row_version)
+        if newer:
+            _progress_row_version, state = newer
+            progress.load_state(state)
+
+def wait_progress(since, timeout):
+    """长轮询：等待进度版本超过 since（web 角色轮询 runtime.db）"""
+    if not reads_shared_state():
+        progress.wait(since, timeout)
+        return
+    deadline = time.time() + timeout
+    while progress.version <= since and time.time() < deadline:
+        time.sleep(min(PROGRESS_POLL_SECONDS, max(0, deadline - time.time())))
+        sync_progress()
+
 def load_state():
     try:
         if STATE_FILE.exists():
@@ -251,22 +661,134 @@ def load_state():
     return {'last_block': 0, 'buyback': [], 'dividend': []}
 
 def save_state(state):
+    if not is_leader():
+        logger.warning("已失去主节点身份，不写入 state.json（本轮记录仍在 records.db 中）")
+        return
     with open(STATE_FILE, 'w') as f:
         json.dump(state, f, indent=2)
 
 def save_records(state):
+    if not is_leader():
+        return
     output = {
         'buyback': state['buyback'],
         'dividend': state['dividend'],
         'updated': int(time.time()),
         'last_block': state['last_block']
     }
-    with open(RECORDS_FILE, 'w') as f:
-        json.dump(output, f)
+    snapshot.publish(RECORDS_FILE, output)
+
+def get_record_store():
+    """完整历史记录库（首次打开时从 records.json / state.json 导入）"""
+    return records_store.open_store(RECORDS_DB, backfill_files=(RECORDS_FILE, STATE_FILE))
+
+_retry_queues = {}
+
+def get_retry_queue():
+    """失败分红重试队列（与记录库同一个数据库文件）"""
+    queue = _retry_queues.get(RECORDS_DB)
+    if queue is None:
+        queue = _retry_queues[RECORDS_DB] = retry_queue.RetryQueue(RECORDS_DB)
+    return queue
+
+_block_headers = {}
+BLOCK_TIME_BACKFILL_LIMIT = 50  # 每轮最多补多少个区块的链上时间
+
+def get_block_headers():
+    """区块头缓存（与记录库同一个数据库文件）"""
+    headers = _block_headers.get(RECORDS_DB)
+    if headers is None:
+        headers = _block_headers[RECORDS_DB] = BlockHeaderCache(RECORDS_DB)
+    return headers
+
+def fetch_block_headers(numbers):
+    """逐个区块获取区块头（不含交易详情），每个区块只请求一次"""
+    web3 = get_web3()
+    return [web3.eth.get_block(number) for number in numbers]
+
+def fill_block_times(state):
+    """给本轮及之前缺少链上时间的记录补上 block_time
+
+    每轮结束时执行一次：同一区块的多条记录只取一次区块头，已缓存的区块不再请求。
+    """
+    store = get_record_store()
+    headers = get_block_headers()
+    blocks = store.blocks_missing_time(BLOCK_TIME_BACKFILL_LIMIT)
+    if blocks:
+        store.set_block_times(headers.timestamps(blocks, fetch_block_headers))
+    for record_type in ('dividend', 'buyback'):
+        headers.enrich(state.get(record_type, []))
+
+def store_record(record_type, record):
+    """写入历史记录库，失败不影响本轮执行"""
+    try:
+        get_block_headers().enrich([record])  # 区块头已缓存时直接补上，其余在本轮结束时统一补
+        get_record_store().add(record_type, record)
+    except Exception as e:
+        logger.error(f"写入记录库失败: {e}")
 
 def get_bnb_balance(address):
     web3 = get_web3()
-    return web3.from_wei(web3.eth.get_balance(address), 'ether')
+    balance = read_cache.read(
+        web3, ('eth_getBalance', address.lower()), address,
+        lambda block: web3.eth.get_balance(address, block)
+    )
+    return web3.from_wei(balance, 'ether')
+
+class BalanceFeed:
+    """看板展示的钱包余额：每个出块间隔最多读取一次节点，与访问人数无关
+
+    并发请求只有一个去读取，其余等待后复用同一结果。每次读取只有一个 eth_getBalance：
+    直接使用已建立的连接（不做 get_web3 的连接检查和区块高度请求），失败时才走故障转移。
+    多进程部署时由主节点的 balance_publisher 读取并写入 runtime.db，Web 进程只读（见 read_balance）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = None
+        self._checked_at = 0
+        self.refreshes = 0
+
+    def _fetch(self, address):
+        web3 = w3 or get_web3()
+        try:
+            wei = web3.eth.get_balance(address, 'latest')
+        except Exception:
+            web3 = get_web3()  # 当前节点不可用，切换后重试一次
+            wei = web3.eth.get_balance(address, 'latest')
+        return {
+            'address': address.lower(),
+            'balance': float(web3.from_wei(wei, 'ether')),
+            'block': read_cache.latest_block or None,  # 最近观察到的区块（不额外请求）
+            'updated_at': int(time.time()),
+        }
+
+    def get(self, address):
+        with self._lock:
+            if self._value is None or self._value['address'] != address.lower() \
+                    or time.time() - self._checked_at >= BLOCK_TIME_SECONDS:
+                try:
+                    self._value = self._fetch(address)
+                    self.refreshes += 1
+                except Exception as e:
+                    if self._value is None:
+                        raise
+                    logger.warning(f"[余额] 读取失败，返回上次结果: {e}")
+                self._checked_at = time.time()
+            return dict(self._value)
+
+balance_feed = BalanceFeed()
+
+def get_token_balance(web3, contract_address, account):
+    """读取代币余额（最小单位，按区块缓存）"""
+    contract_checksum = web3.to_checksum_address(contract_address)
+    data = '0x70a08231' + account[2:].lower().zfill(64)
+    
+    def load(block):
+        result = web3.eth.call({'to': contract_checksum, 'data': data}, block)
+        return int.from_bytes(result, 'big')
+    
+    return read_cache.read(web3, ('balanceOf', contract_address.lower(), account.lower()), account, load)
 
 def get_dynamic_gas_price(web3, attempt=0):
     """获取动态 gas price，带重试递增
@@ -290,15 +812,107 @@ def get_dynamic_gas_price(web3, attempt=0):
         # 如果获取失败，使用默认值
         return web3.to_wei(3 + attempt * 2, 'gwei')
 
-def get_top_holders(contract_address):
-    """获取代币前50持仓者地址（优化版：并发查询 + 超时控制）"""
-    from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
-    
-    web3 = get_web3()
-    BALANCE_OF = '0x70a08231'
-    all_addresses = set()
-    contract_checksum = web3.to_checksum_address(contract_address)
-    
+class NonceAllocator:
+    """单轮内的 nonce 分配器（线程安全）
+
+    分红和回购并发发送时从这里领取 nonce，避免互相冲突。
+    领取后没有真正广播出去的 nonce 要 release() 归还：更高的 nonce 已经发出时，
+    空洞会卡住它们，提供 config 时立即用 0 BNB 自转账补上；
+    补不上的留给后续领取复用，本轮结束时由 fill_gaps() 再补一次。
+    """
+
+    def __init__(self, start_nonce, config=None):
+        self._next = start_nonce
+        self._released = []
+        self._lock = threading.Lock()
+        self._config = config
+
+    def next(self):
+        """领取一个 nonce（优先复用归还的最小 nonce）"""
+        with self._lock:
+            if self._released:
+                self._released.sort()
+                return self._released.pop(0)
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce):
+        """归还未广播的 nonce"""
+        with self._lock:
+            if nonce in self._released or nonce >= self._next:
+                return
+            self._released.append(nonce)
+            # 归还的是末尾的 nonce 时直接回退，不会形成空洞
+            while self._next - 1 in self._released:
+                self._released.remove(self._next - 1)
+                self._next -= 1
+            if self._config is None or nonce not in self._released:
+                return
+            self._released.remove(nonce)
+        # 更高的 nonce 已发出，等到本轮结束再补会让它们全部等待超时
+        if not cancel_nonce(self._config, nonce):
+            with self._lock:
+                self._released.append(nonce)
+
+    def resync(self, wallet):
+        """链上 pending nonce 已超前（nonce too low）时跳过已被占用的部分"""
+        try:
+            chain_nonce = get_web3().eth.get_transaction_count(wallet, 'pending')
+        except Exception as e:
+            logger.warning(f"  同步 nonce 失败: {e}")
+            return
+        with self._lock:
+            self._released = [n for n in self._released if n >= chain_nonce]
+            self._next = max(self._next, chain_nonce)
+
+    def fill_gaps(self, config):
+        """用 0 BNB 自转账补上剩余的 nonce 空洞"""
+        with self._lock:
+            gaps, self._released = sorted(self._released), []
+        for nonce in gaps:
+            cancel_nonce(config, nonce)
+
+def native_gas_limit(web3, tx):
+    """BNB 转账的 gas limit
+
+    转给普通地址固定 GAS_LIMIT_NATIVE，不估算（每个新持仓者都估算一次会给分红多一次 RPC）；
+    只有曾经 out of gas 的收款地址（合约钱包，observe 记录了下限）才按地址估算。
+    """
+    shape = ('native', tx['to'].lower())
+    floor = gas_estimator.floor(shape)
+    if not floor:
+        return GAS_LIMIT_NATIVE
+    return gas_estimator.limit(web3, shape, tx, floor, ttl=NATIVE_GAS_TTL_SECONDS)
+
+def cancel_nonce(config, nonce):
+    """发送 0 BNB 自转账占用指定 nonce，返回是否已广播"""
+    try:
+        web3 = get_web3()
+        wallet = web3.to_checksum_address(config['wallet_address'])
+        tx = {
+            'from': wallet,
+            'to': wallet,
+            'value': 0,
+            'gas': 21000,
+            'gasPrice': get_dynamic_gas_price(web3, 2),
+            'nonce': nonce,
+            'chainId': 56
+        }
+        signed_tx = web3.eth.account.sign_transaction(tx, config['private_key'])
+        web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+        read_cache.invalidate(wallet)
+        logger.info(f"  已填补 nonce 空洞: {nonce}")
+        return True
+    except Exception as e:
+        logger.warning(f"  填补 nonce {nonce} 失败: {e}")
+        return is_nonce_consumed_error(e)  # 已被其他交易占用，同样不再是空洞
+
+def fetch_holder_candidates(contract_address):
+    """候选持仓地址（小写）：BSCScan 持仓页 + fetch_records.py 维护的转账索引（有的话）"""
+    import requests  # 只有这里用到，延迟导入以加快启动
+    all_addresses = set(chain_events.load_holder_candidates(
+        HOLDER_INDEX_FILE, HOLDER_INDEX_CANDIDATES, ignore=[contract_address] + LP_POOL_ADDRESSES))
     # 获取多页数据以确保拿到前50名
     for page in range(1, 4):
         try:
@@ -311,6 +925,16 @@ def get_top_holders(contract_address):
                     all_addresses.add(addr.lower())
         except Exception as e:
             logger.warning(f"BSCScan获取失败: {e}")
+    return all_addresses
+
+def get_top_holders(contract_address):
+    """获取代币前50持仓者地址（优化版：并发查询 + 超时控制）"""
+    from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+    import contextvars
+    
+    web3 = get_web3()
+    contract_checksum = web3.to_checksum_address(contract_address)
+    all_addresses = fetch_holder_candidates(contract_address)
     
     try:
         state = load_state()
@@ -338,10 +962,7 @@ def get_top_holders(contract_address):
         """查询单个地址余额（带超时）"""
         try:
             w3 = get_web3()
-            padded_addr = addr[2:].zfill(64)
-            data = BALANCE_OF + padded_addr
-            result = w3.eth.call({'to': contract_checksum, 'data': data})
-            balance = int(result.hex(), 16)
+            balance = get_token_balance(w3, contract_checksum, addr)
             if balance >= 1000 * 10**18:
                 return (w3.to_checksum_address(addr), balance)
         except:
@@ -352,7 +973,9 @@ def get_top_holders(contract_address):
     holders = []
     try:
         with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(check_balance, addr): addr for addr in addresses_to_check}
+            # 带上当前上下文，工作线程里的调用才会计入 rpc_accounting.tally()
+            futures = {executor.submit(contextvars.copy_context().run, check_balance, addr): addr
+                       for addr in addresses_to_check}
             try:
                 for future in as_completed(futures, timeout=60):  # 总超时60秒
                     try:
@@ -380,15 +1003,236 @@ def save_holders(holders, contract_address):
         'updated': int(time.time()),
         'contract': contract_address
     }
-    with open(HOLDERS_FILE, 'w') as f:
-        json.dump(output, f, indent=2)
+    snapshot.publish(HOLDERS_FILE, output, indent=2)
     return output
 
-def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
+HOLDERS_REFRESH_SECONDS = 2 * 60  # 后台刷新间隔
+HOLDERS_STALE_SECONDS = 10 * 60   # 超过此年龄视为过期
+HOLDERS_HISTORY_LIMIT = 50        # 保留最近多少个版本的增量，更早的客户端直接返回全量
+DIVIDEND_TOP_N = 30               # 分红资格：持仓前 30 名
+
+def diff_holders(old_holders, new_holders):
+    """比较两个持仓列表：返回 (排名或余额变化的条目, 移出列表的地址)"""
+    old = {h['address'].lower(): (rank, h['balance']) for rank, h in enumerate(old_holders, 1)}
+    changed = []
+    for rank, h in enumerate(new_holders, 1):
+        if old.get(h['address'].lower()) != (rank, h['balance']):
+            changed.append({'address': h['address'], 'rank': rank, 'balance': h['balance']})
+    current = {h['address'].lower() for h in new_holders}
+    removed = [h['address'] for h in old_holders if h['address'].lower() not in current]
+    return changed, removed
+
+class HoldersCache:
+    """内存中的持仓快照（stale-while-revalidate）
+
+    get() 总是立即返回最新快照；快照过期时只唤醒后台刷新线程，不阻塞调用方。
+    由一个常驻线程定时调用 get_top_holders 刷新，并同步写入 holders.json。
+    每次发布的版本号取自 holders.json 的 manifest，刷新时顺便计算与上一版本的增量，
+    客户端用 delta(since) 只取变化的条目。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._snapshot = None
+        self._version = 0
+        self._history = deque(maxlen=HOLDERS_HISTORY_LIMIT)  # (version, changed, removed)
+        self._last_round = None  # 上一轮的分红资格名单
+        self._thread = None
+        self._refresh_lock = threading.Lock()  # 同一时间只允许一次完整刷新
+        self._last_refresh_calls = 0  # 上次刷新消耗的 RPC 次数，用于预算判断
+
+    def _ensure_loaded(self):
+        """首次使用时从 holders.json 恢复快照"""
+        with self._lock:
+            if self._snapshot is not None:
+                return
+            self._snapshot = {'holders': [], 'updated': 0}
+        try:
+            data = snapshot.read(HOLDERS_FILE)
+            if data is not None:
+                version = snapshot.read_manifest(HOLDERS_FILE).get('version', 0)
+                with self._lock:
+                    self._snapshot = data
+                    self._version = version
+        except Exception as e:
+            logger.warning(f"读取持仓缓存文件失败: {e}")
+
+    def _sync_from_file(self):
+        """web 角色：holders.json 由调度进程发布，按 manifest 版本跟进"""
+        version = snapshot.read_manifest(HOLDERS_FILE).get('version', 0)
+        with self._lock:
+            if version <= self._version:
+                return
+        data = snapshot.read(HOLDERS_FILE)
+        if data is not None:
+            self.on_published(HOLDERS_FILE, version, data)
+
+    def snapshot(self):
+        """当前快照（holders.json 格式，附带 version），过期时触发后台刷新"""
+        self._ensure_loaded()
+        if reads_shared_state():
+            self._sync_from_file()
+        with self._lock:
+            data = self._snapshot
+            version = self._version
+        if int(time.time()) - data.get('updated', 0) >= HOLDERS_STALE_SECONDS:
+            self.request_refresh()
+        return dict(data, version=version)
+
+    def delta(self, since):
+        """since 版本之后的变化；since 太旧（超出保留的增量）时返回全量（full=True）
+
+        同时返回当前前 30 名分红资格名单，以及相对上一轮名单的变化。
+        """
+        data = self.snapshot()
+        with self._lock:
+            history = list(self._history)
+            last_round = self._last_round
+        if reads_shared_state():
+            last_round = get_shared_state().get('holders_last_round')
+        version = data['version']
+        eligible = [h['address'] for h in data.get('holders', [])[:DIVIDEND_TOP_N]]
+        result = {'version': version, 'updated': data.get('updated', 0), 'eligible': eligible}
+        if last_round:
+            previous = {a.lower() for a in last_round['eligible']}
+            current = {a.lower() for a in eligible}
+            result['last_round'] = last_round
+            result['eligibility_changes'] = {
+                'added': [a for a in eligible if a.lower() not in previous],
+                'removed': [a for a in last_round['eligible'] if a.lower() not in current],
+            }
+
+        if since >= version:
+            return dict(result, full=False, changed=[], removed=[])
+        if not history or history[0][0] > since + 1:
+            return dict(result, full=True, holders=data.get('holders', []))
+        changed, removed = {}, {}
+        for entry_version, entry_changed, entry_removed in history:
+            if entry_version <= since:
+                continue
+            for item in entry_changed:
+                changed[item['address'].lower()] = item
+                removed.pop(item['address'].lower(), None)
+            for address in entry_removed:
+                changed.pop(address.lower(), None)
+                removed[address.lower()] = address
+        return dict(result, full=False, changed=list(changed.values()), removed=list(removed.values()))
+
+    def mark_round(self, addresses):
+        """记录本轮的分红资格名单，之后的 delta() 以此对比"""
+        with self._lock:
+            self._last_round = {'version': self._version, 'at': int(time.time()), 'eligible': list(addresses)}
+        publish_shared('holders_last_round', self._last_round)
+
+    def get(self, contract_address):
+        """返回 [(address, balance), ...]，快照不属于当前合约时返回空列表"""
+        data = self.snapshot()
+        contract = data.get('contract', '')
+        if contract and contract.lower() != contract_address.lower():
+            self.request_refresh()
+            return []
+        return [(h['address'], h['balance']) for h in data.get('holders', [])]
+
+    def age(self):
+        with self._lock:
+            updated = (self._snapshot or {}).get('updated', 0)
+        return int(time.time()) - updated
+
+    def request_refresh(self):
+        """唤醒后台刷新线程（未启动时不做任何事）"""
+        self._wake.set()
+
+    @property
+    def refreshing(self):
+        return self._refresh_lock.locked()
+
+    def refresh(self, wait=True):
+        """同步刷新一次快照。wait=False 时若已有刷新在进行则直接返回 False"""
+        if not self._refresh_lock.acquire(blocking=wait):
+            return False
+        try:
+            self._refresh()
+        finally:
+            self._refresh_lock.release()
+        return True
+
+    def _refresh(self):
+        config = load_config()
+        if not config:
+            return
+        # 设置了每轮 RPC 预算且余量不够时，继续使用旧快照（没有快照时仍然刷新）
+        with self._lock:
+            has_snapshot = bool((self._snapshot or {}).get('holders'))
+        if has_snapshot and not rpc_accounting.within_budget(self._last_refresh_calls):
+            logger.warning(f"[rpc] 预算不足，跳过持仓刷新（预计 {self._last_refresh_calls} 次调用）")
+            rpc_accounting.mark_degraded('holders_refresh')
+            return
+        with rpc_accounting.tally() as tally:  # 只计本次刷新自身的调用，不含并发的轮次请求
+            try:
+                logger.info("更新持仓缓存...")
+                holders = get_top_holders(config['contract_address'])
+                if holders:
+                    save_holders(holders, config['contract_address'])  # 发布后经 on_published 更新快照
+                    logger.info(f"  已更新 {len(holders)} 个持仓者")
+            except Exception as e:
+                logger.error(f"更新持仓失败: {e}")
+        self._last_refresh_calls = tally.calls
+
+    def on_published(self, path, version, data):
+        """snapshot 发布通知：holders.json 更新后同步内存快照"""
+        if Path(path) == Path(HOLDERS_FILE):
+            with self._lock:
+                # 增量在刷新时计算一次，之后的 delta 请求只做合并
+                if self._snapshot is not None:
+                    changed, removed = diff_holders(self._snapshot.get('holders', []), data.get('holders', []))
+                    self._history.append((version, changed, removed))
+                self._snapshot = data
+                self._version = version
+
+    def start(self):
+        """启动常驻刷新线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            if is_leader():
+                self.refresh()
+            else:
+                self._sync_from_file()  # 备用节点跟随主节点发布的 holders.json
+            self._wake.wait(timeout=HOLDERS_REFRESH_SECONDS)
+            self._wake.clear()
+
+holders_cache = HoldersCache()
+snapshot.subscribe(holders_cache.on_published)
+
+# 对外提供的静态文件（白名单）。快照文件每次请求都带 ETag 验证，304 时不重复传输
+assets = StaticAssets()
+assets.register('index.html', lambda: BASE_DIR / 'index.html')
+assets.register('records.json', lambda: RECORDS_FILE)
+assets.register('holders.json', lambda: HOLDERS_FILE)
+
+def warm_published_asset(path, version, data):
+    """快照发布后立即生成压缩版本，不让第一个访问者承担压缩耗时"""
+    name = assets.name_for_path(path)
+    if name:
+        assets.warm(name)
+
+snapshot.subscribe(warm_published_asset)
+
+def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3, nonces=None, on_broadcast=None,
+                  presigned=None):
     """发送 BNB 分红，失败自动重试（改进版：更好的 nonce 处理和动态 gas）
     
     Args:
         nonce: 如果提供则使用指定的 nonce，否则从链上获取
+        nonces: 本轮的 NonceAllocator，提供时新 nonce 都从分配器领取，未广播的 nonce 会归还
+        on_broadcast: 每次广播前调用 on_broadcast(tx_hash, nonce)，用于重试队列的幂等检查
+        presigned: 轮前签好的交易（见 prepare_round），第一次尝试直接广播；重试时按常规流程重新签名
     Returns:
         成功返回 (result_dict, next_nonce)，失败返回 (None, next_nonce)
         注意：失败时也返回正确的 next_nonce，避免 nonce 卡住
@@ -400,16 +1244,24 @@ def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
     last_error = None
     sent_tx_hash = None  # 记录已发送的交易哈希
     used_nonce = None    # 记录实际使用的 nonce
+    gas_price_gwei = 0   # 重试日志用，获取 gas price 之前出错时为 0
+    
+    def fresh_nonce():
+        """获取新 nonce：有分配器时从分配器领取，否则从链上获取"""
+        if nonces is not None:
+            return nonces.next()
+        return web3.eth.get_transaction_count(wallet, 'pending')
     
     # 如果没有提供 nonce，从链上获取
     if nonce is None:
-        nonce = web3.eth.get_transaction_count(wallet, 'pending')
+        nonce = fresh_nonce()
     
     for attempt in range(max_retries):
         try:
             # 每次重试前等待更长时间
             if attempt > 0:
-                time.sleep(5 + attempt * 2)
+                tracer.record_retry()
+                time.sleep(backoff_delay(attempt))
                 web3 = get_web3()
                 
                 # 如果之前已发送交易，先检查是否已确认
@@ -434,7 +1286,7 @@ def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
                             else:
                                 # 交易失败（revert），nonce 已消耗，获取新 nonce
                                 logger.warning(f"  之前的交易 revert，获取新 nonce")
-                                nonce = web3.eth.get_transaction_count(wallet, 'pending')
+                                nonce = fresh_nonce()
                                 sent_tx_hash = None
                                 used_nonce = None
                     except Exception:
@@ -442,32 +1294,43 @@ def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
                         logger.info(f"  交易未确认，尝试提高 gas price 替换")
                         pass
             
-            # 动态获取 gas price
-            gas_price = get_dynamic_gas_price(web3, attempt)
-            gas_price_gwei = web3.from_wei(gas_price, 'gwei')
-            
-            tx = {
-                'from': wallet,
-                'to': web3.to_checksum_address(to_address),
-                'value': amount_wei,
-                'gas': 21000,
-                'gasPrice': gas_price,
-                'nonce': nonce,
-                'chainId': 56
-            }
+            gas_shape = ('native', to_address.lower())
+            if presigned is not None and attempt == 0 and presigned['nonce'] == nonce:
+                gas_price, gas_limit = presigned['gas_price'], presigned['gas']
+                gas_price_gwei = web3.from_wei(gas_price, 'gwei')
+                raw_tx, signed_hash = presigned['raw'], presigned['hash']
+            else:
+                # 动态获取 gas price
+                gas_price = get_dynamic_gas_price(web3, attempt)
+                gas_price_gwei = web3.from_wei(gas_price, 'gwei')
+                tx = {
+                    'from': wallet,
+                    'to': web3.to_checksum_address(to_address),
+                    'value': amount_wei,
+                    'gasPrice': gas_price,
+                    'nonce': nonce,
+                    'chainId': 56
+                }
+                tx['gas'] = gas_limit = native_gas_limit(web3, tx)
+                signed_tx = web3.eth.account.sign_transaction(tx, private_key)
+                raw_tx, signed_hash = signed_tx.raw_transaction, '0x' + bytes(signed_tx.hash).hex()
             
-            signed_tx = web3.eth.account.sign_transaction(tx, private_key)
-            tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            if on_broadcast:
+                # 广播前记录，即使发送超时（可能已广播）也能追踪
+                on_broadcast(signed_hash, nonce)
+            tx_hash = web3.eth.send_raw_transaction(raw_tx)
+            read_cache.invalidate(wallet)
             sent_tx_hash = tx_hash  # 记录已发送的交易
             used_nonce = nonce      # 记录使用的 nonce
             
             receipt = web3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
             
             if receipt['status'] != 1:
+                gas_estimator.observe(gas_shape, receipt, gas_limit)
                 last_error = "交易状态失败"
                 sent_tx_hash = None
                 # 交易失败但已上链，nonce 已消耗
-                nonce = web3.eth.get_transaction_count(wallet, 'pending')
+                nonce = fresh_nonce()
                 used_nonce = None
                 continue
             
@@ -493,7 +1356,9 @@ def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
                 # 交易可能已发送，获取最新 nonce
                 logger.warning(f"  Nonce 冲突，重新获取: {e}")
                 web3 = get_web3()
-                nonce = web3.eth.get_transaction_count(wallet, 'pending')
+                if nonces is not None:
+                    nonces.resync(wallet)
+                nonce = fresh_nonce()
                 sent_tx_hash = None
                 used_nonce = None
             elif 'replacement transaction underpriced' in error_str:
@@ -526,6 +1391,12 @@ def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
     
     logger.error(f"分红失败: 重试{max_retries}次后仍失败, 最后错误: {last_error}, 目标地址: {to_address}")
     
+    if nonces is not None:
+        # 当前 nonce 没有广播出去，归还给分配器
+        if used_nonce is None:
+            nonces.release(nonce)
+        return (None, nonce)
+    
     # 失败时也要返回正确的 nonce，避免后续交易卡住
     # 重新获取最新 nonce 确保准确
     try:
@@ -535,6 +1406,97 @@ def send_dividend(config, amount_bnb, to_address, nonce=None, max_retries=3):
     except:
         return (None, nonce)
 
+RETRY_CHECK_SECONDS = 60      # 重试队列后台核对间隔
+RETRY_IN_FLIGHT_SECONDS = 60  # 之前的交易可能仍在交易池中时，推迟多久再核对
+
+def check_sent_transactions(web3, sent, confirmed_nonce):
+    """幂等检查：之前广播过的交易是否有一笔已成功上链
+
+    Returns:
+        ('paid', receipt, tx_hash) 已支付
+        ('in_flight', None, None)  有交易既无回执、nonce 也未被占用，可能仍会上链
+        ('clear', None, None)      之前的交易都已失败或不可能再上链，可以重发
+    """
+    from web3.exceptions import TransactionNotFound
+    in_flight = False
+    for tx_hash, nonce in sent:
+        try:
+            receipt = web3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            receipt = None
+        except Exception:
+            return ('in_flight', None, None)  # 查询失败时不能断定未上链
+        if receipt is not None:
+            if receipt['status'] == 1:
+                return ('paid', receipt, tx_hash)
+            continue
+        if nonce >= confirmed_nonce:
+            in_flight = True
+    return ('in_flight', None, None) if in_flight else ('clear', None, None)
+
+def record_retried_dividend(state, item, tx_hash, block):
+    """重试队列中的分红已支付：写入分红记录"""
+    address = item['address']
+    record = {
+        'address': address[:6] + '...' + address[-4:],
+        'full_address': address,
+        'amount': item['amount'],
+        'tx_hash': tx_hash,
+        'block': block,
+        'timestamp': int(time.time()),
+        'retried': True,
+    }
+    state['dividend'].insert(0, record)
+    store_record('dividend', record)
+    return record
+
+def reconcile_dividend_retries(config, state):
+    """核对重试队列：之前的交易已上链的标记为已支付，可能仍在交易池中的推迟
+
+    调用方需持有 _state_lock。返回已支付的条目数。
+    """
+    queue = get_retry_queue()
+    items = queue.pending()
+    if not items:
+        return 0
+    web3 = get_web3()
+    confirmed_nonce = web3.eth.get_transaction_count(config['wallet_address'], 'latest')
+    paid = 0
+    for item in items:
+        if not item['sent']:
+            continue
+        outcome, receipt, tx_hash = check_sent_transactions(web3, item['sent'], confirmed_nonce)
+        if outcome == 'paid':
+            queue.mark_paid(item['id'], tx_hash)
+            record_retried_dividend(state, item, tx_hash, receipt['blockNumber'])
+            logger.info(f"[重试队列] #{item['id']} 之前的交易已上链，标记为已支付: {tx_hash}")
+            paid += 1
+        elif outcome == 'in_flight':
+            queue.defer(item['id'], RETRY_IN_FLIGHT_SECONDS, '之前的交易可能仍在交易池中')
+    return paid
+
+def retry_worker():
+    """后台核对重试队列（不发送交易，重发与下一轮分红一起进行）"""
+    while True:
+        time.sleep(RETRY_CHECK_SECONDS)
+        if not is_leader():
+            continue
+        if not _state_lock.acquire(blocking=False):
+            continue  # 本轮执行中，由本轮自己核对
+        try:
+            config = load_config()
+            if config and get_retry_queue().pending():
+                state = load_state()
+                if reconcile_dividend_retries(config, state):
+                    save_state(state)
+                    save_records(state)
+        except Exception as e:
+            logger.warning(f"[重试队列] 核对失败: {e}")
+        finally:
+            _state_lock.release()
+
+RECOVERY_MIN_TOKENS = 1000 * 10**18  # 残留代币达到此数量才补销毁，更少的视为灰尘
+
 def check_and_burn_pending_tokens(config, max_retries=3):
     """检查并销毁钱包中残留的代币（上次回购失败遗留的）
     
@@ -549,9 +1511,9 @@ def check_and_burn_pending_tokens(config, max_retries=3):
     token_contract = web3.eth.contract(address=contract_address, abi=ERC20_ABI)
     
     try:
-        balance = token_contract.functions.balanceOf(wallet).call()
+        balance = get_token_balance(web3, contract_address, wallet)
         # 只有超过 1000 枚才处理（避免处理灰尘）
-        if balance < 1000 * 10**18:
+        if balance < RECOVERY_MIN_TOKENS:
             return None
         
         logger.info(f"  发现残留代币: {balance / 1e18:,.2f} 枚，执行补销毁...")
@@ -560,7 +1522,8 @@ def check_and_burn_pending_tokens(config, max_retries=3):
         for attempt in range(max_retries):
             try:
                 if attempt > 0:
-                    time.sleep(5 + attempt * 2)
+                    tracer.record_retry()
+                    time.sleep(backoff_delay(attempt))
                 
                 nonce = web3.eth.get_transaction_count(wallet, 'pending')
                 gas_price = get_dynamic_gas_price(web3, attempt)
@@ -569,15 +1532,19 @@ def check_and_burn_pending_tokens(config, max_retries=3):
                     DEAD_ADDRESS, balance
                 ).build_transaction({
                     'from': wallet,
-                    'gas': 100000,
+                    'gas': GAS_LIMIT_TRANSFER,
                     'gasPrice': gas_price,
                     'nonce': nonce
                 })
+                gas_shape = ('transfer', contract_address.lower())
+                burn_tx['gas'] = gas_estimator.limit(web3, gas_shape, burn_tx, GAS_LIMIT_TRANSFER)
                 
                 signed_burn = web3.eth.account.sign_transaction(burn_tx, private_key)
                 burn_hash = web3.eth.send_raw_transaction(signed_burn.raw_transaction)
+                read_cache.invalidate(wallet)
                 
                 receipt = web3.eth.wait_for_transaction_receipt(burn_hash, timeout=120)
+                gas_estimator.observe(gas_shape, receipt, burn_tx['gas'])
                 if receipt['status'] == 1:
                     tx_hash_str = burn_hash.hex()
                     if not tx_hash_str.startswith('0x'):
@@ -605,29 +1572,49 @@ def check_and_burn_pending_tokens(config, max_retries=3):
     
     return None
 
-def buyback_and_burn(config, amount_bnb, max_retries=3):
-    """通过 Flap Portal swapExactInput 回购代币并销毁，支持重试（改进版：动态 gas）"""
+def take_nonce(web3, wallet, nonces=None):
+    """领取 nonce：有分配器时从分配器领取，否则从链上获取 pending nonce"""
+    if nonces is not None:
+        return nonces.next()
+    return web3.eth.get_transaction_count(wallet, 'pending')
+
+def is_nonce_consumed_error(error):
+    """发送失败是否因为 nonce 已被占用"""
+    error_str = str(error).lower()
+    return 'nonce too low' in error_str or 'already known' in error_str
+
+def swap_for_tokens(config, amount_bnb, max_retries=3, nonce=None, nonces=None, min_output=0, amount_wei=None):
+    """通过 Flap Portal swapExactInput 购买代币，支持重试（动态 gas）
+
+    Args:
+        nonce: 预留给本次购买的 nonce，不提供则自动领取
+        nonces: 本轮的 NonceAllocator，未广播的 nonce 会归还
+        min_output: 最少获得的代币数量（最小单位），成交不足时交易 revert，不再重试
+        amount_wei: 直接指定购买金额（wei），提供时忽略 amount_bnb
+    Returns:
+        购买到的代币数量（最小单位），失败返回 0
+    """
     web3 = get_web3()
     wallet = web3.to_checksum_address(config['wallet_address'])
     private_key = config['private_key']
     contract_address = web3.to_checksum_address(config['contract_address'])
     
-    token_contract = web3.eth.contract(address=contract_address, abi=ERC20_ABI)
     portal_contract = web3.eth.contract(address=web3.to_checksum_address(FLAP_PORTAL_ADDRESS), abi=FLAP_PORTAL_ABI)
-    amount_wei = web3.to_wei(amount_bnb, 'ether')
+    if amount_wei is None:
+        amount_wei = web3.to_wei(amount_bnb, 'ether')
     
-    # ========== 第一步：购买代币（带重试）==========
     tokens_bought = 0
     buy_receipt = None
     
     for attempt in range(max_retries):
         try:
             if attempt > 0:
-                time.sleep(5 + attempt * 2)
+                tracer.record_retry()
+                time.sleep(backoff_delay(attempt))
                 web3 = get_web3()
                 logger.info(f"  购买重试 {attempt+1}/{max_retries}...")
             
-            balance_before = token_contract.functions.balanceOf(wallet).call()
+            balance_before = get_token_balance(web3, contract_address, wallet)
             logger.info(f"  购买前余额: {balance_before / 1e18:,.2f} 枚")
             
             ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
@@ -635,29 +1622,37 @@ def buyback_and_burn(config, amount_bnb, max_retries=3):
                 ZERO_ADDRESS,      # inputToken: BNB
                 contract_address,  # outputToken: 代币
                 amount_wei,        # inputAmount
-                0,                 # minOutputAmount: 0 表示接受任意数量
+                min_output,        # minOutputAmount: 按报价计算，0 表示接受任意数量
                 b''                # permitData: 空
             )
             
-            nonce = web3.eth.get_transaction_count(wallet, 'pending')
+            if nonce is None:
+                nonce = take_nonce(web3, wallet, nonces)
             gas_price = get_dynamic_gas_price(web3, attempt)
             gas_price_gwei = web3.from_wei(gas_price, 'gwei')
             
             buy_tx = portal_contract.functions.swapExactInput(swap_params).build_transaction({
                 'from': wallet,
                 'value': amount_wei,
-                'gas': 300000,
+                'gas': GAS_LIMIT_SWAP,
                 'gasPrice': gas_price,
                 'nonce': nonce
             })
+            gas_shape = ('swapExactInput', FLAP_PORTAL_ADDRESS.lower())
+            buy_tx['gas'] = gas_estimator.limit(web3, gas_shape, buy_tx, GAS_LIMIT_SWAP)
             
             signed_buy = web3.eth.account.sign_transaction(buy_tx, private_key)
             buy_hash = web3.eth.send_raw_transaction(signed_buy.raw_transaction)
+            read_cache.invalidate(wallet)
             logger.info(f"  购买交易: {buy_hash.hex()} (nonce={nonce}, gas={gas_price_gwei:.1f}gwei)")
+            nonce = None  # 已广播，nonce 已消耗
             
             buy_receipt = web3.eth.wait_for_transaction_receipt(buy_hash, timeout=120)
+            gas_estimator.observe(gas_shape, buy_receipt, buy_tx['gas'])
             if buy_receipt['status'] != 1:
                 logger.warning(f"  购买交易失败! status={buy_receipt['status']}")
+                if min_output:
+                    break  # 多半是价格变化超出滑点，用旧报价重试没有意义，交给调用方重新报价
                 continue
             
             # 从交易日志中解析获得的代币数量
@@ -676,58 +1671,332 @@ def buyback_and_burn(config, amount_bnb, max_retries=3):
                 logger.warning("  未获得代币，重试中...")
                 
         except Exception as e:
+            if nonce is not None and is_nonce_consumed_error(e):
+                if nonces is not None:
+                    nonces.resync(wallet)
+                nonce = None
             logger.warning(f"  购买异常 {attempt+1}/{max_retries}: {e}")
     
-    if tokens_bought <= 0:
-        logger.error("  购买失败: 重试后仍未获得代币")
-        return None
+    if nonce is not None and nonces is not None:
+        nonces.release(nonce)
+    return tokens_bought
+
+BUYBACK_BLOCK_WAIT_SECONDS = 3  # 分批回购等待下一个区块的最长时间（约 4 个区块）
+BUYBACK_MIN_BNB = buyback_engine.MIN_CHUNK_WEI / 1e18  # 最小回购金额
+
+def quote_buyback(web3, contract_address, amount_wei, wallet):
+    """回购报价：优先 Flap Portal quoteExactInput，失败时用 PancakeSwap getAmountsOut（按区块缓存）"""
+    def load(block):
+        portal = web3.eth.contract(address=web3.to_checksum_address(FLAP_PORTAL_ADDRESS), abi=FLAP_PORTAL_ABI)
+        try:
+            return portal.functions.quoteExactInput(
+                ('0x0000000000000000000000000000000000000000', contract_address, amount_wei)
+            ).call(block_identifier=block)
+        except Exception:
+            router = web3.eth.contract(address=web3.to_checksum_address(PANCAKE_ROUTER), abi=ROUTER_ABI)
+            amounts = router.functions.getAmountsOut(
+                amount_wei, [web3.to_checksum_address(WBNB_ADDRESS), contract_address]
+            ).call(block_identifier=block)
+            return amounts[-1]
+    # 以钱包为失效账户：本地发出购买交易后报价随之失效
+    return read_cache.read(web3, ('quote', contract_address.lower(), amount_wei), wallet, load)
+
+def wait_next_block(web3, timeout=BUYBACK_BLOCK_WAIT_SECONDS):
+    """等到链上出现新区块（分批回购之间给价格恢复的时间）"""
+    start = web3.eth.block_number
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(BLOCK_TIME_SECONDS / 2)
+        number = web3.eth.block_number
+        if number > start:
+            read_cache.observe_block(number)
+            return number
+    return start
+
+def run_buyback(config, amount_bnb, nonce=None, nonces=None):
+    """按报价分批回购
+
+    配置（config.json，可选）: buyback_max_impact（单笔价格冲击上限，默认 0.02）、
+    buyback_slippage（minOut 相对报价的容忍度，默认 0.01）、buyback_max_chunks（每轮最多笔数，默认 4）。
+    报价不可用时退回单笔、不限最少数量的旧方式。
+
+    每笔先按报价规划金额，规划出金额后才领取 nonce（swap_for_tokens 签名前领取）；
+    冲击超限或金额太小时一笔都不发，不占用 nonce。
+
+    Args:
+        nonce: 轮前准备预留的 nonce（第一笔使用）；没有发出任何一笔时立即归还，由分配器补上空洞
+    Returns:
+        {'tokens', 'spent_bnb', 'remaining_bnb', 'chunks'}
+    """
+    reserved = [nonce]
+
+    def swap(chunk_wei, out_min):
+        chunk_nonce, reserved[0] = reserved[0], None
+        return swap_for_tokens(config, None, nonce=chunk_nonce, nonces=nonces, min_output=out_min, amount_wei=chunk_wei)
+
+    try:
+        web3 = get_web3()
+        wallet = web3.to_checksum_address(config['wallet_address'])
+        contract_address = web3.to_checksum_address(config['contract_address'])
+        amount_wei = web3.to_wei(amount_bnb, 'ether')
+        try:
+            quote_buyback(web3, contract_address, buyback_engine.PROBE_WEI, wallet)
+        except Exception as e:
+            logger.warning(f"  回购报价不可用，按单笔市价购买: {e}")
+            tokens = swap(amount_wei, 0)
+            return {'tokens': tokens, 'spent_bnb': amount_bnb if tokens else 0,
+                    'remaining_bnb': 0 if tokens else amount_bnb, 'chunks': []}
+
+        engine = buyback_engine.BuybackEngine(
+            quote=lambda amount: quote_buyback(web3, contract_address, amount, wallet),
+            swap=swap,
+            wait_next_block=lambda: wait_next_block(web3),
+            max_impact=float(config.get('buyback_max_impact', buyback_engine.DEFAULT_MAX_IMPACT)),
+            slippage=float(config.get('buyback_slippage', buyback_engine.DEFAULT_SLIPPAGE)),
+            max_chunks=int(config.get('buyback_max_chunks', buyback_engine.DEFAULT_MAX_CHUNKS)),
+        )
+        result = engine.run(amount_wei)
+    finally:
+        # 预留的 nonce 没有用上（第一笔的规划就为空，或中途异常）：立即归还，不等本轮结束
+        if reserved[0] is not None and nonces is not None:
+            nonces.release(reserved[0])
+    return {
+        'tokens': result['tokens'],
+        'spent_bnb': result['spent_wei'] / 1e18,
+        'remaining_bnb': result['remaining_wei'] / 1e18,
+        'chunks': result['chunks'],
+    }
+
+MIN_GAS_RESERVE = 0.002
+
+def estimate_gas_reserve(config):
+    """本轮需要预留的 gas 费用（BNB）：按缓存的 gas limit 和当前 gas price 估算
+
+    分红 DIVIDEND_TOP_N 笔 + 回购最多 buyback_max_chunks 笔 + 销毁两笔（残留代币和本轮代币），
+    另加几笔转账作为重试余量。
+    """
+    web3 = get_web3()
+    contract = config['contract_address'].lower()
+    max_chunks = int(config.get('buyback_max_chunks', buyback_engine.DEFAULT_MAX_CHUNKS))
+    gas = ((DIVIDEND_TOP_N + 5) * gas_estimator.largest('native', GAS_LIMIT_NATIVE)
+           + max_chunks * gas_estimator.cached(('swapExactInput', FLAP_PORTAL_ADDRESS.lower()), GAS_LIMIT_SWAP)
+           + 2 * gas_estimator.cached(('transfer', contract), GAS_LIMIT_TRANSFER))
+    return max(MIN_GAS_RESERVE, gas * get_dynamic_gas_price(web3, 1) / 1e18)
+
+def burn_tokens(config, amount, max_retries=3, nonces=None):
+    """把钱包中的代币转入黑洞地址销毁，支持重试
+
+    Args:
+        amount: 销毁数量（最小单位）
+        nonces: 本轮的 NonceAllocator，未广播的 nonce 会归还
+    Returns:
+        成功返回 (tx_hash_str, receipt)，失败返回 None
+    """
+    web3 = get_web3()
+    wallet = web3.to_checksum_address(config['wallet_address'])
+    private_key = config['private_key']
+    contract_address = web3.to_checksum_address(config['contract_address'])
+    token_contract = web3.eth.contract(address=contract_address, abi=ERC20_ABI)
+    nonce = None  # 已领取但尚未广播的 nonce
     
-    # ========== 第二步：销毁代币（带重试）==========
     for attempt in range(max_retries):
         try:
             if attempt > 0:
-                time.sleep(5 + attempt * 2)
+                tracer.record_retry()
+                time.sleep(backoff_delay(attempt))
                 web3 = get_web3()
                 logger.info(f"  销毁重试 {attempt+1}/{max_retries}...")
             
-            nonce = web3.eth.get_transaction_count(wallet, 'pending')
+            if nonce is None:
+                nonce = take_nonce(web3, wallet, nonces)
             gas_price = get_dynamic_gas_price(web3, attempt)
             gas_price_gwei = web3.from_wei(gas_price, 'gwei')
             
             burn_tx = token_contract.functions.transfer(
-                DEAD_ADDRESS, tokens_bought
+                DEAD_ADDRESS, amount
             ).build_transaction({
                 'from': wallet,
-                'gas': 100000,
+                'gas': GAS_LIMIT_TRANSFER,
                 'gasPrice': gas_price,
                 'nonce': nonce
             })
+            gas_shape = ('transfer', contract_address.lower())
+            burn_tx['gas'] = gas_estimator.limit(web3, gas_shape, burn_tx, GAS_LIMIT_TRANSFER)
             
             signed_burn = web3.eth.account.sign_transaction(burn_tx, private_key)
             burn_hash = web3.eth.send_raw_transaction(signed_burn.raw_transaction)
+            read_cache.invalidate(wallet)
             logger.info(f"  销毁交易: {burn_hash.hex()} (nonce={nonce}, gas={gas_price_gwei:.1f}gwei)")
+            nonce = None  # 已广播，nonce 已消耗
             
             receipt = web3.eth.wait_for_transaction_receipt(burn_hash, timeout=120)
+            gas_estimator.observe(gas_shape, receipt, burn_tx['gas'])
             if receipt['status'] != 1:
                 logger.warning(f"  销毁交易失败! status={receipt['status']}")
                 continue
             tx_hash_str = burn_hash.hex()
             if not tx_hash_str.startswith('0x'):
                 tx_hash_str = '0x' + tx_hash_str
-            
-            return {
-                'amount': tokens_bought / 1e18,
-                'tx_hash': tx_hash_str,
-                'block': receipt['blockNumber'],
-                'bnb_spent': amount_bnb,
-                'timestamp': int(time.time())
-            }
+            return (tx_hash_str, receipt)
         except Exception as e:
+            if nonce is not None and is_nonce_consumed_error(e):
+                if nonces is not None:
+                    nonces.resync(wallet)
+                nonce = None
             logger.warning(f"  销毁异常 {attempt+1}/{max_retries}: {e}")
     
-    logger.error("  销毁失败: 重试后仍失败，代币可能留在钱包中（下次启动时会自动补销毁）")
+    if nonce is not None and nonces is not None:
+        nonces.release(nonce)
     return None
 
+def make_buyback_record(tokens_bought, burned, amount_bnb):
+    """生成回购销毁记录
+
+    Args:
+        burned: burn_tokens 的返回值 (tx_hash_str, receipt)
+    """
+    tx_hash_str, receipt = burned
+    return {
+        'amount': tokens_bought / 1e18,
+        'tx_hash': tx_hash_str,
+        'block': receipt['blockNumber'],
+        'bnb_spent': amount_bnb,
+        'timestamp': int(time.time())
+    }
+
+def buyback_and_burn(config, amount_bnb, max_retries=3):
+    """通过 Flap Portal swapExactInput 回购代币并销毁，支持重试（改进版：动态 gas）"""
+    # ========== 第一步：按报价分批购买 ==========
+    bought = run_buyback(config, amount_bnb)
+    tokens_bought = bought['tokens']
+    if tokens_bought <= 0:
+        logger.error("  购买失败: 重试后仍未获得代币")
+        return None
+    
+    # ========== 第二步：销毁代币（带重试）==========
+    burned = burn_tokens(config, tokens_bought, max_retries)
+    if not burned:
+        logger.error("  销毁失败: 重试后仍失败，代币可能留在钱包中（下次启动时会自动补销毁）")
+        return None
+    
+    return make_buyback_record(tokens_bought, burned, bought['spent_bnb'])
+
+MIN_BALANCE_FOR_DIVIDEND = 0.5  # 余额必须大于 0.5 BNB 才开启分红
+MIN_DIVIDEND_BNB = 0.0001       # 最小分红金额，低于此不发送（节省gas）
+PREPARE_LEAD_SECONDS = 30       # 倒计时最后 30 秒执行轮前准备，0 表示关闭
+
+_prepared_round = None  # prepare_round 的结果，execute_lottery 取出后清空
+_prepare_lock = threading.Lock()
+
+def split_budget(available, carry):
+    """50% 回购销毁，50% 分红；上一轮因价格冲击没买完的回购金额仍在钱包里，本轮继续用于回购
+
+    Returns:
+        (buyback_amount, dividend_amount)
+    """
+    carry = min(carry, available)
+    return (available - carry) / 2 + carry, (available - carry) / 2
+
+def prepare_round():
+    """轮前准备：倒计时最后 PREPARE_LEAD_SECONDS 秒内由调度器在后台线程执行
+
+    提前完成本轮开始时的慢读取（持仓快照、余额、nonce、gas price）并签好分红交易，
+    execute_lottery 校验仍然有效后直接广播（见 round_prep.py）。
+    钱包有需要补销毁的残留代币（RECOVERY_MIN_TOKENS 以上，更少的灰尘不影响）或重试队列有未完成的分红时不准备：
+    它们需要先处理，本轮走常规流程。
+    """
+    global _prepared_round
+    config = load_config()
+    if not config or not is_leader():
+        return None
+    web3 = get_web3()
+    wallet = web3.to_checksum_address(config['wallet_address'])
+    if holders_cache.age() >= HOLDERS_STALE_SECONDS:
+        # 后台线程正在刷新时不再重复扫描，本轮沿用现有快照
+        holders_cache.refresh(wait=False)  # 在倒计时内同步刷新，不占用本轮时间
+    holders = holders_cache.get(config['contract_address'])[:DIVIDEND_TOP_N]
+    if not holders:
+        return None
+    if get_token_balance(web3, config['contract_address'], wallet) >= RECOVERY_MIN_TOKENS or get_retry_queue().pending():
+        logger.info("[准备] 有残留代币或未完成的失败分红，本轮按常规流程执行")
+        return None
+    
+    balance = float(get_bnb_balance(wallet))
+    gas_reserve = estimate_gas_reserve(config)
+    available = balance - gas_reserve
+    if available <= 0 or balance < MIN_BALANCE_FOR_DIVIDEND:
+        return None
+    buyback_amount, dividend_amount = split_budget(available, load_state().get('buyback_carry', 0))
+    per_person = dividend_amount / len(holders)
+    if per_person < MIN_DIVIDEND_BNB:
+        return None
+    
+    # nonce 布局与 execute_lottery 相同：回购购买在前，分红依次在后
+    start_nonce = web3.eth.get_transaction_count(wallet, 'pending')
+    swap_nonce = start_nonce if buyback_amount >= BUYBACK_MIN_BNB else None
+    nonce = start_nonce + (swap_nonce is not None)
+    gas_price = get_dynamic_gas_price(web3, 0)
+    amount_wei = web3.to_wei(per_person, 'ether')
+    transactions = []
+    for address, _ in holders:
+        tx = {
+            'from': wallet,
+            'to': web3.to_checksum_address(address),
+            'value': amount_wei,
+            'gasPrice': gas_price,
+            'nonce': nonce,
+            'chainId': 56
+        }
+        tx['gas'] = native_gas_limit(web3, tx)
+        signed_tx = web3.eth.account.sign_transaction(tx, config['private_key'])
+        transactions.append({
+            'address': address,
+            'nonce': nonce,
+            'raw': bytes(signed_tx.raw_transaction),
+            'hash': '0x' + bytes(signed_tx.hash).hex(),
+            'gas': tx['gas'],
+            'gas_price': gas_price,
+        })
+        nonce += 1
+    
+    prepared = PreparedRound(get_config_hash(config), balance, gas_reserve, holders, buyback_amount,
+                             dividend_amount, per_person, start_nonce, swap_nonce, transactions)
+    with _prepare_lock:
+        _prepared_round = prepared
+    logger.info(f"[准备] 已签好 {len(transactions)} 笔分红 (每人 {per_person:.6f} BNB, nonce {start_nonce}-{nonce - 1})")
+    return prepared
+
+def prepare_round_in_background():
+    try:
+        prepare_round()
+    except Exception as e:
+        logger.warning(f"[准备] 轮前准备失败，本轮按常规流程执行: {e}")
+
+def take_prepared_round(config):
+    """取出轮前准备结果并校验，没有或已失效时返回 None"""
+    global _prepared_round
+    with _prepare_lock:
+        prepared, _prepared_round = _prepared_round, None
+    if prepared is None:
+        return None
+    try:
+        balance = float(get_bnb_balance(config['wallet_address']))
+        holders = holders_cache.get(config['contract_address'])[:DIVIDEND_TOP_N]
+        reason = prepared.invalid_reason(get_config_hash(config), balance, holders)
+        if reason is None and get_retry_queue().pending():
+            reason = '重试队列有新的失败分红'
+    except Exception as e:
+        reason = f'校验失败: {e}'
+    if reason:
+        logger.info(f"[准备] 准备结果失效（{reason}），本轮按常规流程执行")
+        return None
+    return prepared
+
+def discard_prepared_round():
+    global _prepared_round
+    with _prepare_lock:
+        _prepared_round = None
+
 def execute_lottery():
     """执行一轮回购分红（线程安全）"""
     global lottery_running, last_execution_time
@@ -736,37 +2005,64 @@ def execute_lottery():
     with _lottery_lock:
         if lottery_running:
             return None
+        if not is_leader():
+            logger.warning("本实例不是主节点，跳过本轮")
+            return None
         lottery_running = True
+    publish_status()
     
     logger.info("=" * 50)
     logger.info("开始执行回购分红")
     logger.info("=" * 50)
     
+    swap_thread = None  # 回购购买线程，与分红并发
+    trace = tracer.begin_round()
+    
     # 初始化进度
-    update_progress(running=True, phase='init', step='初始化...', current=0, total=100, log='开始执行新一轮')
-    current_progress['started_at'] = int(time.time())
-    current_progress['dividend_logs'] = []
-    current_progress['buyback_logs'] = []
+    progress.update({
+        'running': True,
+        'phase': 'init',
+        'step': '初始化...',
+        'current': 0,
+        'total': 100,
+        'started_at': int(time.time())
+    }, log='开始执行新一轮', clear_logs=True)
     
+    _state_lock.acquire()
     try:
         config = load_config()
+        # 从本轮开始到下一轮开始为一个统计窗口（轮间的持仓刷新、健康检查也计入）
+        rpc_accounting.begin_scope(f'round-{trace.round_id}', budget=(config or {}).get('rpc_budget_per_round'))
         if not config:
             logger.error("错误: 配置文件不存在")
             update_progress(log='错误: 配置文件不存在')
             return None
         
-        # ========== 检查并处理残留代币 ==========
-        update_progress(step='检查残留代币...')
-        recovery_result = check_and_burn_pending_tokens(config)
-        if recovery_result:
-            state = load_state()
-            state['buyback'].insert(0, recovery_result)
-            state['buyback'] = state['buyback'][:50]
-            save_state(state)
-            save_records(state)
+        with tracer.span('prepared_check'):
+            prepared = take_prepared_round(config)
+        if prepared:
+            logger.info(f"使用轮前准备结果: {len(prepared.transactions)} 笔分红已签名，直接广播")
+            update_progress(log=f'使用轮前准备结果 ({len(prepared.transactions)} 笔分红已签名)')
         
-        balance = float(get_bnb_balance(config['wallet_address']))
-        gas_reserve = 0.002  # 只预留 gas 费用
+        # ========== 检查并处理残留代币（轮前准备时已确认没有） ==========
+        if prepared is None:
+            update_progress(step='检查残留代币...')
+            with tracer.span('recovery_burn'):
+                recovery_result = check_and_burn_pending_tokens(config)
+            if recovery_result:
+                state = load_state()
+                state['buyback'].insert(0, recovery_result)
+                state['buyback'] = state['buyback'][:50]
+                store_record('buyback', recovery_result)
+                save_state(state)
+                save_records(state)
+        
+        if prepared:
+            balance, gas_reserve = prepared.balance, prepared.gas_reserve
+        else:
+            with tracer.span('balance_check'):
+                balance = float(get_bnb_balance(config['wallet_address']))
+                gas_reserve = estimate_gas_reserve(config)  # 只预留本轮的 gas 费用
         available = balance - gas_reserve
         
         logger.info(f"当前余额: {balance:.6f} BNB, 可用: {available:.6f} BNB")
@@ -775,68 +2071,114 @@ def execute_lottery():
         if available <= 0:
             logger.warning("余额不足以支付 gas，跳过本轮")
             update_progress(log='余额不足，跳过本轮')
+            tracer.end_round('skipped')
             return None
         
-        # 余额必须大于 0.5 BNB 才开启分红
-        MIN_BALANCE_FOR_DIVIDEND = 0.5
         if balance < MIN_BALANCE_FOR_DIVIDEND:
             logger.info(f"余额 {balance:.4f} BNB < {MIN_BALANCE_FOR_DIVIDEND} BNB，等待积累更多资金")
             update_progress(log=f'余额 {balance:.4f} BNB 不足 {MIN_BALANCE_FOR_DIVIDEND} BNB，跳过本轮')
+            tracer.end_round('skipped')
             return None
         
-        # 50% 回购销毁，50% 分红
-        buyback_amount = available / 2
-        dividend_amount = available / 2
-        
         state = load_state()
         # 初始化失败记录列表（如果不存在）
         if 'failed_dividends' not in state:
             state['failed_dividends'] = []
         
+        # ========== 重试队列：先核对，到期的失败分红随本轮一起发送 ==========
+        queue = get_retry_queue()
+        retries, owed = [], 0
+        try:
+            with tracer.span('retry_reconcile'):
+                reconcile_dividend_retries(config, state)
+            for item in queue.due():
+                if owed + item['amount'] > available / 2:
+                    break  # 最多占用一半可用余额，其余留到下一轮
+                retries.append(item)
+                owed += item['amount']
+        except Exception as e:
+            # 没有核对成功就不能重发，避免重复支付
+            logger.warning(f"  重试队列核对失败，本轮不重发: {e}")
+            retries, owed = [], 0
+        if retries:
+            available -= owed
+            logger.info(f"  重试队列: 本轮补发 {len(retries)} 笔，共 {owed:.6f} BNB")
+            update_progress(log=f'补发失败分红: {len(retries)} 笔，共 {owed:.6f} BNB', log_type='dividend')
+        
+        carry = min(state.get('buyback_carry', 0), available)
+        if prepared:
+            buyback_amount, dividend_amount = prepared.buyback_amount, prepared.dividend_amount
+        else:
+            buyback_amount, dividend_amount = split_budget(available, carry)
+        if carry > 0:
+            logger.info(f"  上一轮未完成的回购: {carry:.6f} BNB")
+        
         result = {'timestamp': int(time.time())}
         
         # 获取持仓者
         update_progress(phase='prepare', step='获取持仓者列表...', current=5, log='正在获取持仓者列表...')
         
-        holders = None
-        cache_max_age = 10 * 60  # 10分钟
-        if HOLDERS_FILE.exists():
-            try:
-                with open(HOLDERS_FILE) as f:
-                    data = json.load(f)
-                    cache_time = data.get('updated', 0)
-                    cache_age = int(time.time()) - cache_time
-                    
-                    if cache_age < cache_max_age:
-                        holders = [(h['address'], h['balance']) for h in data.get('holders', [])[:30]]
-                        logger.info(f"  使用缓存持仓数据 ({len(holders)} 人, 缓存年龄: {cache_age}秒)")
-                        update_progress(log=f'使用缓存数据 ({len(holders)} 人)')
-                    else:
-                        logger.warning(f"  缓存已过期 ({cache_age}秒 > {cache_max_age}秒)，重新获取")
-                        update_progress(log='缓存已过期，重新获取')
-            except Exception as e:
-                logger.warning(f"  读取缓存失败: {e}")
+        # 持仓快照直接取内存中的最新版本，过期时只触发后台刷新，不阻塞本轮
+        if prepared:
+            holders = prepared.holders
+        else:
+            with tracer.span('holders'):
+                holders = holders_cache.get(config['contract_address'])
+        if holders:
+            logger.info(f"  使用持仓快照 ({len(holders)} 人, 快照年龄: {holders_cache.age()}秒)")
+            update_progress(log=f'使用持仓快照 ({len(holders)} 人)')
+        else:
+            logger.error("  持仓快照尚未就绪（后台刷新中），跳过本轮")
+            update_progress(log='错误: 持仓快照尚未就绪，跳过本轮')
+            tracer.end_round('skipped')
+            return None
         
-        if not holders:
-            holders = get_top_holders(config['contract_address'])
-            if holders:
-                save_holders(holders, config['contract_address'])
-                update_progress(log=f'获取到 {len(holders)} 个持仓者')
+        # ========== 分红与回购购买并发执行 ==========
+        # nonce 只从链上取一次，之后由分配器统一发放：分红和回购购买各自在签名前领取，
+        # 两边并发发送互不冲突（回购报价超出冲击上限时不领取，不会留下空洞）
+        # 使用轮前准备结果时，签好的 nonce 已预留，分配器从它们之后开始
+        if prepared:
+            nonces = NonceAllocator(prepared.next_nonce, config)
+        else:
+            with tracer.span('nonce_init'):
+                web3 = get_web3()
+                nonces = NonceAllocator(web3.eth.get_transaction_count(config['wallet_address'], 'pending'), config)
         
-        if not holders:
-            logger.error("  无法获取持仓者")
-            update_progress(log='错误: 无法获取持仓者')
-            return None
+        swap_outcome = {'tokens': 0, 'spent_bnb': 0, 'remaining_bnb': buyback_amount, 'chunks': []}
+        if buyback_amount >= BUYBACK_MIN_BNB:
+            swap_nonce = prepared.swap_nonce if prepared else None
+            logger.info(f"  执行回购购买: {buyback_amount:.6f} BNB")
+            update_progress(buyback_running=True, log=f'开始回购: {buyback_amount:.6f} BNB', log_type='buyback')
+            
+            def run_swap():
+                try:
+                    with tracer.span('swap', amount_bnb=buyback_amount) as span:
+                        swap_outcome.update(run_buyback(config, buyback_amount, nonce=swap_nonce, nonces=nonces))
+                        if span:
+                            span.attrs['chunks'] = len(swap_outcome['chunks'])
+                except Exception as e:
+                    logger.error(f"  回购购买异常: {e}")
+                if swap_outcome['tokens'] > 0:
+                    update_progress(log=f'✓ 购买成功: {swap_outcome["tokens"] / 1e18:,.0f} 枚 '
+                                        f'({len(swap_outcome["chunks"])} 笔, {swap_outcome["spent_bnb"]:.6f} BNB)',
+                                    log_type='buyback')
+                else:
+                    update_progress(log='✗ 购买失败', log_type='buyback')
+            
+            swap_thread = threading.Thread(target=run_swap, daemon=True)
+            swap_thread.start()
+        elif prepared and prepared.swap_nonce is not None:
+            nonces.release(prepared.swap_nonce)  # 准备时预留给回购的 nonce 不再使用，立即补上
         
         # ========== 第一步：分红 ==========
-        min_dividend = 0.0001  # 最小分红金额，低于此不发送（节省gas）
         dividend_results = []
         failed_dividends = []
         total_sent = 0
         
         # 前30名均分
-        top30 = holders[:30]
-        if top30 and dividend_amount >= min_dividend:
+        top30 = holders[:DIVIDEND_TOP_N]
+        holders_cache.mark_round([addr for addr, _ in top30])
+        if top30 and dividend_amount >= MIN_DIVIDEND_BNB:
             per_person = dividend_amount / len(top30)
             logger.info(f"  [前30名均分] 总额: {dividend_amount:.6f} BNB, 每人: {per_person:.6f} BNB")
             update_progress(
@@ -844,16 +2186,12 @@ def execute_lottery():
                 step='开始分红...', 
                 current=0, 
                 total=len(top30),
-                log=f'开始分红: {len(top30)} 人均分 {dividend_amount:.6f} BNB, 每人 {per_person:.6f} BNB'
+                log=f'开始分红: {len(top30)} 人均分 {dividend_amount:.6f} BNB, 每人 {per_person:.6f} BNB',
+                log_type='dividend'
             )
             
-            # 获取初始 nonce，后续手动递增避免 nonce too low 错误
-            web3 = get_web3()
-            current_nonce = web3.eth.get_transaction_count(config['wallet_address'], 'pending')
-            logger.info(f"  初始 nonce: {current_nonce}")
-            
             for i, (holder_addr, holder_balance) in enumerate(top30):
-                if per_person < min_dividend:
+                if per_person < MIN_DIVIDEND_BNB:
                     continue
                 
                 # 更新进度
@@ -861,16 +2199,27 @@ def execute_lottery():
                 update_progress(
                     step=f'发送分红 {i+1}/{len(top30)}',
                     current=i+1,
-                    log=f'[{i+1}/{len(top30)}] 发送给 {short_addr}...'
+                    log=f'[{i+1}/{len(top30)}] 发送给 {short_addr}...',
+                    log_type='dividend'
                 )
                 
-                div_result, current_nonce = send_dividend(config, per_person, holder_addr, nonce=current_nonce)
+                sent = []  # 本笔广播过的交易，失败时随重试队列保存，用于幂等检查
+                presigned = prepared.transactions[i] if prepared else None
+                with tracer.span('dividend', index=i+1, address=holder_addr) as span:
+                    div_result, _ = send_dividend(
+                        config, per_person, holder_addr, nonces=nonces,
+                        nonce=presigned['nonce'] if presigned else None, presigned=presigned,
+                        on_broadcast=lambda tx_hash, nonce: sent.append([tx_hash, nonce])
+                    )
+                    if span:
+                        span.attrs['ok'] = div_result is not None
                 if div_result:
                     dividend_results.append(div_result)
                     state['dividend'].insert(0, div_result)
+                    store_record('dividend', div_result)
                     total_sent += per_person
                     logger.info(f"  [{i+1}/{len(top30)}] 发送成功: {holder_addr[:10]}... -> {per_person:.6f} BNB")
-                    update_progress(log=f'✓ {short_addr} 成功 +{per_person:.6f} BNB')
+                    update_progress(log=f'✓ {short_addr} 成功 +{per_person:.6f} BNB', log_type='dividend')
                     # 每次成功后立即保存状态，防止中断丢失进度
                     save_state(state)
                 else:
@@ -880,14 +2229,41 @@ def execute_lottery():
                         'full_address': holder_addr,
                         'amount': per_person,
                         'timestamp': int(time.time()),
-                        'holder_balance': holder_balance
+                        'holder_balance': holder_balance,
+                        'retry_id': queue.enqueue(holder_addr, per_person, sent, '分红发送失败'),
                     }
                     failed_dividends.append(failed_record)
                     state['failed_dividends'].insert(0, failed_record)
                     logger.warning(f"  [{i+1}/{len(top30)}] 发送失败: {holder_addr[:10]}...")
-                    update_progress(log=f'✗ {short_addr} 失败')
+                    update_progress(log=f'✗ {short_addr} 失败', log_type='dividend')
                     save_state(state)  # 保存失败记录
         
+        # 补发重试队列中到期的失败分红（与本轮分红共用 nonce 分配器）
+        for item in retries:
+            retry_addr = item['address']
+            short_addr = retry_addr[:6] + '...' + retry_addr[-4:]
+            update_progress(log=f'[补发 #{item["id"]}] 发送给 {short_addr}...', log_type='dividend')
+            with tracer.span('dividend_retry', retry_id=item['id'], address=retry_addr):
+                div_result, _ = send_dividend(
+                    config, item['amount'], retry_addr, nonces=nonces,
+                    on_broadcast=lambda tx_hash, nonce, item_id=item['id']: queue.add_sent(item_id, [[tx_hash, nonce]])
+                )
+            if div_result:
+                div_result['retried'] = True
+                queue.mark_paid(item['id'], div_result['tx_hash'])
+                dividend_results.append(div_result)
+                state['dividend'].insert(0, div_result)
+                store_record('dividend', div_result)
+                total_sent += item['amount']
+                logger.info(f"  [补发 #{item['id']}] 成功: {retry_addr[:10]}... -> {item['amount']:.6f} BNB")
+                update_progress(log=f'✓ 补发 {short_addr} 成功 +{item["amount"]:.6f} BNB', log_type='dividend')
+            else:
+                status = queue.record_failure(item['id'], '补发失败')
+                logger.warning(f"  [补发 #{item['id']}] 失败: {retry_addr[:10]}...{'，超过重试次数已放弃' if status == 'abandoned' else ''}")
+                update_progress(log=f'✗ 补发 {short_addr} 失败', log_type='dividend')
+            save_state(state)
+        result['retry_count'] = len(retries)
+        
         # 限制分红记录数量
         state['dividend'] = state['dividend'][:100]
         state['failed_dividends'] = state['failed_dividends'][:50]
@@ -900,30 +2276,45 @@ def execute_lottery():
         if len(failed_dividends) > 0:
             dividend_summary += f'，失败 {len(failed_dividends)} 笔'
         logger.info(f"  {dividend_summary}")
-        update_progress(step='分红完成', current=len(top30), log=dividend_summary)
+        update_progress(step='分红完成', current=len(top30), log=dividend_summary, log_type='dividend')
         
-        # ========== 第二步：回购销毁 ==========
+        # ========== 第二步：等待购买完成后销毁 ==========
         buyback_result = None
-        if buyback_amount >= 0.001:  # 最小回购金额
-            update_progress(
-                phase='buyback',
-                step='执行回购销毁...',
-                current=0,
-                total=2,
-                log=f'开始回购销毁: {buyback_amount:.6f} BNB'
-            )
-            logger.info(f"  执行回购销毁: {buyback_amount:.6f} BNB")
+        if swap_thread:
+            update_progress(phase='buyback', step='执行回购销毁...', current=0, total=2)
+            with tracer.span('swap_wait'):
+                swap_thread.join()
+            tokens_bought = swap_outcome['tokens']
+            # 价格冲击超限或报价失效时没买完的部分留到下一轮（太小的零头回到正常分配）
+            remaining_bnb = swap_outcome['remaining_bnb']
+            state['buyback_carry'] = remaining_bnb if remaining_bnb >= BUYBACK_MIN_BNB else 0
+            if state['buyback_carry']:
+                update_progress(log=f'未完成的回购 {remaining_bnb:.6f} BNB 留到下一轮', log_type='buyback')
+            if tokens_bought > 0:
+                update_progress(current=1)
+                with tracer.span('burn'):
+                    burned = burn_tokens(config, tokens_bought, nonces=nonces)
+                if burned:
+                    buyback_result = make_buyback_record(tokens_bought, burned, swap_outcome['spent_bnb'])
+                else:
+                    logger.error("  销毁失败: 重试后仍失败，代币可能留在钱包中（下次启动时会自动补销毁）")
+            else:
+                logger.error("  购买失败: 重试后仍未获得代币")
             
-            buyback_result = buyback_and_burn(config, buyback_amount)
             if buyback_result:
                 state['buyback'].insert(0, buyback_result)
                 state['buyback'] = state['buyback'][:50]
-                update_progress(current=2, log=f'✓ 回购销毁成功: {buyback_result["amount"]:,.0f} 枚代币')
+                store_record('buyback', buyback_result)
+                update_progress(current=2, log=f'✓ 回购销毁成功: {buyback_result["amount"]:,.0f} 枚代币', log_type='buyback')
                 logger.info(f"  回购销毁成功: {buyback_result['amount']:,.0f} 枚")
             else:
-                update_progress(log='✗ 回购销毁失败')
+                update_progress(log='✗ 回购销毁失败', log_type='buyback')
                 logger.warning("  回购销毁失败")
+            update_progress(buyback_running=False)
         
+        # 本轮领取后未使用的 nonce 必须补上，否则之后的交易都会卡住
+        with tracer.span('nonce_fill'):
+            nonces.fill_gaps(config)
         result['buyback'] = buyback_result
         
         # ========== 完成 ==========
@@ -932,14 +2323,23 @@ def execute_lottery():
             final_summary += f', 销毁: {buyback_result["amount"]:,.0f} 枚'
         update_progress(phase='done', step='执行完成', log=final_summary)
         
+        with tracer.span('block_times'):
+            try:
+                fill_block_times(state)
+            except Exception as e:
+                logger.warning(f"补充区块时间失败: {e}")
+        
         # 保存状态
-        state['last_block'] = get_web3().eth.block_number
-        save_state(state)
-        save_records(state)
+        with tracer.span('save_state'):
+            state['last_block'] = read_cache.current_block(get_web3())
+            save_state(state)
+            save_records(state)
         
         last_execution_time = int(time.time())
+        save_scheduler_state()
         logger.info("本轮执行完成!")
         update_progress(log='等待下一轮...')
+        tracer.end_round('ok')
         return result
         
     except Exception as e:
@@ -949,186 +2349,488 @@ def execute_lottery():
         traceback.print_exc()
         return None
     finally:
+        # 分红阶段异常退出时也要等回购购买结束，避免下一轮与它并发
+        if swap_thread and swap_thread.is_alive():
+            swap_thread.join()
+        tracer.end_round('error')  # 正常结束或跳过时已记录结果，这里不会覆盖
+        _state_lock.release()
         lottery_running = False
-        update_progress(running=False)
+        update_progress(running=False, buyback_running=False)
+        publish_status()
+        publish_round_stats()
 
-def get_countdown():
+def get_countdown(status):
     """获取距离下次执行的倒计时（秒）- 基于上次完成时间"""
-    global last_execution_time
+    last_execution = status['last_execution']
     
     # 如果从未执行过，返回0表示立即执行
-    if last_execution_time == 0:
+    if last_execution == 0:
         return 0
     
     # 计算下次执行时间
-    next_execution = last_execution_time + INTERVAL_SECONDS
+    next_execution = last_execution + status['interval']
     remaining = next_execution - int(time.time())
     
     # 如果已经过了执行时间，返回0
     return max(0, remaining)
 
-last_holders_update = 0
-holders_updating = False
+ROUND_RETRY_SECONDS = 15  # 本轮被跳过后的重试间隔
 
-def update_holders_cache():
-    """更新持仓缓存（在单独线程中运行，线程安全）"""
-    global last_holders_update, holders_updating
-    
-    # 使用锁保护状态检查和设置
-    with _holders_lock:
-        if holders_updating:
-            return
-        holders_updating = True
-    
-    try:
-        config = load_config()
-        if config:
-            logger.info("更新持仓缓存...")
-            holders = get_top_holders(config['contract_address'])
-            if holders:
-                save_holders(holders, config['contract_address'])
-                logger.info(f"  已更新 {len(holders)} 个持仓者")
-            last_holders_update = int(time.time())
-    except Exception as e:
-        logger.error(f"更新持仓失败: {e}")
-    finally:
-        holders_updating = False
+_scheduler_cond = threading.Condition()
+_config_dirty = False
+_took_leadership = False  # 刚成为主节点，下一轮前需要完成接管
+
+def notify_config_changed():
+    """配置文件变更回调：标记并唤醒调度器"""
+    global _config_dirty
+    with _scheduler_cond:
+        _config_dirty = True
+        _scheduler_cond.notify_all()
+
+def on_leader_change(held):
+    """租约回调：成为主节点时唤醒调度器完成接管"""
+    global _took_leadership
+    with _scheduler_cond:
+        _took_leadership = held
+        _scheduler_cond.notify_all()
+
+def wait_for_inflight_nonces(config):
+    """等待上一任主节点已广播的交易上链或被丢弃（pending nonce 追平 latest），超时返回 False"""
+    web3 = get_web3()
+    wallet = config['wallet_address']
+    deadline = time.time() + HANDOVER_NONCE_WAIT_SECONDS
+    while True:
+        latest = web3.eth.get_transaction_count(wallet, 'latest')
+        pending = web3.eth.get_transaction_count(wallet, 'pending')
+        if pending <= latest:
+            return True
+        if time.time() >= deadline:
+            logger.warning(f"[lease] 仍有 {pending - latest} 笔交易未上链，继续执行（新交易从 nonce {pending} 开始）")
+            return False
+        logger.info(f"[lease] 等待上一任主节点的 {pending - latest} 笔交易上链...")
+        time.sleep(BLOCK_TIME_SECONDS * 4)
+
+BALANCE_DEMAND_SECONDS = 30  # 这段时间内没有页面请求余额时，主节点停止读取
+BALANCE_STALE_SECONDS = 10   # runtime.db 中的余额超过此时间未更新（主节点未运行）时 Web 进程自己读取
+_balance_demand_at = 0       # 本进程上次在 runtime.db 记录余额请求的时间
+
+def read_balance(address):
+    """/api/balance 的数据：主节点直接读取，web 角色和备用节点读 runtime.db 中主节点发布的值
+
+    所有 Web 进程共用主节点每个区块一次的读取；
+    Web 进程每隔几秒记录一次"有页面在看"，主节点据此决定是否继续读取。
+    """
+    global _balance_demand_at
+    if not reads_shared_state():
+        return balance_feed.get(address)
+    state = get_shared_state()
+    if time.time() - _balance_demand_at >= BALANCE_DEMAND_SECONDS / 6:
+        _balance_demand_at = time.time()
+        state.put('balance_demand', _balance_demand_at)
+    value = state.get('balance')
+    updated_at = state.updated_at('balance')
+    if value and value['address'] == address.lower() and time.time() - updated_at < BALANCE_STALE_SECONDS:
+        return value
+    return balance_feed.get(address)  # 主节点还没有发布（刚启动或未运行）
+
+def balance_publisher():
+    """主节点：有页面在看时每个出块间隔读取一次余额并写入 runtime.db，供 Web 进程读取"""
+    while True:
+        time.sleep(BLOCK_TIME_SECONDS)
+        if not is_leader():
+            continue
+        try:
+            demand_at = get_shared_state().updated_at('balance_demand')
+            if demand_at is None or time.time() - demand_at > BALANCE_DEMAND_SECONDS:
+                continue
+            config = load_config()
+            if config:
+                publish_shared('balance', balance_feed.get(config['wallet_address']))
+        except Exception as e:
+            logger.warning(f"[余额] 发布失败: {e}")
+
+def take_over_leadership():
+    """刚成为主节点：从共享的 scheduler.json 恢复倒计时，等待在途交易后再开始下一轮"""
+    global init_mode, last_execution_time
+    saved = load_scheduler_state()
+    if config_hash and saved.get('config_hash') == config_hash:
+        init_mode = False
+        last_execution_time = max(last_execution_time, saved.get('last_execution', 0))
+    publish_shared('progress', progress.export_state())
+    discard_prepared_round()  # 之前的准备结果可能已被其他节点的交易占用 nonce
+    config = load_config()
+    if config:
+        try:
+            wait_for_inflight_nonces(config)
+        except Exception as e:
+            logger.warning(f"[lease] 检查在途交易失败: {e}")
+
+def next_deadline():
+    """距离调度器下一个截止时间的秒数（初始化倒计时或下一轮），<= 0 表示已到期"""
+    if init_mode:
+        return init_start_time + INIT_SECONDS - time.time()
+    if last_execution_time == 0:
+        return 0
+    return last_execution_time + INTERVAL_SECONDS - time.time()
 
 def background_scheduler():
-    """后台定时任务 - 上一轮完成后才开始下一轮倒计时"""
-    global last_execution_time, last_holders_update, init_mode, init_start_time, config_hash
+    """后台定时任务 - 上一轮完成后才开始下一轮倒计时
+
+    事件驱动：睡眠到下一个截止时间（初始化结束或下一轮开始），
+    配置文件变更由 FileWatcher 唤醒，不再每秒轮询。持仓刷新由 holders_cache 自己的线程负责。
+    """
+    global last_execution_time, init_mode, init_start_time, config_hash, _config_dirty, _took_leadership
     logger.info("后台调度器已启动")
     logger.info(f"分红间隔: {INTERVAL_SECONDS} 秒 ({INTERVAL_SECONDS // 60} 分钟)")
-    logger.info(f"初始化等待: {INIT_SECONDS} 秒 ({INIT_SECONDS // 60} 分钟)")
     
-    # 首次启动，初始化配置哈希并进入初始化模式
+    # 首次启动：配置与上次完成初始化时相同则直接恢复倒计时（部署重启），否则进入初始化模式
     config = load_config()
     if config:
         config_hash = get_config_hash(config)
-        init_mode = True
-        init_start_time = int(time.time())
-        logger.info(f"首次启动，进入初始化模式，{INIT_SECONDS}秒后开始执行")
+        apply_init_seconds(config)
+        saved = load_scheduler_state()
+        if saved.get('config_hash') == config_hash:
+            init_mode = False
+            last_execution_time = saved.get('last_execution', 0)
+            logger.info("配置未变更，跳过初始化期，延续上次的倒计时")
+        else:
+            init_mode = True
+            init_start_time = int(time.time())
+            logger.info(f"首次启动，进入初始化模式，{INIT_SECONDS}秒后开始执行")
     
+    if leader is not None:
+        leader.subscribe(on_leader_change)
+        leader.start()
+    
+    # 常驻线程定时刷新持仓快照（不阻塞分红）
+    holders_cache.start()
+    threading.Thread(target=retry_worker, daemon=True).start()
+    if _shared_publishing:
+        threading.Thread(target=balance_publisher, daemon=True).start()
+    FileWatcher(CONFIG_FILE, notify_config_changed).start()
+    
+    retry_at = 0
+    prepared_for = None
     while True:
-        current_time = int(time.time())
+        publish_status()
+        with _scheduler_cond:
+            dirty, _config_dirty = _config_dirty, False
         
-        # 检查配置是否变更
-        check_config_change()
+        # 配置文件有变动时才重新读取
+        if dirty:
+            try:
+                if check_config_change():
+                    holders_cache.request_refresh()
+            except Exception as e:
+                logger.warning(f"读取配置失败，等待下次变更: {e}")
         
-        # 每2分钟在后台线程更新持仓缓存（不阻塞分红）
-        if current_time - last_holders_update >= 2 * 60 and not holders_updating:
-            threading.Thread(target=update_holders_cache, daemon=True).start()
+        # 多实例部署：备用节点不执行分红，等待租约
+        if not is_leader():
+            with _scheduler_cond:
+                _scheduler_cond.wait_for(lambda: _config_dirty or _took_leadership, timeout=leader.ttl / 3)
+            continue
+        with _scheduler_cond:
+            took, _took_leadership = _took_leadership, False
+        if took:
+            take_over_leadership()
+            continue
         
-        # 初始化模式：等待倒计时结束
-        if init_mode:
-            init_remaining = get_init_countdown()
-            if init_remaining <= 0:
-                logger.info("初始化完成，开始正常运行")
-                init_mode = False
-                last_execution_time = 0  # 重置，使第一轮立即执行
-            else:
-                time.sleep(1)
-                continue
+        remaining = next_deadline()
+        if not init_mode:
+            remaining = max(remaining, retry_at - time.time())
+        if remaining > 0:
+            wake = remaining
+            if not init_mode and PREPARE_LEAD_SECONDS > 0:
+                if remaining > PREPARE_LEAD_SECONDS:
+                    wake = remaining - PREPARE_LEAD_SECONDS
+                elif prepared_for != (last_execution_time, retry_at):
+                    # 倒计时最后一段时间：后台执行轮前准备（每个倒计时只准备一次）
+                    prepared_for = (last_execution_time, retry_at)
+                    threading.Thread(target=prepare_round_in_background, daemon=True).start()
+            with _scheduler_cond:
+                _scheduler_cond.wait_for(lambda: _config_dirty, timeout=wake)
+            continue
         
-        remaining = get_countdown()
+        # 初始化模式：倒计时结束
+        if init_mode:
+            logger.info("初始化完成，开始正常运行")
+            init_mode = False
+            last_execution_time = 0  # 重置，使第一轮立即执行
+            save_scheduler_state()
+            continue
         
         # 倒计时归零时执行分红
-        if remaining <= 0 and not lottery_running:
+        if not lottery_running:
             logger.info("倒计时结束，开始执行...")
             execute_lottery()
             # execute_lottery 完成后会更新 last_execution_time
             # 下一轮倒计时从此刻开始
-        
-        time.sleep(1)
+            # 本轮被跳过（余额不足等）时稍后重试，避免空转
+            retry_at = time.time() + ROUND_RETRY_SECONDS
 
 # ========== Flask 路由 (只读) ==========
 
+def serve_asset(name):
+    result = assets.serve(name, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    if result is None:
+        return jsonify({'error': 'not found'}), 404
+    status, body, headers = result
+    return Response(body, status=status, headers=headers)
+
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return serve_asset('index.html')
 
 @app.route('/<path:filename>')
 def static_files(filename):
-    return send_from_directory('.', filename)
+    return serve_asset(filename)
 
 @app.route('/api/progress', methods=['GET'])
 def api_progress():
-    """获取实时执行进度"""
-    with _progress_lock:
-        return jsonify(current_progress.copy())
+    """获取实时执行进度
+
+    Query:
+        since: 客户端已知的版本号，提供时只返回之后的变更
+        wait: 没有新变更时最多等待的秒数（长轮询，默认 0）
+    """
+    sync_progress()
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify(progress.snapshot())
+    wait = min(request.args.get('wait', 0, type=float), PROGRESS_MAX_WAIT_SECONDS)
+    if wait > 0:
+        wait_progress(since, wait)
+    return jsonify(progress.delta(since))
 
 @app.route('/api/status', methods=['GET'])
 def api_status():
     """获取当前状态和倒计时"""
+    status = read_scheduler_status()
     # 初始化模式下返回初始化倒计时
-    if init_mode:
-        init_remaining = get_init_countdown()
+    if status['init_mode']:
+        init_remaining = get_init_countdown(status)
         return jsonify({
             'init_mode': True,
             'init_countdown': init_remaining,
-            'init_total': INIT_SECONDS,
+            'init_total': status['init_total'],
             'countdown': init_remaining,
-            'interval': INTERVAL_SECONDS,
+            'interval': status['interval'],
             'running': False,
             'last_execution': 0,
             'next_execution': 0,
             'last_result': None
         })
     
-    countdown = get_countdown()
+    countdown = get_countdown(status)
     
     # 获取最新分红结果
     last_result = None
     try:
-        if RECORDS_FILE.exists():
-            with open(RECORDS_FILE) as f:
-                records = json.load(f)
-                if records.get('dividend') and len(records['dividend']) > 0:
-                    last_result = records['dividend'][0]
+        records = snapshot.read(RECORDS_FILE)
+        if records and records.get('dividend'):
+            last_result = records['dividend'][0]
     except:
         pass
     
     # 计算下次执行时间
-    next_execution = last_execution_time + INTERVAL_SECONDS if last_execution_time > 0 else 0
+    last_execution = status['last_execution']
+    next_execution = last_execution + status['interval'] if last_execution > 0 else 0
     
     return jsonify({
         'init_mode': False,
         'countdown': countdown,
-        'interval': INTERVAL_SECONDS,
-        'running': lottery_running,
-        'last_execution': last_execution_time,
+        'interval': status['interval'],
+        'running': status['running'],
+        'last_execution': last_execution,
         'next_execution': next_execution,
         'last_result': last_result
     })
 
 @app.route('/api/holders', methods=['GET'])
 def api_holders():
-    """获取持仓者列表（优先返回缓存，后台更新）"""
+    """获取持仓者列表（内存快照，过期时后台刷新）
+
+    ?since=<version> 只返回该版本之后排名或余额变化的条目（changed / removed），
+    以及前 30 名分红资格名单和相对上一轮的变化。
+    """
+    try:
+        since = request.args.get('since', type=int)
+        if since is not None:
+            return jsonify(holders_cache.delta(since))
+        return jsonify(holders_cache.snapshot())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/balance', methods=['GET'])
+def api_balance():
+    """获取分红钱包的 BNB 余额（服务端按区块缓存，页面不再直接请求公共节点）"""
+    config = load_config()
+    if not config:
+        return jsonify({'error': 'not configured'}), 503
     try:
-        # 优先返回缓存数据
-        if HOLDERS_FILE.exists():
-            with open(HOLDERS_FILE) as f:
-                return jsonify(json.load(f))
-        return jsonify({'holders': [], 'updated': 0})
+        return jsonify(read_balance(config['wallet_address']))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_record_filters(args):
+    """解析记录查询参数（type / address / from_block / to_block / since / until）"""
+    def optional_int(name):
+        value = args.get(name)
+        return int(value) if value not in (None, '') else None
+    return {
+        'record_type': args.get('type') or None,
+        'address': args.get('address') or None,
+        'from_block': optional_int('from_block'),
+        'to_block': optional_int('to_block'),
+        'since': optional_int('since'),
+        'until': optional_int('until'),
+    }
+
 @app.route('/api/records', methods=['GET'])
 def api_records():
-    """获取历史记录"""
+    """获取历史记录
+
+    不带参数时返回 records.json（最近记录，兼容旧前端）；
+    带参数时从记录库分页查询：
+      type=dividend|buyback, address=, from_block=, to_block=, since=, until=（时间戳）
+      limit=（默认 50，最大 500）, cursor=（上一页返回的 next_cursor）, totals=1（附带汇总）
+    """
     try:
-        if RECORDS_FILE.exists():
-            with open(RECORDS_FILE) as f:
-                return jsonify(json.load(f))
-        return jsonify({'buyback': [], 'dividend': []})
+        if not request.args:
+            return jsonify(snapshot.read(RECORDS_FILE, {'buyback': [], 'dividend': []}))
+
+        filters = parse_record_filters(request.args)
+        store = get_record_store()
+        page = store.query(
+            limit=request.args.get('limit', 50),
+            cursor=request.args.get('cursor'),
+            **filters
+        )
+        if request.args.get('totals') in ('1', 'true'):
+            page['totals'] = store.totals(**filters)
+        return jsonify(page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/records/totals', methods=['GET'])
+def api_records_totals():
+    """历史汇总：分红 BNB 总额、销毁代币总量等（支持与 /api/records 相同的过滤参数）"""
+    try:
+        return jsonify(get_record_store().totals(**parse_record_filters(request.args)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/rounds/timings', methods=['GET'])
+def api_round_timings():
+    """最近几轮的阶段耗时、RPC 调用数和重试次数（?limit=N）"""
+    try:
+        limit = request.args.get('limit', type=int)
+        if reads_shared_state():
+            rounds = get_shared_state().get('timings', {'rounds': []})['rounds']
+            rounds = rounds[:limit] if limit else rounds
+            return jsonify({'rounds': rounds, 'summary': tracing.summarize(rounds)})
+        return jsonify(tracer.history(limit))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/dividends/retries', methods=['GET'])
+def api_dividend_retries():
+    """失败分红重试队列：各状态汇总和最近的条目"""
+    try:
+        queue = get_retry_queue()
+        return jsonify({'summary': queue.summary(), 'items': queue.recent(request.args.get('limit', 50, type=int))})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/leader', methods=['GET'])
+def api_leader():
+    """多实例部署的主节点租约状态（未启用 --lease 时 enabled 为 false）"""
+    if leader is None:
+        return jsonify({'enabled': False, 'held': SERVER_ROLE != 'web'})
+    return jsonify(dict(leader.to_dict(), enabled=True))
+
+@app.route('/api/rpc/stats', methods=['GET'])
+def api_rpc_stats():
+    """RPC 调用统计：按方法/调用方/节点累计，最近几轮的窗口明细（?scopes=N），以及 gas limit 估算缓存"""
+    try:
+        scopes = request.args.get('scopes', 10, type=int)
+        if reads_shared_state():
+            stats = get_shared_state().get('rpc', {'scopes': []})
+            stats['scopes'] = stats['scopes'][:scopes]
+            return jsonify(stats)
+        stats = rpc_accounting.stats(scopes)
+        stats['limiters'] = rate_limit.limiter_stats()
+        stats['gas'] = gas_estimator.stats()
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+EXPORT_MAX_RECORDS = 50000  # /api/export 每次请求最多导出的条数（完整导出用 cursor 分多次请求，或用 export_records.py）
+
+@app.route('/api/export', methods=['GET'])
+def api_export():
+    """流式导出完整历史（NDJSON / CSV）
+
+    参数: format=ndjson|csv, type=, address=, from_block=, to_block=, since=, until=,
+          cursor=（从上次导出的最后一个 cursor 之后继续）,
+          limit=（本次最多导出的条数，默认且最多 EXPORT_MAX_RECORDS；返回满 limit 条时用最后一行的 cursor 继续）
+    按区块正序分批读取，内存占用与历史总量无关；
+    使用独立的数据库连接，导出期间不阻塞其它请求。每次请求的条数有上限，避免长时间占用 worker。
+    """
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in records_store.EXPORT_FORMATS:
+            raise ValueError(f'unknown export format: {fmt}')
+        cursor = request.args.get('cursor') or None
+        if cursor:
+            records_store.decode_cursor(cursor)
+        limit = min(request.args.get('limit', EXPORT_MAX_RECORDS, type=int), EXPORT_MAX_RECORDS)
+        if limit <= 0:
+            raise ValueError(f'invalid limit: {limit}')
+        filters = parse_record_filters(request.args)
+        records_store.validate_filters(**filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    lines = records_store.export_lines(get_record_store(), fmt, cursor=cursor, limit=limit, **filters)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(lines),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=records.{fmt}'}
+    )
+
 if __name__ == '__main__':
     logger.info("=" * 50)
     logger.info("BSC 分红系统 (纯后端执行)")
     logger.info("=" * 50)
     
+    parser = argparse.ArgumentParser(description='BSC 分红 API 服务器')
+    parser.add_argument('--dry-run', action='store_true', help='连接进程内模拟链，不使用真实 BNB 和主网')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--role', choices=('all', 'scheduler', 'web'), default='all',
+                        help='all: 调度 + Web；scheduler: 只执行分红；web: 只读 API（多进程部署见 wsgi.py）')
+    parser.add_argument('--lease', nargs='?', const=str(BASE_DIR / 'leader.lease'), default=None,
+                        help='多实例部署：租约文件（共享存储），同一时刻只有持有租约的实例执行分红')
+    parser.add_argument('--lease-ttl', type=float, default=leader_lease.DEFAULT_TTL_SECONDS)
+    args = parser.parse_args()
+    if args.dry_run and args.role != 'all':
+        parser.error('--dry-run 的模拟链在进程内，只支持 --role all')
+    SERVER_ROLE = args.role
+    if args.lease and SERVER_ROLE != 'web':
+        leader = leader_lease.LeaderLease(args.lease, ttl=args.lease_ttl)
+        atexit.register(leader.release)
+        # systemd stop 发送 SIGTERM：正常退出以便释放租约，备用节点立即接管
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    
+    if args.dry_run:
+        import sim_chain
+        sim_chain.install(sys.modules[__name__])
+    
     config = load_config()
     if config:
         logger.info(f"钱包地址: {config['wallet_address']}")
@@ -1138,10 +2840,18 @@ if __name__ == '__main__':
     
     logger.info(f"分红间隔: {INTERVAL_SECONDS} 秒 ({INTERVAL_SECONDS // 60} 分钟)")
     logger.info("逻辑: 每轮分红完成后开始下一轮倒计时")
-    logger.info("服务器启动在 http://0.0.0.0:5000")
+    if SERVER_ROLE != 'web':
+        enable_shared_publishing()
+    if SERVER_ROLE == 'scheduler':
+        background_scheduler()  # 不提供 HTTP 服务，Web 进程从 runtime.db 读取状态
+        sys.exit(0)
+    
+    logger.info(f"服务器启动在 http://0.0.0.0:{args.port}")
     
     # 启动后台调度器
-    scheduler_thread = threading.Thread(target=background_scheduler, daemon=True)
-    scheduler_thread.start()
+    if SERVER_ROLE == 'all':
+        scheduler_thread = threading.Thread(target=background_scheduler, daemon=True)
+        scheduler_thread.start()
+    threading.Thread(target=assets.warm, daemon=True).start()
     
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    app.run(host='0.0.0.0', port=args.port, debug=False, threaded=True)
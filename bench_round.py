@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+回购分红整轮基准测试（基于 sim_chain 模拟链，不花真实 BNB）
+
+连续执行 N 轮 execute_lottery，按阶段统计：
+  recovery_burn  残留代币补销毁
+  holders        持仓快照刷新（轮前执行，不计入每轮耗时）
+  prepare        轮前准备（--prepare，倒计时内执行，不计入每轮耗时）
+  dividend       分红发送
+  buyback        回购购买
+  burn           回购销毁
+  other          其余（余额检查、状态保存等）
+输出每个阶段的平均耗时、RPC 调用次数、每秒交易数，以及开始执行到第一笔交易广播的延迟。
+
+用法：
+    python3 bench_round.py --rounds 5
+    python3 bench_round.py --rounds 3 --block-time 0.75 --rpc-latency 0.05 --json
+    python3 bench_round.py --rounds 3 --rpc-latency 0.05 --prepare
+"""
+import argparse
+import functools
+import json
+import logging
+import threading
+import time
+
+import api_server
+import sim_chain
+
+PHASES = ['recovery_burn', 'holders', 'prepare', 'dividend', 'buyback', 'burn', 'other']
+
+# 需要计时的 api_server 函数 -> 阶段名
+PHASE_FUNCTIONS = {
+    'check_and_burn_pending_tokens': 'recovery_burn',
+    'get_top_holders': 'holders',
+    'prepare_round': 'prepare',
+    'send_dividend': 'dividend',
+    'run_buyback': 'buyback',
+    'burn_tokens': 'burn',
+}
+
+
+class PhaseMeter:
+    """按阶段统计耗时和 RPC 调用（阶段按线程区分）"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._active = {}  # 活跃阶段 -> 线程数
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.wall = {phase: 0.0 for phase in PHASES}
+            self.rpc = {phase: 0 for phase in PHASES}
+            self.sends = 0
+            self.first_send = None
+
+    @property
+    def current(self):
+        phase = getattr(self._local, 'phase', 'other')
+        if phase == 'other' and len(self._active) == 1:
+            # 工作线程（如持仓查询线程池）归属到唯一活跃的阶段
+            return next(iter(self._active))
+        return phase
+
+    def record_rpc(self, method):
+        phase = self.current
+        with self._lock:
+            self.rpc[phase] += 1
+            if method == 'eth_sendRawTransaction':
+                self.sends += 1
+                if self.first_send is None:
+                    self.first_send = time.perf_counter()
+
+    def wrap(self, func, phase):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = getattr(self._local, 'phase', 'other')
+            self._local.phase = phase
+            with self._lock:
+                self._active[phase] = self._active.get(phase, 0) + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.phase = previous
+                with self._lock:
+                    self._active[phase] -= 1
+                    if not self._active[phase]:
+                        del self._active[phase]
+                    if previous == 'other':
+                        self.wall[phase] += time.perf_counter() - start
+        return wrapper
+
+
+def run(rounds, fund_bnb, leftover_tokens, cold_holders, buyback_config=None, prepare=False, **chain_kwargs):
+    chain = sim_chain.install(api_server, **chain_kwargs)
+    if buyback_config:
+        config = api_server.load_config()
+        config.update(buyback_config)
+        with open(api_server.CONFIG_FILE, 'w') as f:
+            json.dump(config, f, indent=4)
+    meter = PhaseMeter()
+    chain.meter = meter
+    for name, phase in PHASE_FUNCTIONS.items():
+        setattr(api_server, name, meter.wrap(getattr(api_server, name), phase))
+
+    config = api_server.load_config()
+    results = []
+    throttled_before = 0
+    for index in range(rounds):
+        # 模拟每轮之间钱包收到的税费，以及上一轮遗留的代币
+        chain.fund(config['wallet_address'], fund_bnb)
+        if leftover_tokens:
+            chain.mint_tokens(config['wallet_address'], leftover_tokens)
+
+        meter.reset()
+        # 持仓快照由后台线程刷新，不在本轮关键路径上；这里在轮前同步刷新并单独计时
+        if cold_holders or index == 0:
+            api_server.holders_cache.refresh()
+        # 轮前准备在倒计时内执行，同样不计入本轮耗时
+        if prepare:
+            api_server.prepare_round()
+        start = time.perf_counter()
+        result = api_server.execute_lottery()
+        total = time.perf_counter() - start
+        # 本轮内未被任何阶段覆盖的时间记为 other
+        covered = sum(meter.wall[phase] for phase in PHASES if phase not in ('other', 'holders', 'prepare'))
+        meter.wall['other'] = max(0.0, total - covered)
+
+        buyback = (result or {}).get('buyback') or {}
+        results.append({
+            'round': index + 1,
+            'ok': result is not None,
+            'wall_seconds': total,
+            'phase_seconds': dict(meter.wall),
+            'phase_rpc_calls': dict(meter.rpc),
+            'transactions': meter.sends,
+            'tx_per_second': meter.sends / total if total > 0 else 0,
+            'first_tx_seconds': meter.first_send - start if meter.first_send else None,
+            'dividends': (result or {}).get('dividend_count', 0),
+            'throttled': chain.throttled_count - throttled_before,
+            'buyback_tokens': buyback.get('amount', 0),
+            'buyback_bnb': buyback.get('bnb_spent', 0),
+        })
+        throttled_before = chain.throttled_count
+    return results
+
+
+def print_report(results):
+    rounds = len(results)
+    print(f"{'阶段':<16}{'平均耗时(ms)':>14}{'平均RPC':>10}")
+    for phase in PHASES:
+        wall = sum(r['phase_seconds'][phase] for r in results) / rounds * 1000
+        calls = sum(r['phase_rpc_calls'][phase] for r in results) / rounds
+        print(f"{phase:<16}{wall:>14.1f}{calls:>10.1f}")
+    total_wall = sum(r['wall_seconds'] for r in results)
+    total_tx = sum(r['transactions'] for r in results)
+    print('-' * 40)
+    print(f"轮数: {rounds}, 成功: {sum(r['ok'] for r in results)}")
+    print(f"平均每轮: {total_wall / rounds * 1000:.1f} ms, 交易: {total_tx / rounds:.1f} 笔")
+    print(f"吞吐: {total_tx / total_wall if total_wall else 0:.2f} tx/s")
+    first_tx = [r['first_tx_seconds'] for r in results if r['first_tx_seconds'] is not None]
+    if first_tx:
+        print(f"开始执行到第一笔广播: {sum(first_tx) / len(first_tx) * 1000:.1f} ms")
+    bought = sum(r['buyback_tokens'] for r in results)
+    spent = sum(r['buyback_bnb'] for r in results)
+    if spent:
+        print(f"回购: {spent:.4f} BNB -> {bought:,.0f} 枚 ({bought / spent:,.0f} 枚/BNB)")
+    throttled = sum(r['throttled'] for r in results)
+    if throttled:
+        print(f"被节点限流: {throttled} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='execute_lottery 模拟链基准测试')
+    parser.add_argument('--rounds', type=int, default=3, help='执行轮数')
+    parser.add_argument('--holders', type=int, default=60, help='模拟持仓者数量')
+    parser.add_argument('--fund', type=float, default=1.0, help='每轮前给钱包充值的 BNB')
+    parser.add_argument('--leftover', type=float, default=0, help='每轮前留在钱包中的残留代币（枚）')
+    parser.add_argument('--warm-holders', action='store_true', help='只在第一轮前刷新持仓快照（默认每轮前都刷新）')
+    parser.add_argument('--block-time', type=float, default=0.0, help='出块间隔秒数，0 表示立即出块')
+    parser.add_argument('--rpc-latency', type=float, default=0.0, help='每次 RPC 的模拟延迟秒数')
+    parser.add_argument('--send-failure-rate', type=float, default=0.0, help='发送交易随机失败概率')
+    parser.add_argument('--rate-limit', type=int, default=0, help='模拟节点每秒最多处理的请求数，0 表示不限')
+    parser.add_argument('--portal-bnb', type=float, default=50, help='模拟 Portal 池子的 BNB 储备')
+    parser.add_argument('--price-reversion', type=float, default=0.0, help='每个区块价格向初始值回归的比例')
+    parser.add_argument('--max-impact', type=float, default=None, help='回购单笔价格冲击上限（buyback_max_impact）')
+    parser.add_argument('--max-chunks', type=int, default=None, help='回购每轮最多笔数（buyback_max_chunks）')
+    parser.add_argument('--prepare', action='store_true', help='每轮前执行轮前准备（prepare_round）')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', action='store_true', help='输出 JSON 结果')
+    parser.add_argument('--verbose', action='store_true', help='显示 api_server 日志')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # 所有模块（api_server、buyback_engine、retry_queue、snapshot 等）的 INFO 日志都不输出，
+        # 避免混进报告和 --json 输出
+        logging.disable(logging.INFO)
+
+    results = run(
+        args.rounds, args.fund, args.leftover, not args.warm_holders,
+        holders=args.holders,
+        block_time=args.block_time,
+        rpc_latency=args.rpc_latency,
+        send_failure_rate=args.send_failure_rate,
+        rate_limit=args.rate_limit,
+        prepare=args.prepare,
+        seed=args.seed,
+        portal_bnb=args.portal_bnb,
+        price_reversion=args.price_reversion,
+        buyback_config={key: value for key, value in (
+            ('buyback_max_impact', args.max_impact), ('buyback_max_chunks', args.max_chunks)) if value is not None},
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+api_server 启动耗时基准测试
+
+把程序复制到临时目录（不带 config.json，调度器不会执行任何链上操作），
+启动 api_server.py 子进程，测量从启动到以下接口首次返回 200 的时间：
+  /records.json   静态快照
+  /api/holders    持仓快照
+  /api/status     状态
+另外单独测量 import api_server 的耗时。
+
+用法：
+    python3 bench_startup.py --runs 5
+"""
+import argparse
+import json
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent
+ENDPOINTS = ['/records.json', '/api/holders', '/api/status']
+TIMEOUT_SECONDS = 30
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def prepare_workdir():
+    """复制程序文件，并准备示例 records.json / holders.json"""
+    workdir = Path(tempfile.mkdtemp(prefix='bsc-startup-'))
+    for path in BASE_DIR.glob('*.py'):
+        shutil.copy(path, workdir)
+    shutil.copy(BASE_DIR / 'index.html', workdir)
+    records = {
+        'buyback': [{'tx_hash': f'0x{i:064x}', 'amount': 1000.0, 'bnb_spent': 0.1, 'block': i, 'timestamp': 0} for i in range(50)],
+        'dividend': [{'tx_hash': f'0x{i + 100:064x}', 'address': '0x1234...abcd', 'full_address': '0x' + '12' * 20,
+                      'amount': 0.01, 'block': i, 'timestamp': 0} for i in range(100)],
+        'updated': int(time.time()),
+        'last_block': 100,
+    }
+    holders = {
+        'holders': [{'address': '0x' + f'{i:040x}', 'balance': 1000.0 - i} for i in range(100)],
+        'updated': int(time.time()),
+        'contract': '0x' + '99' * 20,
+    }
+    (workdir / 'records.json').write_text(json.dumps(records))
+    (workdir / 'holders.json').write_text(json.dumps(holders, indent=2))
+    return workdir
+
+
+def measure_import(workdir):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'import api_server'], cwd=workdir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def measure_startup(workdir):
+    """返回 {接口: 首次 200 的秒数}"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, 'api_server.py', '--port', str(port)], cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    timings = {}
+    try:
+        pending = list(ENDPOINTS)
+        while pending and time.perf_counter() - start < TIMEOUT_SECONDS:
+            endpoint = pending[0]
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}{endpoint}', timeout=2) as response:
+                    if response.status == 200:
+                        response.read()
+                        timings[endpoint] = time.perf_counter() - start
+                        pending.pop(0)
+                        continue
+            except OSError:
+                pass
+            time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='api_server 启动耗时基准测试')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='输出 JSON 结果')
+    args = parser.parse_args()
+
+    workdir = prepare_workdir()
+    try:
+        imports = [measure_import(workdir) for _ in range(args.runs)]
+        runs = [measure_startup(workdir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {'import_api_server': statistics.median(imports)}
+    for endpoint in ENDPOINTS:
+        values = [run[endpoint] for run in runs if endpoint in run]
+        result[endpoint] = statistics.median(values) if values else None
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"{'项目':<20}{'中位数(ms)':>12}")
+    for name, value in result.items():
+        text = f'{value * 1000:.0f}' if value is not None else '超时'
+        print(f"{name:<20}{text:>12}")
+
+
+if __name__ == '__main__':
+    main()
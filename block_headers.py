@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+区块头缓存（区块号 -> 时间戳、哈希）
+
+分红/回购记录只带区块号，这里给它们补上链上时间（block_time），前端按链上时间排序、分组。
+- 扫描时已经取到的区块直接记下（remember），不额外请求
+- 缺失的区块由调用方批量获取（只取区块头，每个区块一次，与记录条数无关）
+- 用到的区块头写入 SQLite（与记录库同一个文件），重启后复用；其余只在内存中保留最近的一部分
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+MEMORY_SIZE = 4096  # 内存中保留的区块头数量
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS block_headers (
+    number INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+'''
+
+
+def _int(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def parse_header(block):
+    """RPC 原始结果（十六进制字符串）或 web3 区块对象 -> (number, timestamp, hash)"""
+    block_hash = block['hash']
+    if not isinstance(block_hash, str):
+        block_hash = '0x' + bytes(block_hash).hex()
+    return _int(block['number']), _int(block['timestamp']), block_hash.lower()
+
+
+class BlockHeaderCache:
+    """区块头缓存，每个线程使用独立连接"""
+
+    def __init__(self, path, memory_size=MEMORY_SIZE):
+        self.path = Path(path)
+        self.memory_size = memory_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # number -> (timestamp, hash)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _keep(self, number, header):
+        with self._lock:
+            self._memory[number] = header
+            self._memory.move_to_end(number)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def remember(self, block):
+        """记下已经取到的区块（只进内存，被记录用到时才落盘）"""
+        number, timestamp, block_hash = parse_header(block)
+        self._keep(number, (timestamp, block_hash))
+        return timestamp
+
+    def get(self, number):
+        """(timestamp, hash)，内存和数据库都没有时返回 None"""
+        with self._lock:
+            header = self._memory.get(number)
+        if header is not None:
+            return header
+        row = self._connect().execute(
+            'SELECT timestamp, hash FROM block_headers WHERE number = ?', (number,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._keep(number, tuple(row))
+        return tuple(row)
+
+    def timestamps(self, numbers, fetch=None):
+        """{区块号: 时间戳}
+
+        Args:
+            fetch: fetch(缺失的区块号列表) -> 区块（或区块头）列表；不提供时只查缓存
+        """
+        result, missing = {}, []
+        for number in set(numbers):
+            header = self.get(number)
+            if header is None:
+                missing.append(number)
+            else:
+                result[number] = header
+        if missing and fetch is not None:
+            for block in fetch(sorted(missing)):
+                if block:
+                    number, timestamp, block_hash = parse_header(block)
+                    self._keep(number, (timestamp, block_hash))
+                    result[number] = (timestamp, block_hash)
+        if result:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO block_headers (number, timestamp, hash) VALUES (?, ?, ?)',
+                    [(number, timestamp, block_hash) for number, (timestamp, block_hash) in result.items()]
+                )
+        return {number: timestamp for number, (timestamp, _) in result.items()}
+
+    def enrich(self, records, fetch=None):
+        """给缺少 block_time 的记录补上区块时间，返回补上的条数"""
+        pending = [r for r in records if r.get('block') and not r.get('block_time')]
+        if not pending:
+            return 0
+        times = self.timestamps([r['block'] for r in pending], fetch)
+        enriched = 0
+        for record in pending:
+            if record['block'] in times:
+                record['block_time'] = times[record['block']]
+                enriched += 1
+        return enriched
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+分批回购（按报价控制价格冲击）
+
+不依赖 web3：报价、购买、等待出块都由调用方传入，可以直接用模拟 Portal 或假报价测试。
+  quote(amount_wei) -> 预计得到的代币数量（最小单位）
+  swap(amount_wei, min_output) -> 实际得到的代币数量，失败返回 0
+  wait_next_block() -> 等到下一个区块（让套利和其他买单把价格拉回来）
+
+价格冲击 = 1 - 本笔平均成交价 / 极小金额的边际价格，手续费在两者中相互抵消。
+每一笔取冲击不超过上限的最大金额（二分查找），minOutputAmount 按报价减去滑点容忍度计算。
+超过笔数上限或池子太浅时剩余金额不再购买，由调用方留到下一轮。
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IMPACT = 0.02   # 单笔价格冲击上限 2%
+DEFAULT_SLIPPAGE = 0.01     # minOutputAmount = 报价 * (1 - 1%)
+DEFAULT_MAX_CHUNKS = 4      # 每轮最多分几笔（每笔间隔至少一个区块）
+MIN_CHUNK_WEI = 10**15      # 0.001 BNB，更小的金额不值得一笔 gas
+PROBE_WEI = 10**14          # 估算边际价格用的试探金额
+SEARCH_STEPS = 12           # 二分查找次数
+
+
+def price_impact(quote, amount, probe_rate):
+    """amount 相对边际价格的冲击比例，以及报价输出"""
+    out = quote(amount)
+    if out <= 0 or probe_rate <= 0:
+        return 1.0, out
+    return max(0.0, 1 - (out / amount) / probe_rate), out
+
+
+def plan_chunk(quote, remaining, max_impact=DEFAULT_MAX_IMPACT, min_chunk=MIN_CHUNK_WEI, probe=PROBE_WEI):
+    """本笔购买金额：不超过 remaining、冲击不超过 max_impact 的最大金额
+
+    Returns:
+        (amount, expected_out, impact)，最小金额的冲击都超过上限时 amount 为 0
+    """
+    probe = min(probe, remaining)
+    probe_out = quote(probe)
+    probe_rate = probe_out / probe if probe else 0
+    impact, out = price_impact(quote, remaining, probe_rate)
+    if impact <= max_impact:
+        return remaining, out, impact
+    low = min(min_chunk, remaining)
+    low_impact, low_out = price_impact(quote, low, probe_rate)
+    if low_impact > max_impact:
+        return 0, 0, low_impact
+    high = remaining
+    for _ in range(SEARCH_STEPS):
+        middle = (low + high) // 2
+        if middle <= low:
+            break
+        impact, out = price_impact(quote, middle, probe_rate)
+        if impact <= max_impact:
+            low, low_out, low_impact = middle, out, impact
+        else:
+            high = middle
+    return low, low_out, low_impact
+
+
+def min_output(expected_out, slippage=DEFAULT_SLIPPAGE):
+    return int(expected_out * (1 - slippage))
+
+
+class BuybackEngine:
+    def __init__(self, quote, swap, wait_next_block, max_impact=DEFAULT_MAX_IMPACT, slippage=DEFAULT_SLIPPAGE,
+                 max_chunks=DEFAULT_MAX_CHUNKS, min_chunk=MIN_CHUNK_WEI):
+        self.quote = quote
+        self.swap = swap
+        self.wait_next_block = wait_next_block
+        self.max_impact = max_impact
+        self.slippage = slippage
+        self.max_chunks = max(1, max_chunks)
+        self.min_chunk = min_chunk
+
+    def run(self, amount_wei):
+        """分批购买，返回 {'tokens', 'spent_wei', 'remaining_wei', 'chunks': [...]}"""
+        remaining = amount_wei
+        tokens = spent = 0
+        chunks = []
+        for index in range(self.max_chunks):
+            if remaining < self.min_chunk:
+                break
+            if index > 0:
+                self.wait_next_block()
+            chunk, expected, impact = plan_chunk(self.quote, remaining, self.max_impact, self.min_chunk)
+            if chunk <= 0:
+                logger.warning(f"  [回购] 最小金额的价格冲击 {impact:.2%} 已超过上限，剩余留到下一轮")
+                break
+            out_min = min_output(expected, self.slippage)
+            logger.info(f"  [回购] 第 {index + 1} 笔: {chunk / 1e18:.6f} BNB, 预计 {expected / 1e18:,.2f} 枚, "
+                        f"冲击 {impact:.2%}, 最少 {out_min / 1e18:,.2f} 枚")
+            received = self.swap(chunk, out_min)
+            chunks.append({'amount_wei': chunk, 'expected': expected, 'min_output': out_min,
+                           'impact': round(impact, 6), 'tokens': received})
+            if received <= 0:
+                break  # 失败（通常是价格变化超出滑点），剩余留到下一轮重新报价
+            tokens += received
+            spent += chunk
+            remaining -= chunk
+        return {'tokens': tokens, 'spent_wei': spent, 'remaining_wei': remaining, 'chunks': chunks}
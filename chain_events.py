@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+链上事件流（分红 / 回购 / 销毁 / 代币转账）
+
+iter_events 按区块范围分段获取数据、逐条产出解码后的事件（生成器，按需获取）：
+  - 区块（含交易）：钱包发出的 BNB 转账 -> dividend；同时带出区块时间
+  - 代币 Transfer 日志（eth_getLogs，一段区块一次）：
+      钱包发出、调用代币合约、转到 dead 地址 -> burn
+      钱包发出、调用其它合约、转入钱包      -> buyback（DEX 购买）
+      所有转账                              -> transfer（持仓索引用）
+    eth_getLogs 失败时这一段退回查询钱包交易的回执（此时没有 transfer 事件），
+    连续失败 LOGS_MAX_FAILURES 次（节点不支持）后不再尝试；
+    需要 transfer 事件时不退回，抛出 LogsUnavailable（否则这一段的转账会被 checkpoint 永久跳过）
+每段结束后产出 {'kind': 'checkpoint', 'block': 段末区块}：之前的事件都已产出，可以落盘并记录进度。
+段内任一区块或回执没有取到时抛出 FetchError，不产出这一段的 checkpoint，进度停在上一段。
+
+多个消费者共用一次获取：pump(events, sinks) 把同一个事件流写入多个 sink，
+在 checkpoint 处先 flush 所有 sink，再保存进度（至少一次语义，sink 需按 tx_hash 去重）。
+
+rpc / batch 由调用方提供（与 fetch_records.rpc_call / rpc_batch 相同）：
+  rpc(method, params) -> result，失败返回 None
+  batch(method, params_list) -> [result, ...]，可选，提供时同一段的区块和回执合并成一次请求；失败时抛出异常
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+DEAD_ADDRESS = '0x000000000000000000000000000000000000dead'
+
+RECORD_KINDS = ('dividend', 'buyback', 'burn')
+ALL_KINDS = RECORD_KINDS + ('transfer',)
+DEFAULT_CHUNK_BLOCKS = 50
+DEFAULT_PREFETCH = 1          # 消费者处理当前段时最多预取几段，超过后获取线程等待
+MIN_DIVIDEND_BNB = 0.01       # 小于此金额的 BNB 转账不视为分红
+LOGS_MAX_FAILURES = 3         # eth_getLogs 连续失败几次后视为节点不支持
+
+
+class FetchError(Exception):
+    """区块或回执没有取到：这一段不产出 checkpoint，调用方稍后从上次的进度重试"""
+
+
+class LogsUnavailable(FetchError):
+    """需要 transfer 事件时 eth_getLogs 失败（回执里没有其它地址的转账，不能退回）"""
+
+
+def _int(value):
+    return int(value, 16) if isinstance(value, str) else int(value or 0)
+
+
+def _topic_address(topic):
+    return '0x' + topic[26:].lower()
+
+
+# ---------- 解码 ----------
+
+def decode_dividend(tx, contract):
+    """钱包发出的交易 -> dividend 事件（普通 BNB 转账，不是转给代币合约）"""
+    value = _int(tx.get('value', '0x0'))
+    to_addr = (tx.get('to') or '').lower()
+    if value / 1e18 <= MIN_DIVIDEND_BNB or not to_addr or to_addr == contract:
+        return None
+    if tx.get('input', '0x') not in ('0x', ''):
+        return None
+    return {
+        'kind': 'dividend',
+        'tx_hash': tx['hash'],
+        'tx_index': _int(tx.get('transactionIndex')),
+        'log_index': -1,
+        'to': tx['to'],
+        'value': value,
+    }
+
+
+def decode_transfer(log):
+    """代币 Transfer 日志 -> transfer 事件"""
+    topics = log.get('topics', [])
+    if len(topics) < 3 or topics[0].lower() != TRANSFER_TOPIC:
+        return None
+    return {
+        'kind': 'transfer',
+        'block': _int(log['blockNumber']),
+        'tx_hash': log['transactionHash'],
+        'tx_index': _int(log.get('transactionIndex')),
+        'log_index': _int(log.get('logIndex')),
+        'from': _topic_address(topics[1]),
+        'to': _topic_address(topics[2]),
+        'value': _int(log.get('data') or '0x0'),
+    }
+
+
+def classify_transfer(transfer, wallet_tx_to, wallet, contract):
+    """钱包交易中的 Transfer -> burn / buyback，其它返回 None
+
+    wallet_tx_to: 该交易的 to 地址（交易不是钱包发出的为 None）
+    """
+    if wallet_tx_to is None:
+        return None
+    if wallet_tx_to == contract and transfer['to'] == DEAD_ADDRESS:
+        kind = 'burn'
+    elif wallet_tx_to != contract and transfer['to'] == wallet:
+        kind = 'buyback'
+    else:
+        return None
+    return dict(transfer, kind=kind)
+
+
+def to_record(event):
+    """dividend / buyback / burn 事件 -> records.json / 记录库的记录格式，返回 (类型, 记录)"""
+    if event['kind'] == 'dividend':
+        to_addr = event['to']
+        record = {
+            'address': to_addr[:6] + '...' + to_addr[-4:],
+            'full_address': to_addr,
+            'amount': event['value'] / 1e18,
+            'tx_hash': event['tx_hash'],
+            'block': event['block'],
+        }
+        record_type = 'dividend'
+    else:
+        record = {'amount': event['value'] / 1e18, 'tx_hash': event['tx_hash'], 'block': event['block']}
+        record_type = 'buyback'
+    if event.get('block_time'):
+        record['block_time'] = event['block_time']
+    return record_type, record
+
+
+# ---------- 获取 ----------
+
+class _ChunkFetcher:
+    def __init__(self, rpc, batch, wallet, contract, kinds, headers):
+        self.rpc = rpc
+        self.batch = batch
+        self.wallet = wallet.lower()
+        self.contract = contract.lower()
+        self.kinds = set(kinds)
+        self.headers = headers
+        self.logs_supported = True
+        self.logs_failures = 0  # eth_getLogs 连续失败次数
+
+    def _many(self, method, params_list):
+        if self.batch is not None:
+            return self.batch(method, params_list)
+        return [self.rpc(method, params) for params in params_list]
+
+    def _logs(self, start, end):
+        if not self.logs_supported:
+            return None
+        logs = self.rpc('eth_getLogs', [{
+            'address': self.contract,
+            'topics': [TRANSFER_TOPIC],
+            'fromBlock': hex(start),
+            'toBlock': hex(end),
+        }])
+        if logs is not None:
+            self.logs_failures = 0
+            return logs
+        # 偶发失败只影响这一段；连续失败多半是节点不支持，之后不再尝试
+        self.logs_failures += 1
+        if self.logs_failures >= LOGS_MAX_FAILURES:
+            self.logs_supported = False
+            logger.warning("[events] eth_getLogs 连续失败，之后不再尝试")
+        else:
+            logger.warning(f"[events] eth_getLogs 失败（区块 {start}-{end}）")
+        return None
+
+    def fetch(self, start, end):
+        """获取 [start, end] 的事件，按 (区块, 交易序号, 日志序号) 排序"""
+        events = []
+        block_times = {}
+        wallet_txs = {}  # tx_hash -> to 地址
+        if self.kinds & set(RECORD_KINDS):
+            numbers = range(start, end + 1)
+            blocks = self._many('eth_getBlockByNumber', [[hex(number), True] for number in numbers])
+            for number, block in zip(numbers, blocks):
+                if not block:
+                    raise FetchError(f'block {number} unavailable')
+                block_times[number] = _int(block['timestamp'])
+                if self.headers is not None:
+                    self.headers.remember(block)
+                for tx in block.get('transactions') or []:
+                    if (tx.get('from') or '').lower() != self.wallet:
+                        continue
+                    wallet_txs[tx['hash'].lower()] = (tx.get('to') or '').lower()
+                    if 'dividend' in self.kinds:
+                        dividend = decode_dividend(tx, self.contract)
+                        if dividend:
+                            events.append(dict(dividend, block=number))
+        elif self.headers is not None:
+            block_times = self.headers.timestamps(range(start, end + 1))  # 只查缓存
+
+        logs = self._logs(start, end) if self.kinds & {'buyback', 'burn', 'transfer'} else []
+        if logs is None and 'transfer' in self.kinds:
+            raise LogsUnavailable(f'eth_getLogs unavailable for blocks {start}-{end}')
+        if logs is None:
+            tx_hashes = list(wallet_txs)
+            receipts = self._many('eth_getTransactionReceipt', [[tx_hash] for tx_hash in tx_hashes])
+            for tx_hash, receipt in zip(tx_hashes, receipts):
+                if not receipt:
+                    raise FetchError(f'receipt {tx_hash} unavailable')
+            logs = [log for receipt in receipts for log in receipt.get('logs') or []
+                    if (log.get('address') or '').lower() == self.contract]
+        classified = set()
+        for log in logs:
+            transfer = decode_transfer(log)
+            if transfer is None:
+                continue
+            if 'transfer' in self.kinds:
+                events.append(transfer)
+            tx_hash = transfer['tx_hash'].lower()
+            if tx_hash in classified:
+                continue  # 每笔钱包交易只取第一条匹配的 Transfer
+            event = classify_transfer(transfer, wallet_txs.get(tx_hash), self.wallet, self.contract)
+            if event and event['kind'] in self.kinds:
+                classified.add(tx_hash)
+                events.append(event)
+
+        for event in events:
+            if event['block'] in block_times:
+                event['block_time'] = block_times[event['block']]
+        events.sort(key=lambda e: (e['block'], e['tx_index'], e['log_index']))
+        return events
+
+
+def iter_events(rpc, from_block, to_block, wallet, contract, kinds=ALL_KINDS, batch=None,
+                chunk_blocks=DEFAULT_CHUNK_BLOCKS, prefetch=DEFAULT_PREFETCH, headers=None):
+    """逐条产出 [from_block, to_block] 内的事件，每段结束后产出 checkpoint
+
+    Args:
+        kinds: 需要的事件类型（ALL_KINDS 的子集）；只要 transfer 时不获取区块
+        prefetch: 后台预取的段数（有界队列），0 表示在消费者线程中按需获取
+        headers: 可选的 BlockHeaderCache，扫描到的区块顺便记下
+    """
+    fetcher = _ChunkFetcher(rpc, batch, wallet, contract, kinds, headers)
+    chunks = [(start, min(start + chunk_blocks - 1, to_block))
+              for start in range(from_block, to_block + 1, chunk_blocks)]
+    if prefetch <= 0:
+        for start, end in chunks:
+            yield from fetcher.fetch(start, end)
+            yield {'kind': 'checkpoint', 'block': end}
+        return
+
+    results = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for start, end in chunks:
+                if not put((end, fetcher.fetch(start, end), None)):
+                    return
+        except Exception as e:
+            put((None, None, e))
+            return
+        put((None, None, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            end, events, error = results.get()
+            if error is not None:
+                raise error
+            if end is None:
+                return
+            yield from events
+            yield {'kind': 'checkpoint', 'block': end}
+    finally:
+        stop.set()  # 消费者提前结束（break / close）时停止获取
+
+
+# ---------- 消费 ----------
+
+def pump(events, sinks, checkpoint=None):
+    """把事件流写入多个 sink，返回写入的事件数
+
+    sink 可以是带 write(event) / flush(block) 的对象，也可以是只接收事件的函数。
+    checkpoint: 可选的 save(block) 对象，所有 sink flush 之后调用。
+    """
+    count = 0
+    for event in events:
+        if event['kind'] == 'checkpoint':
+            for sink in sinks:
+                flush = getattr(sink, 'flush', None)
+                if flush:
+                    flush(event['block'])
+            if checkpoint is not None:
+                checkpoint.save(event['block'])
+            continue
+        count += 1
+        for sink in sinks:
+            write = getattr(sink, 'write', sink)
+            write(event)
+    return count
+
+
+class FileCheckpoint:
+    """把已处理到的区块号写入 JSON 文件"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self, default=0):
+        try:
+            with open(self.path) as f:
+                return json.load(f)['last_block']
+        except (OSError, ValueError, KeyError):
+            return default
+
+    def save(self, block):
+        tmp = self.path.with_name('.' + self.path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'last_block': block}, f)
+        os.replace(tmp, self.path)
+
+
+class NdjsonSink:
+    """每个事件一行追加到 NDJSON 文件"""
+
+    def __init__(self, path, kinds=ALL_KINDS):
+        self.path = Path(path)
+        self.kinds = set(kinds)
+        self._lines = []
+
+    def write(self, event):
+        if event['kind'] in self.kinds:
+            self._lines.append(json.dumps(event) + '\n')
+
+    def flush(self, block):
+        if self._lines:
+            with open(self.path, 'a') as f:
+                f.writelines(self._lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._lines = []
+
+
+class StateSink:
+    """写入 state 字典（state.json / records.json 格式：最近记录在前，按 tx_hash 去重）
+
+    on_flush(state) 在每段结束时调用（此时 state['last_block'] 已更新），由调用方落盘。
+    """
+
+    def __init__(self, state, on_flush=None, keep=50):
+        self.state = state
+        self.on_flush = on_flush
+        self.keep = keep
+        self._seen = {r['tx_hash'] for key in ('buyback', 'dividend') for r in state.get(key, [])}
+
+    def write(self, event):
+        if event['kind'] not in RECORD_KINDS or event['tx_hash'] in self._seen:
+            return
+        record_type, record = to_record(event)
+        self.state[record_type].insert(0, record)
+        self._seen.add(event['tx_hash'])
+
+    def flush(self, block):
+        self.state['last_block'] = block
+        for key in ('buyback', 'dividend'):
+            self.state[key] = self.state[key][:self.keep]
+        if self.on_flush:
+            self.on_flush(self.state)
+
+
+class StoreSink:
+    """写入 records_store 记录库（每段批量写入一次）"""
+
+    def __init__(self, store):
+        self.store = store
+        self._pending = {'dividend': [], 'buyback': []}
+
+    def write(self, event):
+        if event['kind'] in RECORD_KINDS:
+            record_type, record = to_record(event)
+            self._pending[record_type].append(record)
+
+    def flush(self, block):
+        for record_type, records in self._pending.items():
+            if records:
+                self.store.add_many(record_type, records)
+                records.clear()
+
+
+class HolderIndexSink:
+    """由 transfer 事件维护的持仓地址索引（JSON 文件）
+
+    只统计扫描开始之后的净流入，不是准确余额：用作持仓候选地址，实际余额仍按链上查询。
+    """
+
+    def __init__(self, path, ignore=()):
+        self.path = Path(path)
+        self.ignore = {address.lower() for address in ignore} | {DEAD_ADDRESS, '0x' + '0' * 40}
+        self.flows = {}
+        self.last_block = 0
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.flows = {address: int(value) for address, value in data['flows'].items()}
+            self.last_block = data['last_block']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def write(self, event):
+        if event['kind'] != 'transfer' or event['block'] <= self.last_block:
+            return  # 重放的区块（从 checkpoint 之前重新开始）不重复计入
+        value = event['value']
+        self.flows[event['from']] = self.flows.get(event['from'], 0) - value
+        self.flows[event['to']] = self.flows.get(event['to'], 0) + value
+
+    def flush(self, block):
+        self.last_block = max(self.last_block, block)
+        tmp = self.path.with_name('.' + self.path.name + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'last_block': self.last_block,
+                       'flows': {address: str(value) for address, value in self.flows.items() if value}}, f)
+        os.replace(tmp, self.path)
+
+    def top(self, n):
+        return top_holder_candidates(self.flows, n, self.ignore)
+
+
+def top_holder_candidates(flows, n, ignore=()):
+    """净流入最多的 n 个地址"""
+    ranked = sorted((value, address) for address, value in flows.items() if value > 0 and address not in ignore)
+    return [address for _, address in reversed(ranked[-n:])] if n else []
+
+
+def load_holder_candidates(path, n, ignore=()):
+    """读取 HolderIndexSink 写出的索引文件，返回净流入最多的 n 个地址（文件不存在时为空）"""
+    try:
+        with open(path) as f:
+            flows = {address: int(value) for address, value in json.load(f)['flows'].items()}
+    except (OSError, ValueError, KeyError):
+        return []
+    return top_holder_candidates(flows, n, {address.lower() for address in ignore} | {DEAD_ADDRESS})
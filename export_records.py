@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+导出完整分红/回购历史（直接读取 records.db，不经过 API 服务）
+
+用法：
+    python3 export_records.py --format csv --output records.csv
+    python3 export_records.py --from-block 45000000 --to-block 45100000
+    python3 export_records.py --cursor 45012345-881 >> records.ndjson   # 续传
+    python3 export_records.py --format csv --cursor 45012345-881 >> records.csv   # CSV 续传不重复输出表头
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import records_store
+
+BASE_DIR = Path(__file__).parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description='导出分红/回购历史（NDJSON / CSV）')
+    parser.add_argument('--db', default=str(BASE_DIR / 'records.db'), help='记录库路径')
+    parser.add_argument('--format', choices=records_store.EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--type', choices=records_store.RECORD_TYPES, help='只导出某类记录')
+    parser.add_argument('--address', help='只导出某地址的分红')
+    parser.add_argument('--from-block', type=int)
+    parser.add_argument('--to-block', type=int)
+    parser.add_argument('--cursor', help='从该 cursor 之后继续导出')
+    parser.add_argument('--output', help='输出文件（默认标准输出；指定 --cursor 时追加）')
+    args = parser.parse_args()
+
+    store = records_store.open_store(
+        args.db, backfill_files=(BASE_DIR / 'records.json', BASE_DIR / 'state.json')
+    )
+    lines = records_store.export_lines(
+        store, args.format, cursor=args.cursor,
+        record_type=args.type, address=args.address,
+        from_block=args.from_block, to_block=args.to_block,
+    )
+    # 续传时追加到已导出的文件后面（不覆盖之前的记录）
+    mode = 'a' if args.cursor else 'w'
+    out = open(args.output, mode, newline='') if args.output else sys.stdout
+    count = 0
+    try:
+        for line in lines:
+            out.write(line)
+            count += 1
+    finally:
+        if args.output:
+            out.close()
+    if args.format == 'csv' and not args.cursor:
+        count -= 1  # 表头（续传时不输出）
+    print(f"导出 {max(count, 0)} 条记录", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
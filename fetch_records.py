@@ -4,10 +4,20 @@ import time
 import requests
 from pathlib import Path
 
+import chain_events
+import records_store
+from block_headers import BlockHeaderCache
+import snapshot
+from rpc_metrics import RpcAccounting, endpoint_label
+import rate_limit
+from rate_limit import backoff_delay
+
 BASE_DIR = Path(__file__).parent
 CONFIG_FILE = BASE_DIR / 'config.json'
 OUTPUT_FILE = BASE_DIR / 'records.json'
 STATE_FILE = BASE_DIR / 'state.json'
+RECORDS_DB = BASE_DIR / 'records.db'
+HOLDER_INDEX_FILE = BASE_DIR / 'holder_index.json'  # api_server 从这里补充持仓候选地址
 
 # 从配置文件读取地址，如果不存在则使用默认值
 def load_addresses():
@@ -29,24 +39,123 @@ def load_addresses():
     )
 
 WALLET_ADDRESS, CONTRACT_ADDRESS = load_addresses()
-DEAD_ADDRESS = '0x000000000000000000000000000000000000dead'
-TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+SCAN_CHUNK_BLOCKS = 20  # 每段区块数：一次批量请求的区块数量，也是保存进度的间隔
+logs_failures = 0             # 持仓索引扫描时 eth_getLogs 连续失败的次数
+holder_index_paused = False   # 连续失败后本进程不再更新持仓索引
 
 RPC_URL = 'https://bsc-dataseed.binance.org/'
 
+rpc_accounting = RpcAccounting()  # 按扫描批次统计 RPC 调用
+
+RPC_MAX_RETRIES = 4  # 被节点限流时的重试次数
+rpc_limiter = rate_limit.get_limiter(endpoint_label(RPC_URL))
+
 def rpc_call(method, params):
-    try:
-        response = requests.post(RPC_URL, json={
-            'jsonrpc': '2.0',
-            'method': method,
-            'params': params,
-            'id': 1
-        }, timeout=15)
-        result = response.json()
+    """JSON-RPC 调用：经过令牌桶限流，被限流（429 / -32005）时退避重试，其它错误返回 None"""
+    for attempt in range(RPC_MAX_RETRIES + 1):
+        rpc_limiter.acquire()
+        rpc_accounting.record(method, endpoint_label(RPC_URL))
+        try:
+            response = requests.post(RPC_URL, json={
+                'jsonrpc': '2.0',
+                'method': method,
+                'params': params,
+                'id': 1
+            }, timeout=15)
+            if response.status_code == 429:
+                response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            if attempt < RPC_MAX_RETRIES and rate_limit.is_throttle_error(e):
+                rpc_limiter.throttled(rate_limit.retry_after_seconds(e) or backoff_delay(attempt, base=1.0))
+                print(f"RPC throttled ({method}), rate -> {rpc_limiter.rate:.1f}/s")
+                continue
+            print(f"RPC error: {e}")
+            return None
+        error = result.get('error')
+        if error and attempt < RPC_MAX_RETRIES and rate_limit.is_throttle_error(error):
+            rpc_limiter.throttled(backoff_delay(attempt, base=1.0))
+            print(f"RPC throttled ({method}), rate -> {rpc_limiter.rate:.1f}/s")
+            continue
+        if error:
+            print(f"RPC error: {error}")
+        else:
+            rpc_limiter.succeeded()
         return result.get('result')
-    except Exception as e:
-        print(f"RPC error: {e}")
-        return None
+    return None
+
+class RpcError(Exception):
+    """批量 RPC 失败（重试后仍被限流，或节点返回错误）"""
+
+def rpc_batch(method, params_list):
+    """批量 JSON-RPC 调用（一次 HTTP 请求），返回与 params_list 对应的结果
+
+    与 rpc_call 相同经过令牌桶限流：整个请求或其中任一条被限流（429 / -32005）时退避，
+    只重试没有拿到结果的条目。重试后仍失败或节点返回其它错误时抛出 RpcError，
+    不返回 None 冒充"没有数据"（扫描会据此跳过区块）。节点明确返回 null 的条目保留为 None。
+    """
+    results = [None] * len(params_list)
+    pending = list(range(len(params_list)))
+    for attempt in range(RPC_MAX_RETRIES + 1):
+        if not pending:
+            break
+        for _ in pending:
+            rpc_limiter.acquire()
+            rpc_accounting.record(method, endpoint_label(RPC_URL))
+        try:
+            response = requests.post(RPC_URL, json=[
+                {'jsonrpc': '2.0', 'method': method, 'params': params_list[i], 'id': i}
+                for i in pending
+            ], timeout=30)
+            response.raise_for_status()
+            replies = response.json()
+            if not isinstance(replies, list):
+                # 整个批次被拒绝时节点返回单个错误对象
+                raise RpcError(replies.get('error') if isinstance(replies, dict) else replies)
+        except Exception as e:
+            error = e.args[0] if isinstance(e, RpcError) and e.args else e
+            if attempt < RPC_MAX_RETRIES and rate_limit.is_throttle_error(error):
+                rpc_limiter.throttled(rate_limit.retry_after_seconds(e) or backoff_delay(attempt, base=1.0))
+                print(f"RPC batch throttled ({method}), rate -> {rpc_limiter.rate:.1f}/s")
+                continue
+            raise RpcError(f'{method} batch failed: {error}') from e
+        
+        by_id = {reply.get('id'): reply for reply in replies if isinstance(reply, dict)}
+        retry, throttled = [], False
+        for i in pending:
+            reply = by_id.get(i)
+            if reply is None:
+                retry.append(i)  # 节点漏掉的条目
+            elif not reply.get('error'):
+                results[i] = reply.get('result')
+            elif rate_limit.is_throttle_error(reply['error']):
+                throttled = True
+                retry.append(i)
+            else:
+                raise RpcError(f"{method} {params_list[i]}: {reply['error']}")
+        if throttled:
+            rpc_limiter.throttled(backoff_delay(attempt, base=1.0))
+            print(f"RPC batch throttled ({method}), {len(retry)} retrying, rate -> {rpc_limiter.rate:.1f}/s")
+        elif not retry:
+            rpc_limiter.succeeded()
+        pending = retry
+    if pending:
+        raise RpcError(f'{method} batch: {len(pending)} requests still failing after {RPC_MAX_RETRIES} retries')
+    return results
+
+def fetch_block_headers(numbers):
+    """批量获取区块头（不含交易详情）"""
+    return rpc_batch('eth_getBlockByNumber', [[hex(number), False] for number in numbers])
+
+def fill_block_times(store, headers, state, limit=200):
+    """给记录库中缺少链上时间的记录补上 block_time（新区块优先，每次最多 limit 个区块）"""
+    blocks = store.blocks_missing_time(limit)
+    if blocks:
+        times = headers.timestamps(blocks, fetch_block_headers)
+        store.set_block_times(times)
+        print(f"  Block times filled: {len(times)}/{len(blocks)} blocks")
+    for record_type in ('buyback', 'dividend'):
+        headers.enrich(state[record_type])
 
 def load_state():
     try:
@@ -68,131 +177,68 @@ def save_output(state):
         'updated': int(time.time()),
         'last_block': state['last_block']
     }
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(output, f)
+    snapshot.publish(OUTPUT_FILE, output)
 
 def get_latest_block():
     result = rpc_call('eth_blockNumber', [])
     return int(result, 16) if result else 0
 
-def check_tx_for_buyback(tx_hash):
-    """检查交易是否包含回购销毁（Transfer到dead地址）"""
-    receipt = rpc_call('eth_getTransactionReceipt', [tx_hash])
-    if not receipt or not receipt.get('logs'):
-        return None
-    
-    for log in receipt['logs']:
-        # 检查是否是代币合约的Transfer事件
-        if log.get('address', '').lower() != CONTRACT_ADDRESS.lower():
-            continue
-        
-        topics = log.get('topics', [])
-        if len(topics) < 3:
-            continue
-        
-        # 检查是Transfer事件且to是dead地址
-        if topics[0].lower() == TRANSFER_TOPIC.lower():
-            to_addr = '0x' + topics[2][26:].lower()
-            if to_addr == DEAD_ADDRESS:
-                amount = int(log['data'], 16) / 1e18
-                return {
-                    'amount': amount,
-                    'tx_hash': tx_hash,
-                    'block': int(receipt['blockNumber'], 16)
-                }
-    return None
+def save_progress(state):
+    save_state(state)
+    save_output(state)
 
-def check_tx_for_dex_buyback(tx_hash):
-    """检查交易是否通过DEX购买代币（钱包收到代币）"""
-    receipt = rpc_call('eth_getTransactionReceipt', [tx_hash])
-    if not receipt or not receipt.get('logs'):
-        return None
-    
-    for log in receipt['logs']:
-        # 检查是否是代币合约的Transfer事件
-        if log.get('address', '').lower() != CONTRACT_ADDRESS.lower():
-            continue
-        
-        topics = log.get('topics', [])
-        if len(topics) < 3:
-            continue
-        
-        # 检查是Transfer事件且to是钱包地址（钱包收到代币）
-        if topics[0].lower() == TRANSFER_TOPIC.lower():
-            to_addr = '0x' + topics[2][26:].lower()
-            if to_addr == WALLET_ADDRESS.lower():
-                amount = int(log['data'], 16) / 1e18
-                return {
-                    'amount': amount,
-                    'tx_hash': tx_hash,
-                    'block': int(receipt['blockNumber'], 16)
-                }
-    return None
+def scan_blocks(from_block, to_block, state, store=None, headers=None, holder_index=None):
+    """扫描区块，查找钱包发出的分红和回购（同时写入完整历史记录库和持仓索引）
 
-def check_tx_for_dividend(tx):
-    """检查交易是否是分红（BNB转账）"""
-    value = int(tx.get('value', '0'), 16) / 1e18
-    to_addr = tx.get('to', '')
-    
-    # BNB转账 > 0.01，且不是转到合约
-    if value > 0.01 and to_addr and to_addr.lower() != CONTRACT_ADDRESS.lower():
-        # 普通转账（input为空）
-        if tx.get('input', '0x') in ['0x', '']:
-            return {
-                'address': to_addr[:6] + '...' + to_addr[-4:],
-                'full_address': to_addr,
-                'amount': value,
-                'tx_hash': tx['hash'],
-                'block': int(tx.get('blockNumber', '0'), 16)
-            }
-    return None
+    基于 chain_events.iter_events：同一次获取供 state、记录库、持仓索引共用，
+    每段结束后先写记录库和持仓索引，再保存 state（last_block 即扫描进度）。
+    记录的 block_time 直接取自扫描时已获取的区块，不额外请求。
+    """
+    global logs_failures, holder_index_paused
+    if holder_index_paused:
+        holder_index = None
+    kinds = chain_events.ALL_KINDS if holder_index else chain_events.RECORD_KINDS
+    events = chain_events.iter_events(
+        rpc_call, from_block, to_block, WALLET_ADDRESS, CONTRACT_ADDRESS,
+        kinds=kinds, batch=rpc_batch, chunk_blocks=SCAN_CHUNK_BLOCKS, headers=headers
+    )
+    sinks = [print_event]
+    if store:
+        sinks.append(chain_events.StoreSink(store))
+    if holder_index:
+        sinks.append(holder_index)
+    sinks.append(chain_events.StateSink(state, on_flush=save_progress))
+    try:
+        count = chain_events.pump(events, sinks)
+    except chain_events.LogsUnavailable:
+        # 持仓索引需要 eth_getLogs：失败的这段不保存进度，下次重试；
+        # 连续失败（节点不支持）时停止更新持仓索引，不让分红/回购记录一直卡住
+        logs_failures += 1
+        if not holder_index or logs_failures < chain_events.LOGS_MAX_FAILURES:
+            raise
+        holder_index_paused = True
+        print(f"警告: eth_getLogs 连续失败 {logs_failures} 次，本进程停止更新持仓索引 "
+              f"(停在区块 {holder_index.last_block})，只扫描分红/回购记录")
+        return scan_blocks(state['last_block'] + 1, to_block, state, store, headers)
+    logs_failures = 0
+    return count
 
-def scan_blocks(from_block, to_block, state):
-    """扫描区块，查找钱包发出的交易"""
-    for block_num in range(from_block, to_block + 1):
-        block = rpc_call('eth_getBlockByNumber', [hex(block_num), True])
-        if not block or not block.get('transactions'):
-            continue
-        
-        for tx in block['transactions']:
-            # 只检查钱包发出的交易
-            if tx.get('from', '').lower() != WALLET_ADDRESS.lower():
-                continue
-            
-            tx_hash = tx['hash']
-            
-            # 检查是否已记录
-            if any(r['tx_hash'] == tx_hash for r in state['buyback']):
-                continue
-            if any(r['tx_hash'] == tx_hash for r in state['dividend']):
-                continue
-            
-            # 检查是否是回购（调用合约的交易 或 通过DEX购买）
-            to_addr = tx.get('to', '').lower()
-            if to_addr == CONTRACT_ADDRESS.lower():
-                # 直接调用合约的回购（burn到dead地址）
-                buyback = check_tx_for_buyback(tx_hash)
-                if buyback:
-                    state['buyback'].insert(0, buyback)
-                    print(f"New buyback (burn): {buyback['amount']:,.2f} tokens")
-            elif to_addr and to_addr != CONTRACT_ADDRESS.lower():
-                # 通过DEX购买代币的回购
-                buyback = check_tx_for_dex_buyback(tx_hash)
-                if buyback:
-                    state['buyback'].insert(0, buyback)
-                    print(f"New buyback (DEX): {buyback['amount']:,.2f} tokens")
-            
-            # 检查是否是分红
-            dividend = check_tx_for_dividend(tx)
-            if dividend:
-                state['dividend'].insert(0, dividend)
-                print(f"New dividend: {dividend['amount']:.4f} BNB to {dividend['address']}")
+def print_event(event):
+    if event['kind'] == 'burn':
+        print(f"New buyback (burn): {event['value'] / 1e18:,.2f} tokens")
+    elif event['kind'] == 'buyback':
+        print(f"New buyback (DEX): {event['value'] / 1e18:,.2f} tokens")
+    elif event['kind'] == 'dividend':
+        print(f"New dividend: {event['value'] / 1e18:.4f} BNB to {event['to'][:6]}...{event['to'][-4:]}")
 
 def main():
     print('Starting auto-monitor...')
     print(f'钱包地址: {WALLET_ADDRESS}')
     print(f'合约地址: {CONTRACT_ADDRESS}')
     state = load_state()
+    store = records_store.open_store(RECORDS_DB, backfill_files=(OUTPUT_FILE, STATE_FILE))
+    headers = BlockHeaderCache(RECORDS_DB)
+    holder_index = chain_events.HolderIndexSink(HOLDER_INDEX_FILE, ignore=(CONTRACT_ADDRESS,))
     
     if state['last_block'] == 0:
         state['last_block'] = get_latest_block()
@@ -215,14 +261,11 @@ def main():
                 to_block = min(to_block, from_block + 200)
                 
                 print(f"Scanning blocks {from_block} to {to_block}...")
-                scan_blocks(from_block, to_block, state)
-                
-                state['last_block'] = to_block
-                state['buyback'] = state['buyback'][:50]
-                state['dividend'] = state['dividend'][:50]
-                
-                save_state(state)
-                save_output(state)
+                rpc_accounting.begin_scope(f'scan {from_block}-{to_block}')
+                scan_blocks(from_block, to_block, state, store, headers, holder_index)
+                fill_block_times(store, headers, state)
+                save_progress(state)
+                print(f"  RPC calls: {rpc_accounting.scope_calls}")
             
             print(f"[{time.strftime('%H:%M:%S')}] Block: {state['last_block']}, Buyback: {len(state['buyback'])}, Dividend: {len(state['dividend'])}")
             
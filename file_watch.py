@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+文件变更监听
+Linux 下使用 inotify（阻塞读取，空闲时零唤醒），其它平台退回到低频 mtime 轮询。
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+# 只关心写完关闭、rename 替换和删除，避免读到写了一半的文件
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+POLL_SECONDS = 5  # 无 inotify 时的轮询间隔
+
+
+def _file_signature(path):
+    """mtime + 大小 + inode，文件被替换或写入时都会变化"""
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+
+class FileWatcher:
+    """监听单个文件，变更时调用 callback()
+
+    监听的是所在目录，所以编辑器"写临时文件再 rename"的保存方式也能捕获。
+    """
+
+    def __init__(self, path, callback):
+        self.path = Path(path)
+        self.callback = callback
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        fd = self._open_inotify()
+        if fd is not None:
+            target = lambda: self._run_inotify(fd)
+            logger.info(f"[watch] inotify 监听: {self.path}")
+        else:
+            target = self._run_polling
+            logger.info(f"[watch] 轮询监听 ({POLL_SECONDS}秒): {self.path}")
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+
+    def _open_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+            if fd < 0:
+                return None
+            wd = libc.inotify_add_watch(fd, str(self.path.parent).encode(), WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _run_inotify(self, fd):
+        name = self.path.name.encode()
+        while True:
+            try:
+                data = os.read(fd, 4096)
+            except OSError as e:
+                logger.warning(f"[watch] inotify 读取失败，改为轮询: {e}")
+                os.close(fd)
+                self._run_polling()
+                return
+            offset, changed = 0, False
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                event_name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if event_name == name:
+                    changed = True
+            if changed:
+                self._notify()
+
+    def _run_polling(self):
+        last = _file_signature(self.path)
+        while True:
+            time.sleep(POLL_SECONDS)
+            current = _file_signature(self.path)
+            if current != last:
+                last = current
+                self._notify()
+
+    def _notify(self):
+        try:
+            self.callback()
+        except Exception as e:
+            logger.error(f"[watch] 回调异常: {e}")
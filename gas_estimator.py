@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+交易 gas limit 估算缓存
+
+按调用形态（方法 + 目标地址）缓存 eth_estimateGas 的结果并乘以安全系数，代替写死的 gas limit：
+  - 写死的值偏小时交易 out of gas revert，白白等待一次回执
+  - 偏大时节点要求钱包预留 gas limit × gas price 的余额，挤占可分配的 BNB
+缓存过期（默认 10 分钟）或同一形态出现疑似 out of gas 的失败后重新估算；估算失败时使用调用方给的默认值。
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MARGIN = 1.2         # 安全系数
+DEFAULT_TTL_SECONDS = 10 * 60
+OUT_OF_GAS_RATIO = 0.95      # 失败交易的 gasUsed 达到 limit 的 95% 视为 out of gas
+
+
+class GasEstimator:
+    def __init__(self, margin=DEFAULT_MARGIN, ttl=DEFAULT_TTL_SECONDS):
+        self.margin = margin
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}  # 形态 -> (gas limit, 估算时间)
+        self._floors = {}   # 形态 -> 发生 out of gas 后的最低 limit
+        self.estimates = 0
+        self.hits = 0
+        self.failures = 0
+
+    def limit(self, web3, shape, tx, fallback, ttl=None):
+        """返回 tx 的 gas limit
+
+        Args:
+            shape: 调用形态，如 ('swapExactInput', portal) / ('native', to)
+            tx: 至少包含 from / to / value / data 中需要的字段
+            fallback: 估算失败时使用的 gas limit
+            ttl: 覆盖默认缓存时间（如普通地址的转账几乎不会变化）
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(shape)
+            if entry is not None and now - entry[1] < (ttl or self.ttl):
+                self.hits += 1
+                return entry[0]
+        params = {key: tx[key] for key in ('from', 'to', 'value', 'data') if key in tx}
+        try:
+            estimated = web3.eth.estimate_gas(params)
+        except Exception as e:
+            with self._lock:
+                self.failures += 1
+            logger.warning(f"[gas] 估算 {shape[0]} 失败，使用默认 {fallback}: {e}")
+            return fallback
+        with self._lock:
+            self.estimates += 1
+            limit = max(int(estimated * self.margin), self._floors.get(shape, 0))
+            self._entries[shape] = (limit, now)
+        return limit
+
+    def cached(self, shape, default):
+        """只读缓存（用于预估本轮需要预留的 gas），没有时返回 default"""
+        with self._lock:
+            entry = self._entries.get(shape)
+        return entry[0] if entry else default
+
+    def largest(self, kind, default):
+        """某类调用（如 'native'）已缓存的最大 limit，没有时返回 default"""
+        with self._lock:
+            limits = [limit for shape, (limit, _) in self._entries.items() if shape[0] == kind]
+        return max(limits + [default])
+
+    def observe(self, shape, receipt, gas_limit):
+        """交易上链后调用：失败且 gas 接近用尽时视为 out of gas，提高下限并重新估算"""
+        if receipt['status'] == 1 or receipt['gasUsed'] < gas_limit * OUT_OF_GAS_RATIO:
+            return
+        with self._lock:
+            self._floors[shape] = int(gas_limit * self.margin)
+            self._entries.pop(shape, None)
+        logger.warning(f"[gas] {shape[0]} 疑似 out of gas (used={receipt['gasUsed']}, limit={gas_limit})，下次重新估算")
+
+    def floor(self, shape):
+        """某形态发生 out of gas 后的最低 limit，没有发生过时返回 0"""
+        with self._lock:
+            return self._floors.get(shape, 0)
+
+    def invalidate(self, shape):
+        with self._lock:
+            self._entries.pop(shape, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'estimates': self.estimates,
+                'hits': self.hits,
+                'failures': self.failures,
+                'limits': {f'{shape[0]}:{shape[1]}': limit for shape, (limit, _) in self._entries.items()},
+            }
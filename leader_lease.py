@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+多实例部署的主节点租约
+
+租约文件放在所有实例都能访问的共享存储上，内容为持有者、到期时间和纪元号（每次换主加一）。
+读写租约时先 flock 同目录下的锁文件，保证同一时刻只有一个实例能续约或抢占。
+
+- 主节点每 ttl/3 秒续约一次；续约失败或被抢占后立即停止认为自己是主节点
+- 本地有效期比租约短（ttl * 2/3，按单调时钟计），主节点卡住时会先于其它实例的抢占时间放弃
+- 备用节点同样每 ttl/3 秒检查一次，租约过期后接管
+到期时间使用墙上时间比较，各主机的时钟偏差必须远小于 ttl。
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # 非 Unix 平台无法跨主机互斥，不支持多实例部署
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 15
+
+
+class LeaderLease:
+    def __init__(self, path, ttl=DEFAULT_TTL_SECONDS, owner=None):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.epoch = 0
+        self._valid_until = 0.0  # 单调时钟，超过后不再认为自己是主节点
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+    @property
+    def held(self):
+        return time.monotonic() < self._valid_until
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, lease):
+        tmp = self.path.with_name(f'.{self.path.name}.{self.owner.replace(":", "_")}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(lease, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def try_acquire(self):
+        """续约或在租约过期时抢占，返回是否持有租约"""
+        started = time.monotonic()
+        lock_path = self.path.with_name('.' + self.path.name + '.lock')
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            lease = self._read()
+            if lease and lease['owner'] != self.owner and lease['expires_at'] > now:
+                with self._lock:
+                    self._valid_until = 0.0
+                    self.epoch = lease.get('epoch', 0)
+                return False
+            epoch = lease.get('epoch', 0) if lease else 0
+            if not lease or lease['owner'] != self.owner:
+                epoch += 1
+                logger.info(f"[lease] {self.owner} 成为主节点 (epoch={epoch})")
+            self._write({'owner': self.owner, 'epoch': epoch, 'expires_at': now + self.ttl, 'renewed_at': now})
+            with self._lock:
+                self.epoch = epoch
+                self._valid_until = started + self.ttl * 2 / 3
+            return True
+        finally:
+            os.close(fd)
+
+    def release(self):
+        """主动让出（正常退出时调用，备用节点无需等租约过期）"""
+        lock_path = self.path.with_name('.' + self.path.name + '.lock')
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            lease = self._read()
+            if lease and lease['owner'] == self.owner:
+                lease['expires_at'] = 0
+                self._write(lease)
+        finally:
+            os.close(fd)
+            self._valid_until = 0.0
+
+    def subscribe(self, callback):
+        """主节点身份变化时调用 callback(held)"""
+        self._listeners.append(callback)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        was_held = False
+        while not self._stop.is_set():
+            try:
+                self.try_acquire()
+            except OSError as e:
+                logger.warning(f"[lease] 读写租约失败: {e}")
+            held = self.held
+            if held != was_held:
+                if not held:
+                    logger.warning(f"[lease] {self.owner} 失去主节点身份")
+                for callback in list(self._listeners):
+                    try:
+                        callback(held)
+                    except Exception as e:
+                        logger.error(f"[lease] 回调异常: {e}")
+                was_held = held
+            self._stop.wait(self.ttl / 3)
+
+    def to_dict(self):
+        lease = self._read() or {}
+        return {
+            'owner': self.owner,
+            'held': self.held,
+            'epoch': self.epoch,
+            'leader': lease.get('owner'),
+            'expires_in': round(lease.get('expires_at', 0) - time.time(), 1) if lease else None,
+        }
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+看板 API 压力测试（模拟 N 个浏览器标签页）
+
+每个客户端按 index.html 的请求方式访问：
+  /                  打开页面时一次
+  /api/progress      长轮询（?since=版本&wait=20）；--progress-mode poll 改为每 500 ms 普通轮询
+  /api/status        每 2 秒
+  /api/balance       每 10 秒
+  /records.json      每 30 秒（带 If-None-Match，与浏览器 cache: 'no-cache' 相同）
+  /api/holders       每 60 秒（首次全量，之后 ?since=版本 增量）
+各客户端的起始时间在一个周期内随机错开。
+
+默认在进程内启动 --dry-run 模拟环境并不断执行分红轮次，使 update_progress 保持活跃，
+结果按"执行中 / 空闲"分别统计；--url 则压测已有的服务器（如 gunicorn + wsgi.py）。
+输出每个接口的吞吐、p50/p99 延迟和错误率。
+
+用法：
+    python3 loadtest.py --clients 50 --duration 30
+    python3 loadtest.py --clients 200 --progress-mode poll --json
+    python3 loadtest.py --url http://127.0.0.1:5000 --clients 100
+"""
+import argparse
+import heapq
+import http.client
+import json
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+LONG_POLL_WAIT_SECONDS = 20
+POLL_SCHEDULE = [  # (接口名, 间隔秒数)
+    ('status', 2),
+    ('balance', 10),
+    ('records', 30),
+    ('holders', 60),
+]
+PROGRESS_POLL_SECONDS = 0.5
+ERROR_BACKOFF_SECONDS = 2  # 与 index.html 出错后的重连等待相同
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Recorder:
+    """按 (接口, 阶段) 汇总延迟和错误"""
+
+    def __init__(self, round_active=None):
+        self.round_active = round_active
+        self._lock = threading.Lock()
+        self.samples = {}  # (接口, 阶段) -> [延迟秒数]
+        self.errors = {}
+
+    def phase(self):
+        if self.round_active is None:
+            return 'all'
+        return 'round' if self.round_active.is_set() else 'idle'
+
+    def record(self, endpoint, phase, latency, ok):
+        with self._lock:
+            self.samples.setdefault((endpoint, phase), []).append(latency)
+            if not ok:
+                self.errors[(endpoint, phase)] = self.errors.get((endpoint, phase), 0) + 1
+
+    def summary(self, duration):
+        rows = []
+        with self._lock:
+            keys = sorted(self.samples)
+            for endpoint, phase in keys:
+                latencies = self.samples[(endpoint, phase)]
+                errors = self.errors.get((endpoint, phase), 0)
+                rows.append({
+                    'endpoint': endpoint,
+                    'phase': phase,
+                    'requests': len(latencies),
+                    'rps': len(latencies) / duration if duration else 0,
+                    'p50_ms': percentile(latencies, 0.50) * 1000,
+                    'p99_ms': percentile(latencies, 0.99) * 1000,
+                    'error_rate': errors / len(latencies),
+                })
+        return rows
+
+
+class Client:
+    """一个浏览器标签页：长轮询进度一个连接，其余定时请求一个连接（浏览器同样并发）"""
+
+    def __init__(self, host, port, recorder, stop, progress_mode):
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.stop = stop
+        self.progress_mode = progress_mode
+        self.progress_version = None
+        self.holders_version = None
+        self.records_etag = None
+
+    def _request(self, conn, endpoint, path, headers=None):
+        phase = self.recorder.phase()
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers or {})
+            response = conn.getresponse()
+            body = response.read()
+            ok = response.status in (200, 304)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            response, body, ok = None, b'', False
+        self.recorder.record(endpoint, phase, time.perf_counter() - start, ok)
+        return response if ok else None, body
+
+    def _json(self, body):
+        try:
+            return json.loads(body)
+        except ValueError:
+            return {}
+
+    def progress_loop(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=LONG_POLL_WAIT_SECONDS + 10)
+        while not self.stop.is_set():
+            if self.progress_version is None:
+                path = '/api/progress'
+            elif self.progress_mode == 'longpoll':
+                path = f'/api/progress?since={self.progress_version}&wait={LONG_POLL_WAIT_SECONDS}'
+            else:
+                path = f'/api/progress?since={self.progress_version}'
+            response, body = self._request(conn, 'progress', path)
+            if response is None:
+                self.stop.wait(ERROR_BACKOFF_SECONDS)
+                continue
+            self.progress_version = self._json(body).get('version', self.progress_version)
+            if self.progress_mode == 'poll':
+                self.stop.wait(PROGRESS_POLL_SECONDS)
+        conn.close()
+
+    def poll_loop(self):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        self._request(conn, 'index', '/', {'Accept-Encoding': 'gzip'})
+        now = time.monotonic()
+        due = [(now + random.uniform(0, interval), name, interval) for name, interval in POLL_SCHEDULE]
+        heapq.heapify(due)
+        while not self.stop.is_set():
+            at, name, interval = heapq.heappop(due)
+            if self.stop.wait(max(0.0, at - time.monotonic())):
+                break
+            getattr(self, 'fetch_' + name)(conn)
+            heapq.heappush(due, (at + interval, name, interval))
+        conn.close()
+
+    def fetch_status(self, conn):
+        self._request(conn, 'status', '/api/status')
+
+    def fetch_balance(self, conn):
+        self._request(conn, 'balance', '/api/balance')
+
+    def fetch_records(self, conn):
+        headers = {'Accept-Encoding': 'gzip'}
+        if self.records_etag:
+            headers['If-None-Match'] = self.records_etag
+        response, _ = self._request(conn, 'records', '/records.json', headers)
+        if response is not None and response.getheader('ETag'):
+            self.records_etag = response.getheader('ETag')
+
+    def fetch_holders(self, conn):
+        path = '/api/holders' if self.holders_version is None else f'/api/holders?since={self.holders_version}'
+        response, body = self._request(conn, 'holders', path)
+        if response is not None:
+            self.holders_version = self._json(body).get('version', self.holders_version)
+
+
+def start_local_server(holders, block_time, round_gap, round_active, stop):
+    """进程内模拟环境：Flask 服务器 + 连续执行分红轮次，返回端口"""
+    from werkzeug.serving import make_server
+
+    import api_server
+    import sim_chain
+
+    chain = sim_chain.install(api_server, holders=holders, block_time=block_time)
+    api_server.init_mode = False
+    api_server.holders_cache.refresh()
+    api_server.save_records(api_server.load_state())
+    api_server.assets.warm()
+    server = make_server('127.0.0.1', 0, api_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def rounds():
+        config = api_server.load_config()
+        while not stop.is_set():
+            chain.fund(config['wallet_address'], 1.0)
+            round_active.set()
+            try:
+                api_server.execute_lottery()
+            finally:
+                round_active.clear()
+            api_server.holders_cache.refresh()
+            stop.wait(round_gap)
+        server.shutdown()
+
+    threading.Thread(target=rounds, daemon=True).start()
+    return server.server_port
+
+
+def run(clients, duration, progress_mode, url=None, holders=60, block_time=0.25, round_gap=2.0, ramp=1.0):
+    stop = threading.Event()
+    if url:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        recorder = Recorder()
+    else:
+        round_active = threading.Event()
+        host = '127.0.0.1'
+        port = start_local_server(holders, block_time, round_gap, round_active, stop)
+        recorder = Recorder(round_active)
+
+    threads = []
+    for index in range(clients):
+        client = Client(host, port, recorder, stop, progress_mode)
+        for target in (client.progress_loop, client.poll_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            threads.append(thread)
+        time.sleep(ramp / clients)
+    start = time.perf_counter()
+    stop.wait(duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    for thread in threads:
+        thread.join(timeout=LONG_POLL_WAIT_SECONDS + 10)
+    return {
+        'clients': clients,
+        'duration': elapsed,
+        'progress_mode': progress_mode,
+        'endpoints': recorder.summary(elapsed),
+    }
+
+
+def print_report(result):
+    print(f"客户端: {result['clients']}, 时长: {result['duration']:.1f} 秒, 进度: {result['progress_mode']}")
+    print(f"{'接口':<12}{'阶段':<8}{'请求数':>8}{'req/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}{'错误率':>9}")
+    for row in result['endpoints']:
+        print(f"{row['endpoint']:<12}{row['phase']:<8}{row['requests']:>8}{row['rps']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['error_rate']:>9.2%}")
+    total = sum(row['requests'] for row in result['endpoints'])
+    errors = sum(row['requests'] * row['error_rate'] for row in result['endpoints'])
+    print('-' * 67)
+    print(f"总计: {total} 次请求, {total / result['duration']:.1f} req/s, 错误率 {errors / total if total else 0:.2%}")
+    if result['progress_mode'] == 'longpoll':
+        print("注: progress 长轮询的延迟包含服务端等待新进度的时间")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='看板 API 压力测试')
+    parser.add_argument('--clients', type=int, default=50, help='模拟的浏览器标签页数量')
+    parser.add_argument('--duration', type=float, default=30, help='压测秒数（不含启动）')
+    parser.add_argument('--ramp', type=float, default=1.0, help='在多少秒内依次启动所有客户端')
+    parser.add_argument('--progress-mode', choices=('longpoll', 'poll'), default='longpoll',
+                        help='longpoll: 当前页面的长轮询；poll: 每 500 ms 普通轮询')
+    parser.add_argument('--url', default=None, help='压测已有服务器（默认在进程内启动模拟环境）')
+    parser.add_argument('--holders', type=int, default=60, help='模拟持仓者数量（进程内模式）')
+    parser.add_argument('--block-time', type=float, default=0.25, help='模拟出块间隔秒数（进程内模式）')
+    parser.add_argument('--round-gap', type=float, default=2.0, help='两轮分红之间的空闲秒数（进程内模式）')
+    parser.add_argument('--json', action='store_true', help='输出 JSON 结果')
+    parser.add_argument('--verbose', action='store_true', help='显示 api_server 日志')
+    args = parser.parse_args()
+
+    if not args.verbose:
+        for name in ('api_server', 'buyback_engine', 'werkzeug'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    result = run(args.clients, args.duration, args.progress_mode, url=args.url, holders=args.holders,
+                 block_time=args.block_time, round_gap=args.round_gap, ramp=args.ramp)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_report(result)
+
+
+if __name__ == '__main__':
+    main()
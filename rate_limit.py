@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+RPC 节点限流（每个节点一个令牌桶）
+
+- 请求前 acquire() 取令牌，令牌不足时阻塞等待，避免并发查询把节点打到限流
+- 收到 HTTP 429 / JSON-RPC -32005（limit exceeded）时速率减半，并按 Retry-After 暂停整个节点
+- 连续成功后缓慢回升速率（加性增、乘性减）
+- backoff_delay() 提供带抖动的指数退避，替代固定 sleep
+"""
+import random
+import threading
+import time
+
+DEFAULT_RATE = 25.0     # 初始每秒请求数（公共节点）
+MIN_RATE = 1.0
+MAX_RATE = 50.0
+RATE_INCREASE = 0.05    # 每次成功回升的速率
+THROTTLE_PAUSE = 2.0    # 没有 Retry-After 时的暂停秒数
+THROTTLE_CODES = (-32005, 429)
+THROTTLE_MESSAGES = ('rate limit', 'too many requests', 'request limit')
+
+
+def backoff_delay(attempt, base=2.0, cap=30.0):
+    """第 attempt 次重试前的等待秒数：指数增长，后一半随机抖动，避免多个请求同时重试"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_throttle_error(error):
+    """判断 JSON-RPC error（dict）或异常是否是限流"""
+    if isinstance(error, dict):
+        code = error.get('code')
+        message = str(error.get('message', '')).lower()
+    else:
+        response = getattr(error, 'response', None)
+        code = getattr(response, 'status_code', None)
+        message = str(error).lower()
+    return code in THROTTLE_CODES or any(text in message for text in THROTTLE_MESSAGES)
+
+
+def retry_after_seconds(error):
+    """从 HTTP 429 响应中读取 Retry-After（秒），没有时返回 None"""
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'headers', {}).get('Retry-After') if response is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class EndpointLimiter:
+    """单个节点的自适应令牌桶"""
+
+    def __init__(self, endpoint, rate=DEFAULT_RATE, max_rate=MAX_RATE):
+        self.endpoint = endpoint
+        self.rate = rate
+        self.max_rate = max(rate, max_rate)
+        self.burst = max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled_count = 0
+
+    def acquire(self):
+        """取一个令牌，必要时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+            self.burst = max(1.0, self.rate)
+
+    def throttled(self, retry_after=None):
+        """节点返回限流：速率减半，暂停到 Retry-After 之后"""
+        with self._lock:
+            self.throttled_count += 1
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.burst = max(1.0, self.rate)
+            self._tokens = 0
+            pause = retry_after if retry_after is not None else THROTTLE_PAUSE
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'rate': round(self.rate, 2),
+                'throttled': self.throttled_count,
+                'paused_for': round(max(0.0, self._paused_until - time.monotonic()), 2),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(endpoint, rate=DEFAULT_RATE):
+    """每个节点共享一个限流器"""
+    with _limiters_lock:
+        limiter = _limiters.get(endpoint)
+        if limiter is None:
+            limiter = _limiters[endpoint] = EndpointLimiter(endpoint, rate)
+        return limiter
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {endpoint: limiter.to_dict() for endpoint, limiter in limiters.items()}
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+分红/回购历史记录存储（SQLite）
+records.json 只保留最近几十条给前端展示，这里保存完整历史，
+按区块、时间、地址建索引，支持游标分页、范围过滤和汇总统计。
+api_server.py 和 fetch_records.py 共用（WAL 模式，多进程可同时读写）。
+"""
+import csv
+import io
+import json
+from itertools import islice
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+RECORD_TYPES = ('dividend', 'buyback')
+MAX_PAGE_SIZE = 500
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = ('ndjson', 'csv')
+CSV_FIELDS = ['cursor', 'type', 'block', 'block_time', 'timestamp', 'tx_hash', 'address', 'amount', 'bnb_spent']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    tx_hash TEXT NOT NULL,
+    address TEXT,
+    amount REAL NOT NULL DEFAULT 0,
+    bnb_spent REAL NOT NULL DEFAULT 0,
+    block INTEGER NOT NULL DEFAULT 0,
+    timestamp INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    UNIQUE (type, tx_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_records_type_block ON records (type, block, id);
+CREATE INDEX IF NOT EXISTS idx_records_block ON records (block, id);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON records (timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_address ON records (address, block, id);
+'''
+
+
+class CursorError(ValueError):
+    """无法解析的分页游标"""
+
+
+def encode_cursor(block, record_id):
+    return f'{block}-{record_id}'
+
+
+def decode_cursor(cursor):
+    try:
+        block, record_id = cursor.split('-')
+        return int(block), int(record_id)
+    except (AttributeError, ValueError):
+        raise CursorError(f'invalid cursor: {cursor}')
+
+
+class RecordStore:
+    """记录存储，每个线程使用独立连接"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    # ---------- 写入 ----------
+
+    def add(self, record_type, record):
+        """写入一条记录，tx_hash 重复时忽略。返回是否新增"""
+        return self.add_many(record_type, [record]) > 0
+
+    def add_many(self, record_type, records):
+        """批量写入，返回新增条数"""
+        if record_type not in RECORD_TYPES:
+            raise ValueError(f'unknown record type: {record_type}')
+        rows = []
+        for record in records:
+            if not record.get('tx_hash'):
+                continue
+            address = record.get('full_address') or None
+            rows.append((
+                record_type,
+                record['tx_hash'].lower(),
+                address.lower() if address else None,
+                float(record.get('amount') or 0),
+                float(record.get('bnb_spent') or 0),
+                int(record.get('block') or 0),
+                int(record.get('block_time') or record.get('timestamp') or 0),  # 有链上时间时按链上时间索引
+                json.dumps(record, ensure_ascii=False),
+            ))
+        conn = self._connect()
+        with conn:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO records '
+                '(type, tx_hash, address, amount, bnb_spent, block, timestamp, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            return conn.total_changes - before
+
+    def import_snapshot(self, data):
+        """导入 records.json / state.json 格式的数据（已存在的忽略）"""
+        added = 0
+        for record_type in RECORD_TYPES:
+            added += self.add_many(record_type, data.get(record_type, []))
+        return added
+
+    def set_block_times(self, times):
+        """按 {区块号: 链上时间} 补写记录的 block_time（时间索引同步改为链上时间）"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "UPDATE records SET timestamp = ?, data = json_set(data, '$.block_time', ?) WHERE block = ?",
+                [(timestamp, timestamp, block) for block, timestamp in times.items()]
+            )
+
+    # ---------- 查询 ----------
+
+    @staticmethod
+    def _filters(record_type=None, address=None, from_block=None, to_block=None, since=None, until=None):
+        clauses, params = [], []
+        if record_type:
+            if record_type not in RECORD_TYPES:
+                raise ValueError(f'unknown record type: {record_type}')
+            clauses.append('type = ?')
+            params.append(record_type)
+        if address:
+            clauses.append('address = ?')
+            params.append(address.lower())
+        if from_block is not None:
+            clauses.append('block >= ?')
+            params.append(from_block)
+        if to_block is not None:
+            clauses.append('block <= ?')
+            params.append(to_block)
+        if since is not None:
+            clauses.append('timestamp >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('timestamp <= ?')
+            params.append(until)
+        return clauses, params
+
+    def query(self, limit=50, cursor=None, **filters):
+        """按区块倒序分页查询
+
+        Returns:
+            {'records': [...], 'next_cursor': str 或 None}
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        clauses, params = self._filters(**filters)
+        if cursor:
+            block, record_id = decode_cursor(cursor)
+            clauses.append('(block < ? OR (block = ? AND id < ?))')
+            params.extend([block, block, record_id])
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        rows = self._connect().execute(
+            f'SELECT id, type, block, data FROM records {where} '
+            f'ORDER BY block DESC, id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+
+        records = []
+        for row in rows[:limit]:
+            record = json.loads(row['data'])
+            record['type'] = row['type']
+            records.append(record)
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor(last['block'], last['id'])
+        return {'records': records, 'next_cursor': next_cursor}
+
+    def totals(self, **filters):
+        """汇总统计：分红笔数/BNB 总额、回购笔数/销毁代币总量/花费 BNB"""
+        clauses, params = self._filters(**filters)
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        rows = self._connect().execute(
+            f'SELECT type, COUNT(*) AS count, SUM(amount) AS amount, SUM(bnb_spent) AS bnb_spent, '
+            f'MIN(block) AS first_block, MAX(block) AS last_block '
+            f'FROM records {where} GROUP BY type',
+            params
+        ).fetchall()
+        by_type = {row['type']: row for row in rows}
+        dividend = by_type.get('dividend')
+        buyback = by_type.get('buyback')
+        blocks = [row['first_block'] for row in rows] + [row['last_block'] for row in rows]
+        return {
+            'dividend_count': dividend['count'] if dividend else 0,
+            'bnb_distributed': (dividend['amount'] or 0) if dividend else 0,
+            'buyback_count': buyback['count'] if buyback else 0,
+            'tokens_burned': (buyback['amount'] or 0) if buyback else 0,
+            'bnb_spent_on_buyback': (buyback['bnb_spent'] or 0) if buyback else 0,
+            'first_block': min(blocks) if blocks else None,
+            'last_block': max(blocks) if blocks else None,
+        }
+
+    def iter_records(self, cursor=None, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+        """按区块正序逐批读取全部记录（生成器，内存占用与总量无关）
+
+        使用独立只读连接，每批一次 keyset 查询，不持有长事务。
+        产出 (cursor, type, record)；从某条的 cursor 重新开始即可续传。
+        """
+        clauses, params = self._filters(**filters)
+        after = decode_cursor(cursor) if cursor else None
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            while True:
+                page_clauses, page_params = list(clauses), list(params)
+                if after:
+                    page_clauses.append('(block > ? OR (block = ? AND id > ?))')
+                    page_params.extend([after[0], after[0], after[1]])
+                where = ('WHERE ' + ' AND '.join(page_clauses)) if page_clauses else ''
+                rows = conn.execute(
+                    f'SELECT id, type, block, data FROM records {where} '
+                    f'ORDER BY block ASC, id ASC LIMIT ?',
+                    page_params + [chunk_size]
+                ).fetchall()
+                for row in rows:
+                    yield encode_cursor(row['block'], row['id']), row['type'], json.loads(row['data'])
+                if len(rows) < chunk_size:
+                    return
+                after = (rows[-1]['block'], rows[-1]['id'])
+        finally:
+            conn.close()
+
+    def blocks_missing_time(self, limit=100):
+        """还没有 block_time 的记录所在的区块（新区块优先）"""
+        rows = self._connect().execute(
+            "SELECT DISTINCT block FROM records WHERE block > 0 AND json_extract(data, '$.block_time') IS NULL "
+            "ORDER BY block DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+
+def validate_filters(**filters):
+    """校验查询参数（type 等），不合法时抛出 ValueError"""
+    RecordStore._filters(**filters)
+
+
+def export_lines(store, fmt='ndjson', cursor=None, limit=None, **filters):
+    """把记录导出为 NDJSON / CSV 文本行（生成器）
+
+    每行都带 cursor 字段，中断后用最后一行的 cursor 续传（续传时 CSV 不再输出表头，可直接追加）。
+    limit: 最多导出的记录条数，不提供时导出全部
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'unknown export format: {fmt}')
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore', lineterminator='\n')
+
+        def render(row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            return buffer.getvalue()
+
+        if cursor is None:
+            yield render({field: field for field in CSV_FIELDS})
+        for record_cursor, record_type, record in islice(store.iter_records(cursor=cursor, **filters), limit):
+            yield render(dict(
+                record,
+                cursor=record_cursor,
+                type=record_type,
+                address=record.get('full_address', ''),
+            ))
+    else:
+        for record_cursor, record_type, record in islice(store.iter_records(cursor=cursor, **filters), limit):
+            yield json.dumps(dict(record, cursor=record_cursor, type=record_type), ensure_ascii=False) + '\n'
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(path, backfill_files=()):
+    """获取指定路径的存储（进程内按路径复用）
+
+    首次打开且库为空时，从 backfill_files（records.json / state.json）导入已有记录。
+    """
+    path = Path(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = RecordStore(path)
+            if store.count() == 0:
+                for file in backfill_files:
+                    try:
+                        if Path(file).exists():
+                            with open(file) as f:
+                                store.import_snapshot(json.load(f))
+                    except Exception as e:
+                        logger.warning(f"[records] 导入 {file} 失败: {e}")
+            _stores[path] = store
+        return store
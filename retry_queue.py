@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+失败分红的重试队列（SQLite，与 records.db 同一文件）
+
+每条记录保存收款地址、金额、已尝试过的交易 (hash, nonce)、重试次数和下次重试时间。
+重发前必须先做幂等检查（见 api_server.reconcile_dividend_retries）：
+  - 任一已尝试的交易成功上链 -> 标记为已支付，不再重发
+  - 已尝试的交易既没有回执、nonce 也还没被占用 -> 可能仍在交易池中，推迟
+只有确认之前的交易都不可能再上链时才会重发。
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+RETRY_BASE_SECONDS = 60        # 第一次重试前的等待
+RETRY_MAX_SECONDS = 60 * 60    # 最长退避
+RETRY_MAX_ATTEMPTS = 5         # 超过后标记为 abandoned，需人工处理
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS dividend_retries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL,
+    amount REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at INTEGER NOT NULL DEFAULT 0,
+    sent TEXT NOT NULL DEFAULT '[]',
+    last_error TEXT,
+    paid_tx TEXT,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dividend_retries_status ON dividend_retries (status, next_attempt_at);
+'''
+
+# pending: 等待重试; paid: 已支付（重发成功或发现之前的交易已上链）; abandoned: 超过重试次数
+STATUSES = ('pending', 'paid', 'abandoned')
+
+
+def backoff_seconds(attempts):
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+
+
+class RetryQueue:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row):
+        item = dict(row)
+        item['sent'] = json.loads(item['sent'])
+        return item
+
+    def enqueue(self, address, amount, sent=(), error=None):
+        """登记一笔失败的分红，返回队列 id"""
+        now = int(time.time())
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO dividend_retries (address, amount, attempts, next_attempt_at, sent, last_error, created_at, updated_at) '
+                'VALUES (?, ?, 1, ?, ?, ?, ?, ?)',
+                (address, amount, now + backoff_seconds(1), json.dumps(list(sent)), error, now, now)
+            )
+            return cursor.lastrowid
+
+    def get(self, item_id):
+        row = self._connect().execute('SELECT * FROM dividend_retries WHERE id = ?', (item_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def pending(self):
+        """所有待处理的条目（按创建顺序）"""
+        rows = self._connect().execute(
+            "SELECT * FROM dividend_retries WHERE status = 'pending' ORDER BY id"
+        ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def due(self, now=None):
+        """已到重试时间的条目"""
+        now = now or int(time.time())
+        return [item for item in self.pending() if item['next_attempt_at'] <= now]
+
+    def mark_paid(self, item_id, tx_hash):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE dividend_retries SET status = 'paid', paid_tx = ?, updated_at = ? WHERE id = ?",
+                (tx_hash, int(time.time()), item_id)
+            )
+
+    def defer(self, item_id, seconds, reason=None):
+        """推迟检查（例如之前的交易可能还在交易池中），不计入重试次数"""
+        now = int(time.time())
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'UPDATE dividend_retries SET next_attempt_at = ?, last_error = COALESCE(?, last_error), updated_at = ? WHERE id = ?',
+                (now + seconds, reason, now, item_id)
+            )
+
+    def record_failure(self, item_id, error=None):
+        """重发仍失败：按退避推迟，超过次数则放弃。返回新状态"""
+        item = self.get(item_id)
+        if item is None:
+            return None
+        now = int(time.time())
+        attempts = item['attempts'] + 1
+        status = 'abandoned' if attempts >= RETRY_MAX_ATTEMPTS else 'pending'
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'UPDATE dividend_retries SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? '
+                'WHERE id = ?',
+                (status, attempts, now + backoff_seconds(attempts), error, now, item_id)
+            )
+        return status
+
+    def add_sent(self, item_id, sent):
+        """记录重发时广播的交易 [(hash, nonce), ...]（广播前写入，进程中断后也能做幂等检查）"""
+        item = self.get(item_id)
+        if item is None or not sent:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'UPDATE dividend_retries SET sent = ?, updated_at = ? WHERE id = ?',
+                (json.dumps(item['sent'] + list(sent)), int(time.time()), item_id)
+            )
+
+    def recent(self, limit=50):
+        rows = self._connect().execute(
+            'SELECT * FROM dividend_retries ORDER BY id DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def summary(self):
+        rows = self._connect().execute(
+            'SELECT status, COUNT(*) AS count, SUM(amount) AS amount FROM dividend_retries GROUP BY status'
+        ).fetchall()
+        return {row['status']: {'count': row['count'], 'amount': row['amount'] or 0} for row in rows}
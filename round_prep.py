@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+轮前准备结果（倒计时最后一段时间内生成，见 api_server.prepare_round）
+
+倒计时期间完成本轮所有的慢读取：持仓快照、余额、分配方案、nonce、gas，并签好分红交易。
+倒计时结束时只需校验准备结果仍然有效，然后直接广播。
+以下情况视为失效，本轮按常规流程执行：
+  - 配置变更
+  - 准备结果太旧（倒计时被推迟，例如本轮被跳过后重试）
+  - 钱包余额减少（签好的金额可能超出可用余额），或增加超过 BALANCE_TOLERANCE（分配方案明显偏小）
+  - 分红资格名单（持仓前 N 名）变化
+nonce 在广播时由节点校验：被占用时 send_dividend 按原有流程重新领取。
+回购预留的 nonce（swap_nonce）在回购一笔都没有发出时立即归还，由 NonceAllocator 用自转账补上，
+签好的分红不会卡在空洞后面。
+"""
+import time
+
+BALANCE_TOLERANCE = 0.05   # 余额增加超过 5% 时重新准备
+MAX_AGE_SECONDS = 120      # 超过此时间的准备结果不再使用
+
+
+class PreparedRound:
+    def __init__(self, config_hash, balance, gas_reserve, holders, buyback_amount, dividend_amount, per_person,
+                 start_nonce, swap_nonce, transactions):
+        self.created_at = time.time()
+        self.config_hash = config_hash
+        self.balance = balance
+        self.gas_reserve = gas_reserve
+        self.holders = holders                # 分红名单 [(address, balance), ...]
+        self.buyback_amount = buyback_amount
+        self.dividend_amount = dividend_amount
+        self.per_person = per_person
+        self.start_nonce = start_nonce
+        self.swap_nonce = swap_nonce          # 回购购买预留的 nonce，不回购时为 None
+        self.transactions = transactions      # 与 holders 一一对应：{'address', 'nonce', 'raw', 'hash', 'gas', 'gas_price'}
+
+    @property
+    def next_nonce(self):
+        """签好的交易之后的第一个 nonce（本轮其余交易从这里开始分配）"""
+        return self.start_nonce + len(self.transactions) + (self.swap_nonce is not None)
+
+    def invalid_reason(self, config_hash, balance, holders):
+        """仍然有效时返回 None，否则返回失效原因"""
+        if config_hash != self.config_hash:
+            return '配置已变更'
+        if time.time() - self.created_at > MAX_AGE_SECONDS:
+            return '准备结果已过期'
+        if balance < self.balance:
+            return f'余额减少 ({self.balance:.6f} -> {balance:.6f} BNB)'
+        if balance > self.balance * (1 + BALANCE_TOLERANCE):
+            return f'余额增加超过 {BALANCE_TOLERANCE:.0%} ({self.balance:.6f} -> {balance:.6f} BNB)'
+        if {a.lower() for a, _ in holders} != {a.lower() for a, _ in self.holders}:
+            return '分红名单已变化'
+        return None
+
+    def to_dict(self):
+        return {
+            'age': round(time.time() - self.created_at, 1),
+            'balance': self.balance,
+            'holders': len(self.holders),
+            'per_person': self.per_person,
+            'buyback_amount': self.buyback_amount,
+            'start_nonce': self.start_nonce,
+            'transactions': len(self.transactions),
+        }
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+RPC 调用统计与每轮请求预算
+
+按方法、调用方（仓库内最近的两层函数）、节点统计调用次数，
+并归属到当前统计窗口（api_server 每轮一个窗口，fetch_records 每个扫描批次一个窗口）。
+设置了预算时，非关键路径（如持仓刷新）可先调用 within_budget() 判断是否降级跳过。
+需要单独知道某个操作自身消耗多少次调用时，用 tally() 包住它（不受并发的其它请求影响）。
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+SCOPE_HISTORY_LIMIT = 50
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# 只是转发 RPC 的包装函数，不作为调用方
+IGNORED_CALLERS = {'instrument_provider', 'rpc_call', 'BlockReadCache.read', 'PhaseMeter.wrap'}
+
+# 当前上下文正在计数的 Tally（线程池任务需用 contextvars.copy_context().run 提交才能继承）
+_current_tally = contextvars.ContextVar('rpc_tally', default=None)
+
+
+def endpoint_label(url):
+    """节点标识：只保留 host，避免把带 key 的路径写进统计"""
+    parsed = urlparse(url)
+    return parsed.netloc or url
+
+
+def find_caller(depth=2):
+    """调用栈中最近的仓库内函数（最多两层，如 'get_token_balance<-get_top_holders'）"""
+    names = []
+    frame = sys._getframe(1)
+    while frame is not None and len(names) < depth:
+        code = frame.f_code
+        if os.path.dirname(os.path.abspath(code.co_filename)) == _REPO_DIR and not code.co_filename.endswith('rpc_metrics.py'):
+            name = getattr(code, 'co_qualname', code.co_name).split('.<locals>')[0]
+            if name not in IGNORED_CALLERS and name != '<module>' and (not names or names[-1] != name):
+                names.append(name)
+        frame = frame.f_back
+    return '<-'.join(names) or 'unknown'
+
+
+class Scope:
+    """一个统计窗口（一轮或一个扫描批次）"""
+
+    def __init__(self, name, budget=None):
+        self.name = name
+        self.budget = budget
+        self.started_at = int(time.time())
+        self.ended_at = None
+        self.calls = 0
+        self.by_method = Counter()
+        self.by_caller = Counter()
+        self.degraded = []  # 因预算跳过的操作
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'ended_at': self.ended_at,
+            'calls': self.calls,
+            'budget': self.budget,
+            'by_method': dict(self.by_method.most_common()),
+            'by_caller': dict(self.by_caller.most_common(20)),
+            'degraded': list(self.degraded),
+        }
+
+
+class Tally:
+    """某个操作自身的调用计数"""
+
+    def __init__(self):
+        self.calls = 0
+
+
+class RpcAccounting:
+    def __init__(self, history=SCOPE_HISTORY_LIMIT):
+        self._lock = threading.Lock()
+        self.started_at = int(time.time())
+        self.calls = 0
+        self.by_method = Counter()
+        self.by_caller = Counter()
+        self.by_endpoint = Counter()
+        self._scope = Scope('startup')
+        self._history = deque([self._scope], maxlen=history)
+        self._warned_scope = None
+
+    def record(self, method, endpoint):
+        caller = find_caller()
+        with self._lock:
+            self.calls += 1
+            self.by_method[method] += 1
+            self.by_caller[caller] += 1
+            self.by_endpoint[endpoint] += 1
+            scope = self._scope
+            scope.calls += 1
+            scope.by_method[method] += 1
+            scope.by_caller[caller] += 1
+            tally = _current_tally.get()
+            if tally is not None:
+                tally.calls += 1
+
+    @contextmanager
+    def tally(self):
+        """统计 with 块内（当前上下文）发出的调用次数"""
+        tally = Tally()
+        token = _current_tally.set(tally)
+        try:
+            yield tally
+        finally:
+            _current_tally.reset(token)
+
+    def begin_scope(self, name, budget=None):
+        """开始新的统计窗口（上一个窗口随之结束）"""
+        with self._lock:
+            self._scope.ended_at = int(time.time())
+            self._scope = Scope(name, budget or None)
+            self._history.append(self._scope)
+
+    @property
+    def scope_calls(self):
+        return self._scope.calls
+
+    def within_budget(self, expected_calls=0):
+        """当前窗口剩余预算是否还够 expected_calls 次调用（未设预算时总是 True）"""
+        scope = self._scope
+        return scope.budget is None or scope.calls + expected_calls <= scope.budget
+
+    def over_budget_once(self):
+        """当前窗口首次超出预算时返回 True（用于只告警一次）"""
+        scope = self._scope
+        if scope.budget is None or scope.calls <= scope.budget or self._warned_scope is scope:
+            return False
+        self._warned_scope = scope
+        return True
+
+    def mark_degraded(self, action):
+        with self._lock:
+            self._scope.degraded.append(action)
+
+    def stats(self, scopes=10):
+        with self._lock:
+            recent = [scope.to_dict() for scope in reversed(self._history)][:scopes]
+            return {
+                'since': self.started_at,
+                'calls': self.calls,
+                'by_method': dict(self.by_method.most_common()),
+                'by_caller': dict(self.by_caller.most_common(30)),
+                'by_endpoint': dict(self.by_endpoint.most_common()),
+                'scopes': recent,
+            }
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+调度进程与 Web 进程之间共享的运行状态（SQLite，runtime.db）
+
+调度器（--role scheduler 或 all）把状态、实时进度、每轮耗时、RPC 统计写成键值，
+只读的 Web 进程（--role web 或 wsgi.py 下的多个 worker）按版本号判断是否需要重新读取。
+每个键一行，值为 JSON；写入时版本号加一。
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shared_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+'''
+
+
+class SharedState:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')  # 进度等数据丢失最后几次写入无妨，换取写入速度
+            self._local.conn = conn
+        return conn
+
+    def put(self, key, value):
+        """写入一个键，返回新版本号"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO shared_state (key, value, version, updated_at) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, version = version + 1, '
+                'updated_at = excluded.updated_at',
+                (key, json.dumps(value), time.time())
+            )
+            return conn.execute('SELECT version FROM shared_state WHERE key = ?', (key,)).fetchone()[0]
+
+    def get(self, key, default=None):
+        row = self._connect().execute('SELECT value FROM shared_state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_if_newer(self, key, known_version):
+        """版本号大于 known_version 时返回 (version, value)，否则返回 None"""
+        row = self._connect().execute(
+            'SELECT version, value FROM shared_state WHERE key = ? AND version > ?', (key, known_version)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def updated_at(self, key):
+        row = self._connect().execute('SELECT updated_at FROM shared_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
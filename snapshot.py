@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+JSON 快照原子发布（records.json / holders.json）
+
+写入流程：加文件锁 -> 写带版本号的临时文件并 fsync -> rename 覆盖正式文件 -> 更新 manifest。
+rename 是原子操作，读取方（API、前端直接请求 /records.json）只会看到完整的旧版本或新版本。
+api_server 和 fetch_records 两个进程写同一文件时由 flock 串行化。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # 非 Unix 平台只做进程内互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_local_lock = threading.Lock()
+_subscribers = []
+_read_cache = {}  # path -> (文件签名, 数据)
+
+
+def manifest_path(path):
+    path = Path(path)
+    return path.with_name(path.name + '.manifest')
+
+
+def _lock_path(path):
+    path = Path(path)
+    return path.with_name('.' + path.name + '.lock')
+
+
+class _FileLock:
+    """进程内线程锁 + 跨进程 flock"""
+
+    def __init__(self, path):
+        self.path = _lock_path(path)
+        self._fd = None
+
+    def __enter__(self):
+        _local_lock.acquire()
+        if fcntl is not None:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            except OSError as e:
+                logger.warning(f"[snapshot] 文件锁失败，仅使用进程内锁: {e}")
+                self._close()
+        return self
+
+    def __exit__(self, *exc):
+        self._close()
+        _local_lock.release()
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)  # 关闭即释放 flock
+            self._fd = None
+
+
+def _write_atomic(path, payload, tmp_name):
+    tmp = path.with_name(tmp_name)
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path, data, indent=None):
+    """原子写入小型 JSON 文件（不记录 manifest、不通知订阅者）"""
+    path = Path(path)
+    _write_atomic(path, json.dumps(data, indent=indent).encode(), f'.{path.name}.tmp')
+
+
+def read_manifest(path):
+    """{'version', 'sha256', 'size', 'updated'}，不存在时版本为 0"""
+    try:
+        with open(manifest_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'version': 0, 'sha256': None, 'size': 0, 'updated': 0}
+
+
+def publish(path, data, indent=None):
+    """原子发布一个 JSON 快照，返回新版本号"""
+    path = Path(path)
+    payload = json.dumps(data, indent=indent).encode()
+    with _FileLock(path):
+        version = read_manifest(path).get('version', 0) + 1
+        _write_atomic(path, payload, f'.{path.name}.{version}.tmp')
+        manifest = {
+            'version': version,
+            'sha256': hashlib.sha256(payload).hexdigest(),
+            'size': len(payload),
+            'updated': int(time.time()),
+        }
+        _write_atomic(manifest_path(path), json.dumps(manifest).encode(), f'.{path.name}.manifest.tmp')
+        _fsync_dir(path.parent)
+        _read_cache[path] = (_signature(path), data)
+
+    for callback in list(_subscribers):
+        try:
+            callback(path, version, data)
+        except Exception as e:
+            logger.error(f"[snapshot] 订阅回调异常: {e}")
+    return version
+
+
+def subscribe(callback):
+    """注册进程内发布通知：callback(path, version, data)"""
+    _subscribers.append(callback)
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+
+def read(path, default=None):
+    """读取快照（按文件签名缓存，文件未变化时不重复解析）
+
+    返回的对象在多个调用方之间共享，不要修改。
+    """
+    path = Path(path)
+    signature = _signature(path)
+    if signature is None:
+        return default
+    cached = _read_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path) as f:
+        data = json.load(f)
+    _read_cache[path] = (signature, data)
+    return data
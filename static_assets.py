@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+静态文件服务（index.html / records.json / holders.json）
+
+- 只提供显式登记的文件，目录下的 config.json、state.json 等不会被访问到
+- 文件内容变化后（按 mtime/大小/inode 判断）重新生成 gzip / brotli 压缩版本，之后的请求直接返回缓存
+- 按 Accept-Encoding 选择压缩格式，每种编码一个强 ETag，If-None-Match 命中时返回 304
+brotli 是可选依赖（pip install brotli），未安装时只提供 gzip。
+"""
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MIN_COMPRESS_SIZE = 512  # 太小的文件压缩收益不大
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9       # 11 对上百 KB 的 JSON 太慢，9 的压缩率已经足够接近
+
+CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.json': 'application/json',
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+}
+
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+
+def parse_accept_encoding(header):
+    """{编码: q 值}"""
+    result = {}
+    for part in (header or '').split(','):
+        fields = [field.strip() for field in part.split(';')]
+        coding = fields[0].lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        result[coding] = q
+    return result
+
+
+def choose_encoding(header, available):
+    """按客户端偏好选择压缩格式（相同 q 值时 br 优先），都不接受时返回 'identity'"""
+    accepted = parse_accept_encoding(header)
+    best, best_q = 'identity', 0.0
+    for coding in ('br', 'gzip'):
+        if coding not in available:
+            continue
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def etag_matches(header, etag):
+    """If-None-Match 使用弱比较：忽略 W/ 前缀"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+class _Asset:
+    def __init__(self, name, path_getter, cache_control):
+        self.name = name
+        self.path_getter = path_getter
+        self.cache_control = cache_control
+        self.content_type = CONTENT_TYPES.get(Path(name).suffix, 'application/octet-stream')
+        self.signature = None
+        self.variants = {}  # 编码 -> (内容, ETag)
+
+
+class StaticAssets:
+    def __init__(self):
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, path_getter, cache_control='no-cache'):
+        """登记一个可访问的文件。path_getter 每次返回当前路径（模拟环境会替换路径）"""
+        self._assets[name] = _Asset(name, path_getter, cache_control)
+
+    def _variants(self, asset):
+        """返回文件当前内容的各编码版本，文件变化时重新压缩"""
+        path = asset.path_getter()
+        signature = _signature(path)
+        if signature is None:
+            return None
+        with self._lock:
+            if asset.signature == signature:
+                return asset.variants
+        with open(path, 'rb') as f:
+            body = f.read()
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        variants = {'identity': (body, f'"{digest}"')}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            compressed = gzip.compress(body, GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(body):
+                variants['gzip'] = (compressed, f'"{digest}-gzip"')
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+                if len(compressed) < len(body):
+                    variants['br'] = (compressed, f'"{digest}-br"')
+        with self._lock:
+            asset.signature = signature
+            asset.variants = variants
+        return variants
+
+    def warm(self, name=None):
+        """预先生成压缩版本（启动时、快照发布后调用）"""
+        for asset in ([self._assets[name]] if name else list(self._assets.values())):
+            try:
+                self._variants(asset)
+            except OSError as e:
+                logger.warning(f"[static] 预压缩 {asset.name} 失败: {e}")
+
+    def name_for_path(self, path):
+        """按文件路径反查登记名（快照发布回调用）"""
+        for name, asset in self._assets.items():
+            if Path(asset.path_getter()) == Path(path):
+                return name
+        return None
+
+    def serve(self, name, accept_encoding=None, if_none_match=None):
+        """返回 (状态码, 内容, 响应头)；未登记或文件不存在时返回 None"""
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+        variants = self._variants(asset)
+        if variants is None:
+            return None
+        encoding = choose_encoding(accept_encoding, variants)
+        body, etag = variants[encoding]
+        headers = {
+            'ETag': etag,
+            'Cache-Control': asset.cache_control,
+            'Vary': 'Accept-Encoding',
+            'Content-Type': asset.content_type,
+        }
+        if etag_matches(if_none_match, etag):
+            return 304, b'', headers
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, body, headers
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {encoding: len(body) for encoding, (body, _) in asset.variants.items()}
+                for name, asset in self._assets.items()
+            }
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+每轮执行的阶段计时（轻量 span）
+
+每个 span 记录耗时、期间的 RPC 调用次数和重试次数。
+span 按线程嵌套（线程内用栈记录），RPC / 重试计入当前线程所有未结束的 span 和整轮。
+最近 ROUND_HISTORY_LIMIT 轮保存在内存中，供 /api/rounds/timings 查询。
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+ROUND_HISTORY_LIMIT = 50
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'thread', 'start', 'end', 'rpc_calls', 'retries', 'error')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.thread = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+        self.rpc_calls = 0
+        self.retries = 0
+        self.error = None
+
+    def to_dict(self, round_start):
+        end = self.end if self.end is not None else time.perf_counter()
+        data = {
+            'name': self.name,
+            'offset_ms': round((self.start - round_start) * 1000, 1),
+            'duration_ms': round((end - self.start) * 1000, 1),
+            'rpc_calls': self.rpc_calls,
+            'retries': self.retries,
+            'thread': self.thread,
+        }
+        if self.attrs:
+            data['attrs'] = self.attrs
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class RoundTrace:
+    def __init__(self, round_id):
+        self.round_id = round_id
+        self.started_at = int(time.time())
+        self.start = time.perf_counter()
+        self.end = None
+        self.outcome = None
+        self.spans = []
+        self.rpc_calls = 0
+        self.retries = 0
+        self.first_send = None  # 第一笔交易广播的时间
+
+    def to_dict(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            'round': self.round_id,
+            'started_at': self.started_at,
+            'duration_ms': round((end - self.start) * 1000, 1),
+            'first_send_ms': round((self.first_send - self.start) * 1000, 1) if self.first_send else None,
+            'outcome': self.outcome or 'running',
+            'rpc_calls': self.rpc_calls,
+            'retries': self.retries,
+            'spans': [span.to_dict(self.start) for span in self.spans],
+        }
+
+
+class Tracer:
+    def __init__(self, history=ROUND_HISTORY_LIMIT):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._history = deque(maxlen=history)
+        self._current = None
+        self._next_id = 1
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def begin_round(self):
+        with self._lock:
+            trace = RoundTrace(self._next_id)
+            self._next_id += 1
+            self._current = trace
+            self._history.append(trace)
+        return trace
+
+    def end_round(self, outcome):
+        """结束当前轮（已结束时不做任何事）"""
+        with self._lock:
+            trace = self._current
+            if trace is None:
+                return
+            trace.end = time.perf_counter()
+            trace.outcome = outcome
+            self._current = None
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """记录一个阶段；不在任何一轮内时只执行不记录"""
+        trace = self._current
+        if trace is None:
+            yield None
+            return
+        span = Span(name, attrs)
+        with self._lock:
+            trace.spans.append(span)
+        stack = self._stack()
+        stack.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            stack.pop()
+            span.end = time.perf_counter()
+
+    def record_rpc(self, method=None):
+        trace = self._current
+        if trace is None:
+            return
+        with self._lock:
+            trace.rpc_calls += 1
+            for span in self._stack():
+                span.rpc_calls += 1
+
+    def record_send(self):
+        """记录本轮第一笔交易的广播时间（倒计时结束到开始广播的延迟）"""
+        trace = self._current
+        if trace is not None and trace.first_send is None:
+            trace.first_send = time.perf_counter()
+
+    def record_retry(self):
+        trace = self._current
+        if trace is None:
+            return
+        with self._lock:
+            trace.retries += 1
+            for span in self._stack():
+                span.retries += 1
+
+    def history(self, limit=None):
+        """最近几轮（新的在前），附带按阶段汇总的平均值"""
+        with self._lock:
+            rounds = [trace.to_dict() for trace in reversed(self._history)]
+        if limit:
+            rounds = rounds[:limit]
+        return {'rounds': rounds, 'summary': summarize(rounds)}
+
+
+def summarize(rounds):
+    """按阶段汇总多轮的耗时、RPC 调用数和重试次数"""
+    summary = {}
+    for data in rounds:
+        for span in data['spans']:
+            item = summary.setdefault(span['name'], {'count': 0, 'total_ms': 0.0, 'rpc_calls': 0, 'retries': 0})
+            item['count'] += 1
+            item['total_ms'] += span['duration_ms']
+            item['rpc_calls'] += span['rpc_calls']
+            item['retries'] += span['retries']
+    for item in summary.values():
+        item['total_ms'] = round(item['total_ms'], 1)
+        item['avg_ms'] = round(item['total_ms'] / item['count'], 1)
+        item['per_round_ms'] = round(item['total_ms'] / len(rounds), 1) if rounds else 0
+    return summary
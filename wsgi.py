@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+多进程部署入口：只读 API，可由 gunicorn 等多 worker 服务器加载
+
+调度（分红执行）必须单独运行一个进程，状态通过 runtime.db 共享：
+    python3 api_server.py --role scheduler
+    gunicorn -w 4 -k gthread --threads 32 -b 0.0.0.0:5000 wsgi:app
+
+不要使用默认的 sync worker：/api/progress 长轮询每个请求最多占用 worker 约 20 秒，
+几个页面就会占满所有 worker。使用 gthread（--threads 按同时打开的页面数设置）或 gevent。
+"""
+import api_server
+
+api_server.SERVER_ROLE = 'web'
+app = api_server.app